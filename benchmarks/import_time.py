@@ -0,0 +1,65 @@
+"""
+Benchmark for the import time of PLIX.
+
+Every import statement runs in a fresh interpreter, so the modules are not cached between measurements. Run it from the
+root of the repository::
+
+    python benchmarks/import_time.py --repeat 5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+# statements to measure, each one is run in a new process
+STATEMENTS = {
+    'import plix': 'import plix',
+    'from plix import Config': 'from plix import Config',
+    'from plix import extract_table_kvu': 'from plix import extract_table_kvu',
+    'from plix import Pipeline': 'from plix import Pipeline',
+    'import plix.cli': 'import plix.cli',
+}
+
+TIMING_CODE = """
+import time
+start = time.perf_counter()
+{statement}
+print(time.perf_counter() - start)
+"""
+
+
+def measure(statement, repeat):
+    """
+    Measures the time of an import statement in fresh interpreters.
+
+    :param str statement: the import statement
+    :param int repeat: number of measurements
+
+    :returns: the measured times in seconds
+    :rtype: list
+    """
+    env = dict(os.environ)
+    src_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src')
+    env['PYTHONPATH'] = os.pathsep.join([src_folder, env.get('PYTHONPATH', '')])
+    times = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', TIMING_CODE.format(statement=statement)], env=env,
+                                capture_output=True, text=True, check=True).stdout
+        times.append(float(output.strip().splitlines()[-1]))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measures the import time of PLIX.')
+    parser.add_argument('--repeat', type=int, default=3, help='number of measurements per statement')
+    args = parser.parse_args()
+
+    print('{:<40} {:>10} {:>10}'.format('statement', 'median [s]', 'min [s]'))
+    for name, statement in STATEMENTS.items():
+        times = measure(statement, args.repeat)
+        print('{:<40} {:>10.3f} {:>10.3f}'.format(name, statistics.median(times), min(times)))
+
+
+if __name__ == '__main__':
+    main()
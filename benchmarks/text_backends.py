@@ -0,0 +1,118 @@
+"""
+Benchmark for the text backends of PLIX, see :mod:`plix.classes.text_backends`.
+
+For every backend, the throughput of the raw text extraction is measured on the example datasheets. The text KVU
+extraction is then run on the text of every backend, and its recall is compared to the KVU tuples (file, key, value,
+unit) of the default backend. Run it from the root of the repository::
+
+    python benchmarks/text_backends.py --repeat 3
+    python benchmarks/text_backends.py --backends pdfminer pdfium --no-kvu
+
+The 'pdfium' backend needs pypdfium2 (`pip install plix[pdfium]`), backends that can not be loaded are skipped.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src'))
+
+import plix.classes.pdf_data_extractor as pde  # noqa: E402
+import plix.classes.pdf_session as ps  # noqa: E402
+import plix.classes.stage_cache as sc  # noqa: E402
+import plix.classes.text_backends as tb  # noqa: E402
+import plix.helpers.common_functions as cf  # noqa: E402
+from plix.config import Config  # noqa: E402
+from plix.pipeline import Pipeline  # noqa: E402
+
+EXAMPLE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'example', 'data')
+# columns of the KVU tuples that are compared between the backends
+KVU_COLUMNS = ['FileName', 'Key', 'Value', 'Unit']
+
+
+def measure_throughput(backend, pdf_paths, repeat):
+    """
+    Measures the raw text extraction of a backend.
+
+    :param str backend: name of the backend
+    :param list pdf_paths: paths to the pdf files
+    :param int repeat: number of measurements
+
+    :returns: the measured times in seconds and the number of pages
+    :rtype: tuple
+    """
+    times = []
+    pages = 0
+    for _ in range(repeat):
+        # the sessions keep the text of the pages, every measurement parses the pdfs again
+        ps.close_sessions()
+        start = time.perf_counter()
+        pages = sum(len(sc.unwrap(pde.read_pdf_text_pages(path, backend=backend))) for path in pdf_paths)
+        times.append(time.perf_counter() - start)
+    return times, pages
+
+
+def extract_kvu(backend, data_folder, output_folder):
+    """
+    Runs the text KVU extraction on the text of a backend.
+
+    :param str backend: name of the backend
+    :param str data_folder: folder with the datasheets, the vocabulary and the domain knowledge
+    :param str output_folder: folder for the results of the run
+
+    :returns: the KVU tuples
+    :rtype: set
+    """
+    config = Config(os.path.join(data_folder, 'datasheets'), output_folder=output_folder,
+                    vocab_file=os.path.join(data_folder, 'vocab.txt'), log_file=output_folder + '.log',
+                    text_backend=backend, use_stage_cache=False, collect_metrics=False, do_new_coordinates=False,
+                    do_ocr=False, do_table=False, do_table_info_extraction=False, do_merge=False)
+    pipeline = Pipeline(config)
+    with open(os.path.join(data_folder, 'motor_dk.json'), encoding='utf-8') as fp:
+        pipeline.run_pipeline(json.load(fp))
+    kvu = pipeline.kvu_text_results[KVU_COLUMNS].astype(str)
+    return set(kvu.itertuples(index=False, name=None))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compares the text backends of PLIX.')
+    parser.add_argument('--backends', nargs='+', default=list(tb.BACKENDS), help='backends to compare')
+    parser.add_argument('--data', default=EXAMPLE_FOLDER,
+                        help='folder with the datasheets folder, vocab.txt and motor_dk.json')
+    parser.add_argument('--repeat', type=int, default=3, help='number of throughput measurements per backend')
+    parser.add_argument('--no-kvu', dest='kvu', action='store_false', help='only measure the throughput')
+    args = parser.parse_args()
+
+    backends = []
+    for backend in args.backends:
+        try:
+            tb.get_backend(backend)
+            backends.append(backend)
+        except (ImportError, ValueError) as ex:
+            print('skipping {}: {}'.format(backend, ex))
+    pdf_paths = cf.find_pdf_file_paths_in_directories(os.path.join(args.data, 'datasheets'))
+
+    kvu = {}
+    if args.kvu:
+        with tempfile.TemporaryDirectory() as output_folder:
+            for backend in backends:
+                kvu[backend] = extract_kvu(backend, args.data, os.path.join(output_folder, backend))
+    reference = kvu.get(tb.DEFAULT_BACKEND)
+
+    print('{:<14} {:>7} {:>11} {:>9} {:>8} {:>8}'.format('backend', 'pages', 'median [s]', 'pages/s', 'KVU',
+                                                         'recall'))
+    for backend in backends:
+        times, pages = measure_throughput(backend, pdf_paths, args.repeat)
+        median = statistics.median(times)
+        found = kvu.get(backend)
+        recall = len(found & reference) / len(reference) if found is not None and reference else float('nan')
+        print('{:<14} {:>7} {:>11.3f} {:>9.1f} {:>8} {:>8.3f}'.format(backend, pages, median, pages / median,
+                                                                      len(found) if found is not None else '-',
+                                                                      recall))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,40 @@
+import importlib
+
 __version__ = '1.0'
 
-from plix.classes.normalizer import normalize_unit_dk, normalize_keyword_dk, normalize_tables, \
-    normalize_text_per_page
-from plix.classes.pdf_data_extractor import PDFDataExtractor, process_texts, process_tables
-from plix.classes.table_coordinates_client import extract_coordinates
-from plix.classes.table_info_extractor import extract_table_kvu, remove_text_table_duplicates
-from plix.classes.text_classifier import classify_texts
-from plix.classes.text_info_extractor import extract_text_kvu
-from plix.classes.tokenizer import Tokenizer
-from plix.config import Config
-from plix.helpers.common_functions import kvu_list_to_df, find_pdf_file_paths_in_directories
-from plix.pipeline import Pipeline
+# the public names are imported when they are used for the first time (PEP 562), so `import plix` does not load
+# camelot, cv2, nltk, pint, ... until they are needed
+_LAZY_ATTRIBUTES = {
+    'normalize_unit_dk': 'plix.classes.normalizer',
+    'normalize_keyword_dk': 'plix.classes.normalizer',
+    'normalize_tables': 'plix.classes.normalizer',
+    'normalize_text_per_page': 'plix.classes.normalizer',
+    'PDFDataExtractor': 'plix.classes.pdf_data_extractor',
+    'process_texts': 'plix.classes.pdf_data_extractor',
+    'process_tables': 'plix.classes.pdf_data_extractor',
+    'extract_coordinates': 'plix.classes.table_coordinates_client',
+    'extract_table_kvu': 'plix.classes.table_info_extractor',
+    'remove_text_table_duplicates': 'plix.classes.table_info_extractor',
+    'classify_texts': 'plix.classes.text_classifier',
+    'extract_text_kvu': 'plix.classes.text_info_extractor',
+    'Tokenizer': 'plix.classes.tokenizer',
+    'Config': 'plix.config',
+    'kvu_list_to_df': 'plix.helpers.common_functions',
+    'find_pdf_file_paths_in_directories': 'plix.helpers.common_functions',
+    'Pipeline': 'plix.pipeline',
+}
+
+__all__ = sorted(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError("module 'plix' has no attribute '{}'".format(name))
+    value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name]), name)
+    # cache the attribute, so __getattr__ is only called once per name
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals().keys()) | set(__all__))
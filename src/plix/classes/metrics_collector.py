@@ -0,0 +1,385 @@
+"""
+This class collects metrics of the pipeline stages for every document: wall time, CPU time, peak memory (RSS), page
+count and pages per second.
+
+Stages are measured with :func:`measure` (per document) and :func:`measured_stage` (whole pipeline steps). Every
+process, including the workers of the pool, appends its records to its own file in the spool folder, so the work done
+in recycled or crashed workers is not lost. After the run, :class:`MetricsCollector` merges the records and writes
+a report as JSON and CSV and optionally in the Prometheus text format. Documents that were quarantined by the
+extraction, see :func:`plix.classes.pdf_data_extractor.run_guarded`, are listed in the JSON report.
+
+The records have the following columns:
+
++-------------+-----------------------------------------------------------------------+
+|   column    |                              description                              |
++=============+=======================================================================+
+| stage       | name of the stage                                                     |
++-------------+-----------------------------------------------------------------------+
+| document    | path to the pdf, empty if the stage covers all documents              |
++-------------+-----------------------------------------------------------------------+
+| pid         | id of the process that ran the stage                                  |
++-------------+-----------------------------------------------------------------------+
+| wall_time   | wall time in seconds                                                  |
++-------------+-----------------------------------------------------------------------+
+| cpu_time    | CPU time of the process in seconds                                    |
++-------------+-----------------------------------------------------------------------+
+| peak_rss_mb | peak RSS of the process in MB while the stage ran                     |
++-------------+-----------------------------------------------------------------------+
+| pages       | number of processed pages                                             |
++-------------+-----------------------------------------------------------------------+
+| status      | 'ok' or 'error'                                                       |
++-------------+-----------------------------------------------------------------------+
+"""
+import datetime
+import functools
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from glob import glob
+
+import pandas as pd
+
+import plix.helpers.common_functions as cf
+import plix.helpers.scheduling_utils as su
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, the peak memory is not measured there
+    resource = None
+
+REPORT_COLUMNS = ['stage', 'document', 'pid', 'wall_time', 'cpu_time', 'peak_rss_mb', 'pages', 'status']
+# metrics of the stage summary that are exported in the Prometheus format, with their help texts
+PROMETHEUS_METRICS = {
+    'wall_time': ('plix_stage_wall_seconds', 'Wall time of the stage in seconds, summed over all documents'),
+    'cpu_time': ('plix_stage_cpu_seconds', 'CPU time of the stage in seconds, summed over all processes'),
+    'peak_rss_mb': ('plix_stage_peak_rss_megabytes', 'Highest peak RSS of a process that ran the stage'),
+    'documents': ('plix_stage_documents', 'Number of documents processed by the stage'),
+    'pages': ('plix_stage_pages', 'Number of pages processed by the stage'),
+    'pages_per_sec': ('plix_stage_pages_per_second', 'Pages processed per second of wall time'),
+}
+
+# extension of the spool files with the quarantined documents
+QUARANTINE_EXTENSION = '.quarantine'
+
+# spool folder of the current process, None if no metrics are collected
+_spool_folder = None
+# peak RSS in MB of the open measurements of :func:`track_peak_rss`
+_peak_frames = []
+_peak_lock = threading.Lock()
+
+
+def configure(config):
+    """
+    Sets up the metrics collection of the current process, e.g. in the initializer of a worker.
+
+    :param plix.config.Config config: pipeline config object
+    """
+    global _spool_folder
+    _spool_folder = config.metrics_spool_folder if config is not None and config.collect_metrics else None
+
+
+def get_peak_rss_mb():
+    """
+    Returns the peak resident set size of the current process since the start or the last :func:`reset_peak_rss`.
+    Without /proc (e.g. on macOS), the peak of the lifetime of the process is returned.
+
+    :returns: the peak RSS in MB, None if it can not be measured on this platform
+    :rtype: float
+    """
+    try:
+        with open('/proc/self/status', encoding='ascii') as fp:
+            for line in fp:
+                # unlike ru_maxrss, it is reset by reset_peak_rss, ru_maxrss keeps the peak of exited threads
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    return peak_rss / (1024 * 1024) if sys.platform == 'darwin' else peak_rss / 1024
+
+
+def get_rss_mb():
+    """
+    Returns the current resident set size of the current process.
+
+    :returns: the RSS in MB, None if it can not be measured on this platform
+    :rtype: float
+    """
+    try:
+        with open('/proc/self/statm', encoding='ascii') as fp:
+            resident_pages = int(fp.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+
+def reset_peak_rss():
+    """
+    Resets the peak RSS of the current process to its current RSS, so :func:`get_peak_rss_mb` returns the peak of the
+    following work, e.g. of a single task of a worker. Only supported on Linux, elsewhere the peak is not reset.
+    """
+    try:
+        with open('/proc/self/clear_refs', mode='w', encoding='ascii') as fp:
+            fp.write('5')
+    except OSError:
+        pass
+
+
+@contextmanager
+def track_peak_rss():
+    """
+    Tracks the peak RSS of the process during the `with` block, e.g. of one document, and not of the whole lifetime of
+    the process. The peak is reset at the start of the block. The blocks can be nested and open in several threads:
+    before a reset, the peak so far is added to all open blocks.
+
+    :returns: dictionary, after the block its key 'peak_rss_mb' holds the peak in MB, None if it can not be measured
+    :rtype: dict
+    """
+    frame = {'peak_rss_mb': None}
+    with _peak_lock:
+        __update_peak_frames()
+        _peak_frames.append(frame)
+        reset_peak_rss()
+    try:
+        yield frame
+    finally:
+        with _peak_lock:
+            __update_peak_frames()
+            # the frames of the nested blocks may be equal, so the frame is removed by identity
+            _peak_frames[:] = [open_frame for open_frame in _peak_frames if open_frame is not frame]
+
+
+def __update_peak_frames():
+    peak_rss = get_peak_rss_mb()
+    if peak_rss is None:
+        return
+    for frame in _peak_frames:
+        frame['peak_rss_mb'] = max(peak_rss, frame['peak_rss_mb'] or 0.0)
+
+
+def get_available_memory_mb():
+    """
+    Returns the memory that can be used by new processes without swapping. Inside a container with a memory limit
+    (cgroup v2), the memory left below the limit is returned if it is smaller.
+
+    :returns: the available memory in MB, None if it can not be measured on this platform
+    :rtype: float
+    """
+    available = None
+    try:
+        with open('/proc/meminfo', encoding='ascii') as fp:
+            for line in fp:
+                if line.startswith('MemAvailable:'):
+                    available = int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        return None
+    try:
+        with open('/sys/fs/cgroup/memory.max', encoding='ascii') as fp:
+            limit = fp.read().strip()
+        with open('/sys/fs/cgroup/memory.current', encoding='ascii') as fp:
+            current = int(fp.read())
+        if limit != 'max':
+            left = (int(limit) - current) / (1024 * 1024)
+            available = left if available is None else min(available, left)
+    except (OSError, ValueError):
+        pass
+    return available
+
+
+def record_quarantine(document, stage, reason):
+    """
+    Records a document that could not be processed, it is listed in the report of the run.
+
+    :param str document: path to the pdf file
+    :param str stage: name of the stage that failed
+    :param str reason: why the document failed, e.g. 'timeout', 'memory' or the error message
+    """
+    if _spool_folder is None:
+        return
+    __write_record({'document': document, 'stage': stage, 'reason': reason, 'pid': os.getpid()},
+                   QUARANTINE_EXTENSION)
+
+
+@contextmanager
+def measure(stage, document=None, pages=None):
+    """
+    Measures the code in the `with` block as one run of a stage, e.g. the text extraction of a document.
+
+    :param str stage: name of the stage
+    :param str document: path to the pdf file, None if the stage covers all documents
+    :param int pages: number of processed pages, if None the pages of `document` are counted for the report
+    """
+    if _spool_folder is None:
+        yield
+        return
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    status = 'error'
+    try:
+        with track_peak_rss() as peak:
+            yield
+        status = 'ok'
+    finally:
+        __write_record({
+            'stage': stage,
+            'document': document,
+            'pid': os.getpid(),
+            'wall_time': time.perf_counter() - start_wall,
+            'cpu_time': time.process_time() - start_cpu,
+            'peak_rss_mb': peak['peak_rss_mb'],
+            'pages': pages,
+            'status': status
+        }, '.jsonl')
+
+
+def measured(stage):
+    """
+    Decorator that measures every call of a function as one run of `stage`. The first argument of the function has
+    to be the path to the pdf file.
+
+    :param str stage: name of the stage
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(full_path, *args, **kwargs):
+            with measure(stage, full_path):
+                return func(full_path, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def measured_stage(func):
+    """
+    Decorator for the steps of the pipeline. It logs the start and the duration of the step and measures it as a stage
+    that covers all documents.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        cf.log("STARTED %s", func.__name__)
+        then = datetime.datetime.now()
+        with measure(func.__name__.strip('_')):
+            value = func(*args, **kwargs)
+        cf.log("FINISHED %s in %s", func.__name__, datetime.datetime.now() - then)
+        return value
+
+    return wrapper
+
+
+def __write_record(record, extension):
+    # one file per process, so no locking is needed
+    os.makedirs(_spool_folder, exist_ok=True)
+    with open(os.path.join(_spool_folder, str(os.getpid()) + extension), mode='a', encoding='utf-8') as fp:
+        fp.write(json.dumps(record) + '\n')
+
+
+class MetricsCollector:
+    def __init__(self, config):
+        self.config = config
+
+    def start(self):
+        """
+        Removes the records of previous runs and starts the collection in the current process.
+        """
+        shutil.rmtree(self.config.metrics_spool_folder, ignore_errors=True)
+        configure(self.config)
+
+    def get_records(self):
+        """
+        Merges the records of all processes and adds the page counts.
+
+        :returns: one row per stage run
+        :rtype: pd.DataFrame
+        """
+        records = []
+        for spool_file in sorted(glob(os.path.join(self.config.metrics_spool_folder, '*.jsonl'))):
+            with open(spool_file, encoding='utf-8') as fp:
+                records += [json.loads(line) for line in fp if line.strip()]
+        df = pd.DataFrame(records, columns=REPORT_COLUMNS)
+        page_counts = {doc: su.count_pages(doc) for doc in df['document'].dropna().unique()}
+        # stages that cover all documents processed all pages of the run
+        all_pages = sum(page_counts.values())
+        df['pages'] = [pages if pd.notna(pages) else page_counts[doc] if pd.notna(doc) else all_pages
+                       for doc, pages in zip(df['document'], df['pages'])]
+        df['pages_per_sec'] = df['pages'] / df['wall_time'].where(df['wall_time'] > 0)
+        return df
+
+    def get_quarantine(self):
+        """
+        Merges the quarantined documents of all processes.
+
+        :returns: one dictionary per document with the keys 'document', 'stage', 'reason' and 'pid'
+        :rtype: list
+        """
+        entries = []
+        for spool_file in sorted(glob(os.path.join(self.config.metrics_spool_folder, '*' + QUARANTINE_EXTENSION))):
+            with open(spool_file, encoding='utf-8') as fp:
+                entries += [json.loads(line) for line in fp if line.strip()]
+        return entries
+
+    def get_summary(self, records):
+        """
+        Sums up the records per stage.
+
+        :param pd.DataFrame records: the records, see :meth:`get_records`
+
+        :returns: one row per stage
+        :rtype: pd.DataFrame
+        """
+        summary = records.groupby('stage', sort=False).agg(
+            documents=('document', 'nunique'),
+            wall_time=('wall_time', 'sum'),
+            cpu_time=('cpu_time', 'sum'),
+            peak_rss_mb=('peak_rss_mb', 'max'),
+            pages=('pages', 'sum'),
+            errors=('status', lambda status: int((status != 'ok').sum())))
+        summary['pages_per_sec'] = summary['pages'] / summary['wall_time'].where(summary['wall_time'] > 0)
+        return summary.reset_index()
+
+    def write_report(self):
+        """
+        Writes the report of the run to `config.metrics_file` as JSON (summary per stage and records per document)
+        and CSV (records per document), and to `config.metrics_prometheus_file` if it is set.
+        """
+        if not self.config.collect_metrics:
+            return
+        records = self.get_records()
+        summary = self.get_summary(records)
+        quarantine = self.get_quarantine()
+        report = {
+            'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'stages': json.loads(summary.to_json(orient='records')),
+            'documents': json.loads(records.to_json(orient='records')),
+            'quarantine': quarantine
+        }
+        with open(self.config.metrics_file + '.json', mode='w', encoding='utf-8') as fp:
+            json.dump(report, fp, indent=2)
+        records.to_csv(self.config.metrics_file + '.csv', index=False)
+        if self.config.metrics_prometheus_file:
+            self.__write_prometheus(summary)
+        if quarantine:
+            cf.log('%d documents quarantined, see %s.json', len(quarantine), self.config.metrics_file)
+        cf.log('Metrics report saved to %s', self.config.metrics_file)
+
+    def __write_prometheus(self, summary):
+        lines = []
+        for column, (name, help_text) in PROMETHEUS_METRICS.items():
+            lines += ['# HELP {} {}'.format(name, help_text), '# TYPE {} gauge'.format(name)]
+            lines += ['{}{{stage="{}"}} {}'.format(name, stage, value)
+                      for stage, value in zip(summary['stage'], summary[column]) if pd.notna(value)]
+        tmp_path = self.config.metrics_prometheus_file + '.tmp'
+        with open(tmp_path, mode='w', encoding='utf-8') as fp:
+            fp.write('\n'.join(lines) + '\n')
+        # the file may be read by the node exporter at any time
+        os.replace(tmp_path, self.config.metrics_prometheus_file)
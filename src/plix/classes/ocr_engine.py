@@ -0,0 +1,255 @@
+"""
+This class holds the OCR engines that run tesseract on the page images, the table candidates of the coordinate
+detection and the table images. The engine is chosen with `config.ocr_engine`:
+
+* 'tesserocr': the tesseract API is loaded once per process and kept, the PIL images and NumPy arrays are passed in
+  memory. A pool of `config.ocr_engine_pool_size` API instances per language lets the threads of a process run OCR at
+  the same time. It needs the optional dependency tesserocr (`pip install plix[tesserocr]`).
+* 'pytesseract': a tesseract process per call, the images are passed as temporary files
+* 'auto' (default): 'tesserocr' if it can be imported and loads the language data, otherwise 'pytesseract'
+
+All engines return the same formats as pytesseract, e.g. the boxes in the box file format of tesseract.
+"""
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pytesseract
+from PIL import Image
+
+import plix.helpers.common_functions as cf
+
+ENGINE_AUTO = 'auto'
+ENGINE_TESSEROCR = 'tesserocr'
+ENGINE_PYTESSERACT = 'pytesseract'
+# number of API instances per language if the engine is not configured
+DEFAULT_POOL_SIZE = 2
+# page segmentation mode of tesseract if none is given
+DEFAULT_PSM = 3
+
+# engine of the current process
+_engine = None
+_lock = threading.Lock()
+_settings = {'engine': ENGINE_AUTO, 'pool_size': DEFAULT_POOL_SIZE, 'tessdata_path': None}
+
+
+def configure(config):
+    """
+    Sets the OCR engine of the current process, e.g. in the initializer of a worker. The engine is created when it is
+    used for the first time.
+
+    :param plix.config.Config config: pipeline config object
+    """
+    global _engine
+    with _lock:
+        _engine = None
+        if config is not None:
+            _settings.update(engine=config.ocr_engine, pool_size=config.ocr_engine_pool_size,
+                             tessdata_path=config.tessdata_path)
+
+
+def get_engine():
+    """
+    Returns the OCR engine of the current process.
+
+    :returns: the engine
+    :rtype: OcrEngine
+    """
+    global _engine
+    with _lock:
+        if _engine is None:
+            _engine = __create_engine(**_settings)
+        return _engine
+
+
+def __create_engine(engine, pool_size, tessdata_path):
+    if engine not in [ENGINE_AUTO, ENGINE_TESSEROCR, ENGINE_PYTESSERACT]:
+        raise ValueError("Unknown OCR engine '{}', please use auto, tesserocr or pytesseract".format(engine))
+    if engine == ENGINE_PYTESSERACT:
+        return PytesseractEngine()
+    try:
+        tesserocr_engine = TesserocrEngine(pool_size, tessdata_path)
+        # load the default language once, so a missing installation is noticed here and not during the OCR
+        with tesserocr_engine.acquire('eng', None):
+            pass
+        return tesserocr_engine
+    except Exception as ex:
+        if engine == ENGINE_TESSEROCR:
+            raise
+        cf.log('OCR engine: tesserocr is not available, using pytesseract (%s)', ex)
+        return PytesseractEngine()
+
+
+class OcrEngine:
+    name = None
+
+    def image_to_string(self, image, psm=DEFAULT_PSM, oem=None, lang='eng'):
+        """
+        Recognizes the text of an image.
+
+        :param image: the image as PIL image or NumPy array
+        :param int psm: page segmentation mode of tesseract
+        :param int oem: OCR engine mode of tesseract, None for the default
+        :param str lang: language of the text
+
+        :returns: the text
+        :rtype: str
+        """
+        raise NotImplementedError
+
+    def image_to_boxes(self, image, psm=DEFAULT_PSM, lang='eng'):
+        """
+        Recognizes the characters of an image with their bounding boxes.
+
+        :param image: the image as PIL image or NumPy array
+        :param int psm: page segmentation mode of tesseract
+        :param str lang: language of the text
+
+        :returns: one line per character with the character and its box 'x1 y1 x2 y2' from the bottom left corner
+        :rtype: str
+        """
+        raise NotImplementedError
+
+    def image_to_pdf(self, image, psm=DEFAULT_PSM, lang='eng'):
+        """
+        Creates a pdf of an image with the recognized text as text layer.
+
+        :param image: the image as PIL image or NumPy array
+        :param int psm: page segmentation mode of tesseract
+        :param str lang: language of the text
+
+        :returns: the pdf
+        :rtype: bytes
+        """
+        raise NotImplementedError
+
+
+class PytesseractEngine(OcrEngine):
+    name = ENGINE_PYTESSERACT
+
+    def image_to_string(self, image, psm=DEFAULT_PSM, oem=None, lang='eng'):
+        return pytesseract.image_to_string(image, lang=lang, config=self.__get_config(psm, oem))
+
+    def image_to_boxes(self, image, psm=DEFAULT_PSM, lang='eng'):
+        return pytesseract.image_to_boxes(image, lang=lang, config=self.__get_config(psm, None))
+
+    def image_to_pdf(self, image, psm=DEFAULT_PSM, lang='eng'):
+        return pytesseract.image_to_pdf_or_hocr(image, lang=lang, extension='pdf', config=self.__get_config(psm, None))
+
+    @staticmethod
+    def __get_config(psm, oem):
+        return '--psm {}'.format(psm) + (' --oem {}'.format(oem) if oem is not None else '')
+
+
+class TesserocrEngine(OcrEngine):
+    name = ENGINE_TESSEROCR
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, tessdata_path=None):
+        """
+        Keeps instances of the tesseract API. The language data is loaded when an instance is created, the instances are
+        reused for all further images.
+
+        :param int pool_size: maximum number of API instances per language and OCR engine mode
+        :param str tessdata_path: folder of the language data, None for the default of tesseract
+        """
+        self.tesserocr = self.__import_tesserocr()
+        self.pool_size = max(1, pool_size)
+        self.tessdata_path = tessdata_path
+        self.__pools = {}
+        self.__condition = threading.Condition()
+
+    @contextmanager
+    def acquire(self, lang, oem):
+        """
+        Takes an API instance for a language from the pool, a new one is created if all are in use and the pool is not
+        full. Otherwise, the call waits for an instance.
+
+        :param str lang: language of the text
+        :param int oem: OCR engine mode, None for the default
+        """
+        key = (lang, oem)
+        with self.__condition:
+            pool = self.__pools.setdefault(key, {'idle': [], 'count': 0})
+            while not pool['idle'] and pool['count'] >= self.pool_size:
+                self.__condition.wait()
+            api = pool['idle'].pop() if pool['idle'] else None
+            if api is None:
+                pool['count'] += 1
+        if api is None:
+            try:
+                api = self.__create_api(lang, oem)
+            except Exception:
+                with self.__condition:
+                    pool['count'] -= 1
+                    self.__condition.notify()
+                raise
+        try:
+            yield api
+        finally:
+            api.Clear()
+            with self.__condition:
+                pool['idle'].append(api)
+                self.__condition.notify()
+
+    def image_to_string(self, image, psm=DEFAULT_PSM, oem=None, lang='eng'):
+        with self.acquire(lang, oem) as api:
+            self.__set_image(api, image, psm)
+            return api.GetUTF8Text()
+
+    def image_to_boxes(self, image, psm=DEFAULT_PSM, lang='eng'):
+        with self.acquire(lang, None) as api:
+            self.__set_image(api, image, psm)
+            return api.GetBoxText(0)
+
+    def image_to_pdf(self, image, psm=DEFAULT_PSM, lang='eng'):
+        # the pdf renderer of tesseract writes to a file
+        with self.acquire(lang, None) as api, tempfile.TemporaryDirectory() as folder:
+            output_base = os.path.join(folder, 'ocr')
+            api.SetPageSegMode(psm)
+            api.SetVariable('tessedit_create_pdf', '1')
+            try:
+                if not api.ProcessPage(output_base, self.__to_pil(image), 0, ''):
+                    raise RuntimeError('tesseract could not create the pdf')
+            finally:
+                api.SetVariable('tessedit_create_pdf', '0')
+            with open(output_base + '.pdf', mode='rb') as fp:
+                return fp.read()
+
+    def close(self):
+        """
+        Frees the API instances that are not in use.
+        """
+        with self.__condition:
+            for pool in self.__pools.values():
+                for api in pool['idle']:
+                    api.End()
+                pool['count'] -= len(pool['idle'])
+                pool['idle'] = []
+
+    def __create_api(self, lang, oem):
+        kwargs = {'lang': lang}
+        if self.tessdata_path:
+            kwargs['path'] = self.tessdata_path
+        if oem is not None:
+            kwargs['oem'] = self.tesserocr.OEM(oem)
+        return self.tesserocr.PyTessBaseAPI(**kwargs)
+
+    @classmethod
+    def __set_image(cls, api, image, psm):
+        api.SetPageSegMode(psm)
+        api.SetImage(cls.__to_pil(image))
+
+    @staticmethod
+    def __import_tesserocr():
+        try:
+            import tesserocr
+        except ImportError as ex:
+            raise ImportError("ocr_engine 'tesserocr' needs tesserocr, install it with: pip install tesserocr") from ex
+        return tesserocr
+
+    @staticmethod
+    def __to_pil(image):
+        # pytesseract converts arrays the same way, the channels of cv2 images are not swapped
+        return Image.fromarray(image) if isinstance(image, np.ndarray) else image
@@ -0,0 +1,245 @@
+"""
+This class holds the rendered page images of the pdfs in memory, so a page is only rasterized once per process,
+although the coordinate detection (300 dpi, grayscale), the OCR of the text (`config.ocr_dpi`, colour) and the OCR of
+the tables (crops of the 300 dpi images) all need it. The images are shared by the uses that run in the same process:
+
+* the service runs all three for a document in one worker, see :func:`plix.pipeline.process_new_document`
+* the extraction of a document runs the OCR of the text and of the tables in one worker, in the streaming mode and if
+  the text and the tables are extracted in one step
+* in the batch and the streaming mode, the coordinates are detected in separate tasks before the extraction, their
+  images are only reused if the extraction of the document runs in the same worker and they are still cached
+
+The images are keyed by (document hash, page, dpi, colour mode). If the same page is cached with a higher resolution
+or in colour, the requested image is derived from it by downsampling or grayscale conversion instead of rendering the
+page again. The least recently used images are evicted when the cache exceeds `config.page_image_cache_mb`.
+
+The cached images are shared, they must not be changed by the caller.
+"""
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+from pdf2image import convert_from_path
+
+import plix.classes.pdf_session as ps
+import plix.classes.stage_cache as sc
+
+# colour modes of the images, as in PIL
+GRAYSCALE = 'L'
+COLOR = 'RGB'
+# size of the cache if it is not configured
+DEFAULT_MAX_MB = 1024
+
+# cache of the current process
+_cache = None
+
+
+def configure(config):
+    """
+    Sets up the page image cache of the current process, e.g. in the initializer of a worker.
+
+    :param plix.config.Config config: pipeline config object
+    """
+    global _cache
+    _cache = PageImageCache(config.page_image_cache_mb if config is not None else DEFAULT_MAX_MB)
+
+
+def get_cache():
+    """
+    Returns the page image cache of the current process.
+
+    :returns: the cache
+    :rtype: PageImageCache
+    """
+    global _cache
+    if _cache is None:
+        _cache = PageImageCache(DEFAULT_MAX_MB)
+    return _cache
+
+
+class PageImageCache:
+    def __init__(self, max_mb):
+        self.max_bytes = max_mb * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+        self.__images = OrderedDict()
+        self.__size = 0
+        self.__lock = threading.Lock()
+
+    def get_pages(self, full_path, pages, dpi, mode=GRAYSCALE):
+        """
+        Returns the images of pages of a pdf. Pages that can not be taken or derived from the cache are rendered,
+        consecutive pages with one call of pdftoppm.
+
+        :param str full_path: path to the pdf file
+        :param iterable pages: page numbers, starting at 1
+        :param int dpi: resolution of the images
+        :param str mode: :data:`GRAYSCALE` or :data:`COLOR`
+
+        :returns: the images per page number, in the order of `pages`
+        :rtype: dict
+        """
+        doc_hash = sc.hash_file(full_path)
+        pages = list(pages)
+        images = {page: self.get_cached(doc_hash, page, dpi, mode) for page in pages}
+        missing = [page for page in pages if images[page] is None]
+        for first_page, last_page in self.__get_ranges(missing):
+            rendered = convert_from_path(full_path, dpi=dpi, first_page=first_page, last_page=last_page,
+                                         grayscale=mode == GRAYSCALE, thread_count=4)
+            for page, image in zip(range(first_page, last_page + 1), rendered):
+                images[page] = self.put(doc_hash, page, dpi, mode, image)
+        return {page: images[page] for page in pages if images[page] is not None}
+
+    def iter_pages(self, full_path, pages, dpi, mode=GRAYSCALE, window=1):
+        """
+        Yields the images of pages of a pdf one at a time. Pages that can not be taken or derived from the cache are
+        rendered in windows of at most `window` consecutive pages and added to the cache, so besides the cache only the
+        images of one window are in memory at the same time, independent of the number of pages.
+
+        :param str full_path: path to the pdf file
+        :param iterable pages: page numbers, starting at 1
+        :param int dpi: resolution of the images
+        :param str mode: :data:`GRAYSCALE` or :data:`COLOR`
+        :param int window: maximum number of pages that are rendered at once
+
+        :returns: the page numbers and images, in the order of `pages`
+        :rtype: Iterator[tuple]
+        """
+        doc_hash = sc.hash_file(full_path)
+        pages = list(pages)
+        rendered = {}
+        for i, page in enumerate(pages):
+            image = rendered.pop(page) if page in rendered else self.get_cached(doc_hash, page, dpi, mode)
+            if image is None:
+                # render the next pages that are not cached, up to the end of the window or a gap
+                last_page = page
+                for next_page in pages[i + 1:i + window]:
+                    if next_page != last_page + 1 or self.get_cached(doc_hash, next_page, dpi, mode) is not None:
+                        break
+                    last_page = next_page
+                images = convert_from_path(full_path, dpi=dpi, first_page=page, last_page=last_page,
+                                           grayscale=mode == GRAYSCALE, thread_count=4)
+                for rendered_page, rendered_image in zip(range(page, last_page + 1), images):
+                    rendered[rendered_page] = self.put(doc_hash, rendered_page, dpi, mode, rendered_image)
+                del images
+                image = rendered.pop(page, None)
+            if image is not None:
+                yield page, image
+            # the caller has its own reference while it processes the page
+            image = None
+
+    def get_document(self, full_path, dpi, mode=GRAYSCALE, first_page=1, last_page=None):
+        """
+        Returns the images of a range of pages of a pdf, see :meth:`get_pages`.
+
+        :param str full_path: path to the pdf file
+        :param int dpi: resolution of the images
+        :param str mode: :data:`GRAYSCALE` or :data:`COLOR`
+        :param int first_page: number of the first page, starting at 1
+        :param int last_page: number of the last page (included), None for the last page of the pdf
+
+        :returns: the images per page number
+        :rtype: dict
+        """
+        page_count = ps.get_page_count(full_path)
+        last_page = page_count if last_page is None else min(last_page, page_count)
+        return self.get_pages(full_path, range(first_page, last_page + 1), dpi, mode)
+
+    def get_cached(self, doc_hash, page, dpi, mode=GRAYSCALE):
+        """
+        Returns the image of a page if it is cached or can be derived from a cached image of the same page with a
+        higher resolution or in colour.
+
+        :param str doc_hash: content hash of the pdf, see :func:`plix.classes.stage_cache.hash_file`
+        :param int page: page number, starting at 1
+        :param int dpi: resolution of the image
+        :param str mode: :data:`GRAYSCALE` or :data:`COLOR`
+
+        :returns: the image, None if it is not cached
+        :rtype: PIL.Image.Image
+        """
+        key = (doc_hash, page, dpi, mode)
+        with self.__lock:
+            if key in self.__images:
+                self.__images.move_to_end(key)
+                self.hits += 1
+                return self.__images[key]
+            sources = [source for source in self.__images if source[:2] == key[:2] and source[2] >= dpi
+                       and (source[3] == mode or mode == GRAYSCALE)]
+            if not sources:
+                self.misses += 1
+                return None
+            # the smallest image that has enough resolution
+            source = min(sources, key=lambda k: (k[2], k[3] != mode))
+            image = self.__images[source]
+            self.hits += 1
+        if image.mode != mode:
+            image = image.convert(mode)
+        if source[2] != dpi:
+            size = (max(1, round(image.width * dpi / source[2])), max(1, round(image.height * dpi / source[2])))
+            image = image.resize(size, Image.LANCZOS)
+        return self.put(doc_hash, page, dpi, mode, image)
+
+    def put(self, doc_hash, page, dpi, mode, image):
+        """
+        Adds the image of a page, e.g. one that was read from a file. The least recently used images are evicted if
+        the cache is full.
+
+        :param str doc_hash: content hash of the pdf
+        :param int page: page number, starting at 1
+        :param int dpi: resolution of the image
+        :param str mode: :data:`GRAYSCALE` or :data:`COLOR`
+        :param PIL.Image.Image image: the image
+
+        :returns: the image in the requested mode
+        :rtype: PIL.Image.Image
+        """
+        if image.mode != mode:
+            image = image.convert(mode)
+        image.load()
+        size = self.__get_size(image)
+        if size > self.max_bytes:
+            return image
+        key = (doc_hash, page, dpi, mode)
+        with self.__lock:
+            if key in self.__images:
+                self.__size -= self.__get_size(self.__images.pop(key))
+            self.__images[key] = image
+            self.__size += size
+            while self.__size > self.max_bytes:
+                _, evicted = self.__images.popitem(last=False)
+                self.__size -= self.__get_size(evicted)
+        return image
+
+    def clear(self):
+        """
+        Removes all images.
+        """
+        with self.__lock:
+            self.__images.clear()
+            self.__size = 0
+
+    def get_size_mb(self):
+        """
+        Returns the memory of the cached images.
+
+        :returns: the size in MB
+        :rtype: float
+        """
+        return self.__size / (1024 * 1024)
+
+    @staticmethod
+    def __get_size(image):
+        return image.width * image.height * len(image.getbands())
+
+    @staticmethod
+    def __get_ranges(pages):
+        # groups sorted page numbers into ranges of consecutive pages
+        ranges = []
+        for page in sorted(pages):
+            if ranges and ranges[-1][1] == page - 1:
+                ranges[-1][1] = page
+            else:
+                ranges.append([page, page])
+        return [tuple(page_range) for page_range in ranges]
+
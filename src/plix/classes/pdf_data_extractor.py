@@ -9,30 +9,74 @@ The result has the following format:
 +===========+==================+==================+=====================+===============================+===============================================+==============================+=================+=====================================================+==========================================+================================================+====================+===================+================+
 | row index | name of pdf file | path to pdf file | category of the pdf | list of classification labels | list with occurences of classification labels | list of extracted table data | metadata of pdf | finished, extracted text, pages are joined together | cleaned-up text from the text extraction | text chosen between cleanOCRText and cleanText | raw extracted text | cleaned OCRedText | raw OCRed text |
 +-----------+------------------+------------------+---------------------+-------------------------------+-----------------------------------------------+------------------------------+-----------------+-----------------------------------------------------+------------------------------------------+------------------------------------------------+--------------------+-------------------+----------------+
+
+Additionally, the column `DocumentHash` holds the hash of the pdf content. It is used as key for the stage cache, see
+:class:`classes.stage_cache`.
 """
+import copy
+import functools
+import logging
 import os
-from multiprocessing import Pool
+from collections import defaultdict
 
-import numpy as np
 import pandas as pd
 import pytesseract
-from pdf2image import convert_from_path
-from pdfminer.converter import PDFPageAggregator
-from pdfminer.layout import LAParams
-from pdfminer.layout import LTTextBox
-from pdfminer.pdfdocument import PDFDocument
-from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
-from pdfminer.pdfpage import PDFPage
-from pdfminer.pdfparser import PDFParser
 from pdfminer.pdftypes import PDFObjRef, resolve1
-from spellchecker import SpellChecker
 
+import plix.classes.metrics_collector as mc
+import plix.classes.ocr_engine as oe
+import plix.classes.page_image_cache as pic
+import plix.classes.pdf_session as ps
+import plix.classes.stage_cache as sc
+import plix.classes.text_backends as tb
+import plix.classes.worker_pool as wp
 import plix.helpers.common_functions as cf
+import plix.helpers.scheduling_utils as su
 import plix.helpers.table_utils as tau
 import plix.helpers.text_utils as teu
 import plix.nlp_assets as nlp_assets
 
-spellcheck = SpellChecker()
+spellchecker = cf.lazy_import('spellchecker')
+
+# page segmentation mode of tesseract for the OCR of the pages, use no oem mode or 3
+OCR_PSM = 1
+# number of pages that are rendered at once for the OCR, a page at 600 dpi in colour takes about 100 MB
+OCR_RENDER_PAGES = 2
+# columns with text of large documents that were read in page ranges before `process_texts`
+PREFETCHED_COLUMNS = {'Text': 'PrefetchedText', 'OCRedText': 'PrefetchedOCRText'}
+# columns written by :func:`process_texts`
+TEXT_COLUMNS = ['Text', 'cleanText', 'OCRedText', 'cleanOCRText', 'MeaningfulText', 'allText']
+# text columns that are only needed to choose `MeaningfulText`, they are not kept with `config.lean_memory`
+TEXT_VARIANT_COLUMNS = ['Text', 'cleanText', 'OCRedText', 'cleanOCRText']
+# column order of the result of :func:`extract_all_data_from_files`
+RESULT_COLUMNS = ['Filename', 'FullPath', 'DocumentHash', 'Category', 'TableData', 'Metadata', 'allText', 'cleanText',
+                  'MeaningfulText', 'Text', 'cleanOCRText', 'OCRedText']
+# columns the extraction functions read and write, only these are sent to the workers and back
+TASK_COLUMNS = {
+    'process_texts': (['FullPath', 'DocumentHash'] + list(PREFETCHED_COLUMNS.values()), TEXT_COLUMNS),
+    'process_tables': (['FullPath', 'DocumentHash'], ['TableData']),
+    'extract_all_data_from_files': (['FullPath', 'DocumentHash'] + list(PREFETCHED_COLUMNS.values()),
+                                    [column for column in RESULT_COLUMNS if column not in ['FullPath', 'DocumentHash']])
+}
+
+_spellcheckers = {}
+
+
+def get_spellchecker(vocab_file):
+    """
+    Returns a spellchecker with the vocabulary file loaded. It is only built once per process and vocabulary.
+
+    :param str vocab_file: path to the vocabulary file
+
+    :returns: the spellchecker
+    :rtype: spellchecker.SpellChecker
+    """
+    if vocab_file not in _spellcheckers:
+        spellcheck = spellchecker.SpellChecker()
+        if vocab_file and os.path.exists(vocab_file):
+            spellcheck.word_frequency.load_text_file(vocab_file)
+        _spellcheckers[vocab_file] = spellcheck
+    return _spellcheckers[vocab_file]
 
 
 def process_texts(dataframe, config):
@@ -45,27 +89,31 @@ def process_texts(dataframe, config):
     :param pd.DataFrame dataframe: dataframe object in which the data is saved.
     :param plix.config.Config config: pipeline config object
 
+    With `config.lean_memory`, only `MeaningfulText` and `allText` are returned. The other text variants are dropped
+    as soon as `MeaningfulText` is chosen, the raw texts stay in the stage cache, see :func:`restore_text_variants`.
+
     :returns: dataframe object with added new data
     :rtype: pd.DataFrame
     """
-    dataframe['Text'] = ''
-    dataframe['cleanText'] = ''
-    dataframe['OCRedText'] = ''
-    dataframe['cleanOCRText'] = ''
-    dataframe['MeaningfulText'] = ''
-    dataframe['allText'] = ''
+    for column in TEXT_COLUMNS:
+        dataframe[column] = ''
 
     if os.name == "nt":
         pytesseract.pytesseract.tesseract_cmd = config.tesseract_path
+    cache = sc.get_stage_cache(config)
 
     if config.do_text_extraction:
-        dataframe['Text'] = dataframe.apply(lambda x: __read_pdf_text(x['FullPath']), axis=1)
+        dataframe['Text'] = dataframe.apply(
+            lambda x: __get_prefetched(x, 'Text') or
+            sc.fetch(cache, 'text', x.get('DocumentHash'), config, __read_pdf_text, x['FullPath'],
+                     config.text_backend), axis=1)
         dataframe['cleanText'] = dataframe['Text'].apply(lambda a: __clean_text(a, config.is_paperdata))
 
     if config.do_ocr or config.force_ocr:
         dataframe['OCRedText'] = dataframe.apply(
-            lambda x: __parse_ocr(x['FullPath'], x['Text'], config.dtd_max_page_num,
-                                  config.ocr_min_page_threshold, config.force_ocr),
+            lambda x: __get_prefetched(x, 'OCRedText') or
+            sc.fetch(cache, 'ocr', x.get('DocumentHash'), config, __parse_ocr, x['FullPath'], x['Text'],
+                     config.dtd_max_page_num, config.ocr_min_page_threshold, config.force_ocr, config.ocr_dpi),
             axis=1)
         dataframe['cleanOCRText'] = dataframe['OCRedText'].apply(lambda a: __clean_text(a, config.is_paperdata))
 
@@ -77,6 +125,27 @@ def process_texts(dataframe, config):
                                                       axis=1)
         dataframe['allText'] = dataframe['MeaningfulText'].apply(lambda page: ' '.join([str(v) for v in page.values()]))
 
+    return dataframe.drop(columns=__get_dropped_columns(config), errors='ignore')
+
+
+def restore_text_variants(dataframe, config):
+    """
+    Adds the text variants that are not kept with `config.lean_memory` (`Text`, `cleanText`, `OCRedText`,
+    `cleanOCRText`) again. The raw texts are read from the stage cache, only documents that are not in the cache are
+    read or OCRed again.
+
+    :param pd.DataFrame dataframe: extraction results with the columns 'FullPath' and 'DocumentHash'
+    :param plix.config.Config config: pipeline config object
+
+    :returns: dataframe object with the text variants
+    :rtype: pd.DataFrame
+    """
+    lean_config = copy.copy(config)
+    lean_config.lean_memory = False
+    variants = process_texts(dataframe[[c for c in ['FullPath', 'DocumentHash'] if c in dataframe.columns]].copy(),
+                             lean_config)
+    for column in TEXT_VARIANT_COLUMNS:
+        dataframe[column] = variants[column]
     return dataframe
 
 
@@ -114,11 +183,42 @@ def process_tables(dataframe, tokenizer, coordinates, config):
         pytesseract.pytesseract.tesseract_cmd = config.tesseract_path
 
     if config.do_table:
-        dataframe['TableData'] = dataframe.apply(lambda x: __process_table_data(x['FullPath'], tokenizer, coordinates,
-                                                                                config), axis=1)
+        cache = sc.get_stage_cache(config)
+        dataframe['TableData'] = dataframe.apply(
+            lambda x: sc.fetch(cache, 'tables', x.get('DocumentHash'), config, __process_table_data, x['FullPath'],
+                               tokenizer, coordinates, config,
+                               extra=__get_document_coordinates(x['FullPath'], coordinates)), axis=1)
+    return dataframe
+
+
+def add_document_hashes(dataframe):
+    """
+    Adds the content hash of every pdf, it is used as the key for the stage cache.
+
+    :param pd.DataFrame dataframe: dataframe object with the column 'FullPath'
+
+    :returns: dataframe object with the column 'DocumentHash'
+    :rtype: pd.DataFrame
+    """
+    dataframe['DocumentHash'] = dataframe['FullPath'].apply(sc.hash_file)
     return dataframe
 
 
+def select_coordinates(coordinates, full_paths):
+    """
+    Selects the table coordinates of some documents, e.g. to send only those to a worker.
+
+    :param pd.DataFrame coordinates: extracted table coordinates, may be None
+    :param list full_paths: paths to the pdf files
+
+    :returns: the coordinates of the documents
+    :rtype: pd.DataFrame
+    """
+    if coordinates is None:
+        return None
+    return coordinates[coordinates.FullPath.isin(list(full_paths))]
+
+
 def get_category(full_path):
     """
     gets the category of the pdf document.
@@ -147,46 +247,225 @@ def extract_all_data_from_files(dataframe, tokenizer, coordinates, config):
     dataframe = process_texts(dataframe, config)
     dataframe = process_metadata(dataframe)
     dataframe = process_tables(dataframe, tokenizer, coordinates, config)
-    dataframe = cf.reorder_columns(dataframe, ['Filename',
-                                               'FullPath',
-                                               'Category',
-                                               'TableData',
-                                               'Metadata',
-                                               'allText',
-                                               'cleanText',
-                                               'MeaningfulText',
-                                               'Text',
-                                               'cleanOCRText',
-                                               'OCRedText'
-                                               ])
+    dataframe = cf.reorder_columns(dataframe, get_result_columns(config))
     return dataframe
 
 
-def __read_pdf_text(filename):
-    cf.log('Reading file: ' + filename)
+def get_result_columns(config):
+    """
+    Returns the columns of the result of :func:`extract_all_data_from_files`, without the text variants if
+    `config.lean_memory` is set.
+
+    :param plix.config.Config config: pipeline config object
+
+    :returns: the columns in their order
+    :rtype: list
+    """
+    if config is not None and config.lean_memory:
+        return [column for column in RESULT_COLUMNS if column not in TEXT_VARIANT_COLUMNS]
+    return list(RESULT_COLUMNS)
+
+
+def run_guarded(func, dataframe, *args):
+    """
+    Runs an extraction function for a single document within the limits set in the config (`document_timeout`,
+    `document_max_memory_mb`). If the extraction fails or exceeds a limit, it is retried once with the cheaper
+    settings in `config.document_retry_config`, e.g. without OCR. If the retry fails too, the document is quarantined:
+    it is listed in the metrics report and its columns are left empty, so the other documents are not affected.
+
+    :param function func: extraction function, e.g. :func:`process_texts`, its last argument has to be the config
+    :param pd.DataFrame dataframe: dataframe with one document
+    :param args: the further arguments of `func`, the last one is the config
+
+    :returns: the result of `func`
+    :rtype: pd.DataFrame
+    """
+    config = args[-1]
+    full_path = dataframe['FullPath'].iloc[0]
+    reason = None
+    for attempt_config in [config, __get_retry_config(config)]:
+        try:
+            with wp.limits(config.document_timeout, config.document_max_memory_mb):
+                return func(dataframe.copy(), *args[:-1], attempt_config)
+        except wp.LimitExceeded as ex:
+            reason = ex.reason
+        except Exception as ex:
+            reason = 'error: ' + str(ex)
+        cf.log('Extraction of %s failed (%s) in %s', full_path, reason, func.__name__, level=logging.WARNING)
+    return quarantine(func, dataframe, config, reason)
+
+
+def quarantine(func, dataframe, config, reason):
+    """
+    Quarantines a document that could not be extracted: it is listed in the metrics report and its columns are left
+    empty.
+
+    :param function func: extraction function that failed, e.g. :func:`process_texts`
+    :param pd.DataFrame dataframe: dataframe with one document
+    :param plix.config.Config config: pipeline config object
+    :param str reason: why the document failed, e.g. 'timeout'
+
+    :returns: the result of `func` with empty columns
+    :rtype: pd.DataFrame
+    """
+    full_path = dataframe['FullPath'].iloc[0]
+    cf.log('Quarantined %s', full_path, level=logging.WARNING)
+    mc.record_quarantine(full_path, func.__name__, reason)
+    return __get_empty_result(func, dataframe.copy(), config)
+
+
+def get_task_deadline(config):
+    """
+    Returns the time after which the parent gives up the task of a single document, see
+    :meth:`plix.classes.worker_pool.WorkerPool.imap_unordered`. :func:`run_guarded` can not stop a task that hangs in C
+    code or whose worker is killed. The task may run the extraction twice within `document_timeout` (the first attempt
+    and the retry), the same time again is left for the other steps of the task.
+
+    :param plix.config.Config config: pipeline config object
+
+    :returns: the deadline in seconds, None if `document_timeout` is not set
+    :rtype: float
+    """
+    return 3 * config.document_timeout if config.document_timeout else None
+
+
+def _run_task(func, output_columns, guarded, dataframe, *args):
+    # runs an extraction function in a worker and only returns the columns it produced
+    result = run_guarded(func, dataframe, *args) if guarded else func(dataframe, *args)
+    return __select_columns(result, output_columns)
+
+
+def _quarantine_lost_task(config, args, reason):
+    # result of a :func:`_run_task` task that the parent gave up
+    func, output_columns, _, dataframe = args[:4]
+    return __select_columns(quarantine(func, dataframe, config, reason), output_columns)
+
+
+def __select_columns(result, output_columns):
+    return result if output_columns is None else result[[column for column in output_columns
+                                                          if column in result.columns]]
+
+
+def __get_retry_config(config):
+    retry_config = copy.copy(config)
+    for name, value in config.document_retry_config.items():
+        setattr(retry_config, name, value)
+    return retry_config
+
+
+def __get_dropped_columns(config):
+    # the prefetched texts are only an input of the text extraction
+    columns = list(PREFETCHED_COLUMNS.values())
+    if config.lean_memory:
+        columns += TEXT_VARIANT_COLUMNS
+    return columns
+
+
+def __get_empty_result(func, dataframe, config):
+    # the columns of a quarantined document are filled like the ones of a pdf without text and tables
+    if func in (process_texts, extract_all_data_from_files):
+        for column in TEXT_COLUMNS:
+            dataframe[column] = ''
+        dataframe = dataframe.drop(columns=__get_dropped_columns(config), errors='ignore')
+    if func in (process_tables, extract_all_data_from_files):
+        dataframe['TableData'] = ''
+    if func is extract_all_data_from_files:
+        dataframe['Metadata'] = [{}] * len(dataframe.index)
+        dataframe['Filename'] = cf.get_filename(dataframe['FullPath'])
+        dataframe['Category'] = get_category(dataframe['FullPath'])
+        dataframe = cf.reorder_columns(dataframe, get_result_columns(config))
+    return dataframe
+
+
+def __get_document_coordinates(full_path, coordinates):
+    # the table extraction of a document depends on its coordinates, so they are part of the cache key
+    if coordinates is None or not len(coordinates.index):
+        return None
+    row = coordinates[coordinates.FullPath.isin([full_path])]
+    return row[['size', 'tableCoords']].values.tolist()
+
+
+def read_pdf_text_pages(filename, first_page=0, last_page=None, backend=tb.DEFAULT_BACKEND):
+    """
+    Reads the text of a range of pages of a pdf file. Large documents are split into page ranges that are read in
+    parallel.
+
+    :param str filename: path to the pdf file
+    :param int first_page: number of the first page to read, starting at 0
+    :param int last_page: number of the page after the last page to read, None to read until the end
+    :param str backend: name of the text backend, see :mod:`plix.classes.text_backends`
+
+    :returns: text per page, the keys are the page numbers. After an error, the pages that were read before are marked
+        as :class:`plix.classes.stage_cache.Incomplete`, so they are not cached.
+    :rtype: dict or plix.classes.stage_cache.Incomplete
+    """
     pages = {}
+    text_backend = tb.get_backend(backend)
+    try:
+        # read (only) text page by page, the pages before an error are kept
+        for i, text in text_backend.iter_pages(filename, first_page, last_page):
+            pages[i] = text
+    except Exception as ex:
+        cf.log('Error Read PDF: %s', ex)
+        return sc.Incomplete(pages, str(ex))
+    return pages
+
 
+def ocr_pdf_pages(filename, first_page=0, last_page=None, dpi=600, pages=None):
+    """
+    Converts a range of pages of a pdf file to images and runs OCR on them. The pages are taken from the page image
+    cache, e.g. derived from larger images, and the missing ones are rendered in windows of :data:`OCR_RENDER_PAGES`
+    consecutive pages and added to it. So the memory is bounded by the cache and one window, independent of the
+    number of pages, and the table OCR reuses the images.
+
+    :param str filename: path to the pdf file
+    :param int first_page: number of the first page to OCR, starting at 0
+    :param int last_page: number of the page after the last page to OCR, None to OCR until the end
+    :param int dpi: resolution of the page images
+    :param list pages: page numbers to OCR, starting at 0, e.g. from :func:`get_ocr_pages`, None for all pages of the
+        range
+
+    :returns: OCRed text per page, the keys are the page numbers. After an error, the pages that were OCRed before are
+        marked as :class:`plix.classes.stage_cache.Incomplete`, so they are not cached.
+    :rtype: dict or plix.classes.stage_cache.Incomplete
+    """
+    ocred_pages = {}
+    page_count = ps.get_page_count(filename)
+    last_page = page_count if last_page is None else min(last_page, page_count)
+    pages = [page for page in (range(first_page, last_page) if pages is None else pages)
+             if first_page <= page < last_page]
     try:
-        with open(filename, mode='rb') as fp:
-            number_pdf_pages = PDFPage.get_pages(fp)
-            resource_manager = PDFResourceManager()
-            laparams = LAParams(char_margin=40, all_texts=True)
-            device = PDFPageAggregator(resource_manager, laparams=laparams)
-            interpreter = PDFPageInterpreter(resource_manager, device)
-            # read (only) text page by page
-            for i, page in enumerate(number_pdf_pages):
-                interpreter.process_page(page)
-                layout = device.get_result()
-                text_arr = [lobj.get_text().replace('\xa0', ' ')
-                            for lobj in layout
-                            if isinstance(lobj, LTTextBox)]
-                pages[i] = '\n'.join(text_arr)
-            pages['total pages'] = i + 1
-            cf.log('Extracted ' + str(pages['total pages']) + ' pages')
+        # the page image cache counts pages from 1
+        images = pic.get_cache().iter_pages(filename, [page + 1 for page in pages], dpi, pic.COLOR,
+                                            window=OCR_RENDER_PAGES)
+        for page, image in images:
+            ocred_pages[page - 1] = oe.get_engine().image_to_string(image, psm=OCR_PSM)
+            image = None
     except Exception as ex:
-        cf.log('Error Read PDF: ' + str(ex))
+        cf.log('OCRParser Error: %s', ex)
+        return sc.Incomplete(ocred_pages, str(ex))
+    return ocred_pages
 
-    return pages
+
+def _page_range_task(func, stage, full_path, first_page, last_page):
+    with mc.measure(stage, full_path, pages=last_page - first_page):
+        return full_path, func(full_path, first_page, last_page)
+
+
+def __get_prefetched(row, column):
+    prefetched = row.get(PREFETCHED_COLUMNS[column])
+    return prefetched if isinstance(prefetched, dict) and prefetched else None
+
+
+@mc.measured('text')
+def __read_pdf_text(filename, backend):
+    cf.log('Reading file: %s', filename)
+    result = read_pdf_text_pages(filename, backend=backend)
+    pages = sc.unwrap(result)
+    if pages:
+        pages['total pages'] = len(pages)
+        cf.log('Extracted %d pages', pages['total pages'])
+    return result
 
 
 def __resolve_metadata(obj):
@@ -200,28 +479,27 @@ def __resolve_metadata(obj):
 
 def __read_metadata(filename):
     metadata = {}
-    with open(filename, mode='rb') as fp:
-        try:
-            parser = PDFParser(fp)
-            doc = PDFDocument(parser)
-            raw_metadata = doc.info
-            for dat in raw_metadata:
-                # expect only one object in this array
-                for key in dat.keys():
-                    if isinstance(dat[key], list):
-                        new_arr = []
-                        arr = dat[key]  # ???
-                        for el in arr:
-                            new_arr.append(__resolve_metadata(el))
-                        dat[key] = new_arr
-                    else:
-                        dat[key] = __resolve_metadata(dat[key])
-                    metadata[key] = dat[key]
-            # add source url and file size
-            file_size = os.path.getsize(filename)
-            metadata['FileSize'] = file_size
-        except Exception as ex:
-            cf.log('Error reading metadata ' + filename + str(ex))
+    try:
+        raw_metadata = ps.get_session(filename).info
+        for dat in raw_metadata:
+            # the info of the session is shared, the resolved values are written to a copy
+            dat = dict(dat)
+            # expect only one object in this array
+            for key in dat.keys():
+                if isinstance(dat[key], list):
+                    new_arr = []
+                    arr = dat[key]  # ???
+                    for el in arr:
+                        new_arr.append(__resolve_metadata(el))
+                    dat[key] = new_arr
+                else:
+                    dat[key] = __resolve_metadata(dat[key])
+                metadata[key] = dat[key]
+        # add source url and file size
+        file_size = os.path.getsize(filename)
+        metadata['FileSize'] = file_size
+    except Exception as ex:
+        cf.log('Error reading metadata %s%s', filename, ex)
     return metadata
 
 
@@ -245,78 +523,101 @@ def __clean_text(raw_text, is_paperdata):
 
 
 def __choose_meaningful_text(text, ocr_text, vocab_file, ocr_min_page_threshold):
-    if os.path.exists(vocab_file):
-        spellcheck.word_frequency.load_text_file(vocab_file)
+    spellcheck = get_spellchecker(vocab_file)
     better_text = {}
+    # the text of a step that did not run is empty
+    text = text if isinstance(text, dict) else {}
     if 'total pages' in text.keys():
         text.pop('total pages')
-    # first check if both texts have same no of pages
-
-    len_text = len(text)
-    len_ocr = len(ocr_text)
-    if len_text != len_ocr:
-        cf.log('Meaningful text choice: not the same number of pages')
-        better_text = text if len_text > len_ocr else ocr_text
-    # then check lengths of text
-    else:
-        # iterate over the pages
-        for i, (p_text, p_ocr) in enumerate(zip(text.values(), ocr_text.values())):
-            if not isinstance(p_text, str) or not isinstance(p_ocr, str):
-                continue
-            # check lengths
-            if len(p_text) < ocr_min_page_threshold <= len(p_ocr):
-                cf.log('Meaningful text choice: OCR has more text')
-                better_text[i] = p_ocr
-            elif len(p_ocr) < ocr_min_page_threshold <= len(p_text):
-                cf.log('Meaningful text choice: text extraction has more text')
-                better_text[i] = p_text
-            else:
-                cf.log('Meaningful text choice: Deciding via spellchecker')
-                errors_text = spellcheck.unknown(p_text.split())
-                errors_ocr = spellcheck.unknown(p_ocr.split())
-                better_text[i] = p_ocr if len(errors_text) > len(errors_ocr) else p_text
+    # only the pages without enough text are OCRed, the other pages keep the extracted text
+    ocr_text = {page: p_ocr for page, p_ocr in (ocr_text if isinstance(ocr_text, dict) else {}).items()
+                if page != 'total pages'}
+    for page in sorted(set(text) | set(ocr_text)):
+        p_text = text.get(page)
+        p_ocr = ocr_text.get(page)
+        if not isinstance(p_ocr, str) or not isinstance(p_text, str):
+            better_text[page] = p_text if isinstance(p_text, str) else p_ocr
+        # check lengths
+        elif len(p_text) < ocr_min_page_threshold <= len(p_ocr):
+            cf.log('Meaningful text choice: OCR has more text', level=logging.DEBUG)
+            better_text[page] = p_ocr
+        elif len(p_ocr) < ocr_min_page_threshold <= len(p_text):
+            cf.log('Meaningful text choice: text extraction has more text', level=logging.DEBUG)
+            better_text[page] = p_text
+        else:
+            cf.log('Meaningful text choice: Deciding via spellchecker', level=logging.DEBUG)
+            errors_text = spellcheck.unknown(p_text.split())
+            errors_ocr = spellcheck.unknown(p_ocr.split())
+            better_text[page] = p_ocr if len(errors_text) > len(errors_ocr) else p_text
 
     return better_text
 
 
-def __parse_ocr(filename, pages, dtd_max_page_num, ocr_min_page_thresh, force_ocr):
-    ocred_pages = {}
-    try:
-        page_count = dtd_max_page_num
-        # exclude 'total pages'
-        if isinstance(pages, dict):
-            if 'total pages' in pages.keys():
-                pages.pop('total pages')
-                page_count = len(pages.keys())
-            all_text_len = sum([len(x) for x in pages.values()])
-            pages['total pages'] = page_count  # add back
-            # for time performance, use ocr when necessary, or set in config
-            if force_ocr or all_text_len <= page_count * ocr_min_page_thresh:
-                cf.log('Running OCR parser for ' + filename)
-                # an installation file is needed, download from
-                # https://github.com/UB-Mannheim/tesseract/wiki
-                # tesseract4 is not working, please download version5.0.0
-                pages = convert_from_path(filename, dpi=600, thread_count=4)
-                tesser_config = '--psm 1'  # use no oem mode or 3
-                i = 0
-                for page in pages:
-                    if i >= dtd_max_page_num:
-                        break
-                    ocred_pages[i] = pytesseract.image_to_string(page, lang='eng', config=tesser_config)
-                    i += 1
-                ocred_pages['total pages'] = len(pages)
-    except Exception as ex:
-        cf.log('OCRParser Error: ' + str(ex))
+def get_ocr_pages(pages, dtd_max_page_num, ocr_min_page_thresh, force_ocr):
+    """
+    Selects the pages of a document that are OCRed: all pages if OCR is forced, otherwise the pages whose extracted text
+    is shorter than `ocr_min_page_thresh`. Only the first `dtd_max_page_num` pages are considered. If no text could be
+    extracted, all of them are OCRed.
+
+    :param dict pages: extracted text per page, may contain the key 'total pages'
+    :param int dtd_max_page_num: number of pages to consider
+    :param int ocr_min_page_thresh: minimum number of characters per page
+    :param bool force_ocr: flag to always run OCR
+
+    :returns: the page numbers, starting at 0
+    :rtype: list
+    """
+    if not isinstance(pages, dict):
+        return []
+    # exclude 'total pages'
+    texts = {page: text for page, text in pages.items() if page != 'total pages'}
+    if not texts:
+        return list(range(dtd_max_page_num))
+    # for time performance, use ocr when necessary, or set in config
+    return [page for page in sorted(texts) if page < dtd_max_page_num
+            and (force_ocr or len(texts[page]) < ocr_min_page_thresh)]
+
+
+def needs_ocr(pages, dtd_max_page_num, ocr_min_page_thresh, force_ocr):
+    """
+    Decides whether a document is OCRed, i.e. if OCR is forced or one of its pages has too little text, see
+    :func:`get_ocr_pages`.
+
+    :param dict pages: extracted text per page, may contain the key 'total pages'
+    :param int dtd_max_page_num: number of pages to consider
+    :param int ocr_min_page_thresh: minimum number of characters per page
+    :param bool force_ocr: flag to always run OCR
 
+    :returns: true if the document should be OCRed
+    :rtype: bool
+    """
+    return bool(get_ocr_pages(pages, dtd_max_page_num, ocr_min_page_thresh, force_ocr))
+
+
+@mc.measured('ocr')
+def __parse_ocr(filename, pages, dtd_max_page_num, ocr_min_page_thresh, force_ocr, dpi):
+    ocred_pages = {}
+    ocr_pages = get_ocr_pages(pages, dtd_max_page_num, ocr_min_page_thresh, force_ocr)
+    if ocr_pages:
+        cf.log('Running OCR parser for %s on %d pages', filename, len(ocr_pages))
+        # an installation file is needed, download from
+        # https://github.com/UB-Mannheim/tesseract/wiki
+        # tesseract4 is not working, please download version5.0.0
+        result = ocr_pdf_pages(filename, dpi=dpi, pages=ocr_pages)
+        ocred_pages = sc.unwrap(result)
+        if ocred_pages:
+            ocred_pages['total pages'] = ps.get_page_count(filename)
+        return result
     return ocred_pages
 
 
+@mc.measured('tables')
 def __process_table_data(full_path, tokenizer, coordinates, config):
     """
     This func extracts and processes tables from pdf files.
 
     When coordinates are present, tables are only extracted in the corresponding area. For ocr, the image is cut to the
-    coordinate boundaries, and OCR is performed on the cut image with pytesseract. Afterwards, the table is extracted
+    coordinate boundaries, and OCR is performed on the cut image with tesseract. Afterwards, the table is extracted
     with Camelot.
     After all tables are extracted, they are futher processed to correct possible extraction errors and make them more
     readable and processable. Additionally, the tables are filtered to exclude possible graphs that were mistakenly
@@ -359,10 +660,10 @@ def __process_table_data(full_path, tokenizer, coordinates, config):
     :rtype: list of lists
     """
 
-    table_data = __extract_tables(full_path, coordinates, config.table_modes, config.table_line_scale,
-                                  config.table_whitespace_thresh, config.image_folder, config.ocr_pdf_path,
-                                  config.ocr_image_path)
-    table_data, i = __format_tables(table_data)
+    result = __extract_tables(full_path, coordinates, config.table_modes, config.table_line_scale,
+                              config.table_whitespace_thresh, config.image_folder, config.ocr_pdf_path,
+                              config.ocr_image_path)
+    table_data, i = __format_tables(sc.unwrap(result))
     # filter tables for possible graphs or images
     if config.filter_table:
         filtered_tables = __filter_tables(table_data, tokenizer, config.table_filter_max_row_thresh,
@@ -374,10 +675,12 @@ def __process_table_data(full_path, tokenizer, coordinates, config):
     if i == 0:
         cf.log('No table found.')
     else:
-        cf.log("Extracted " + str(len(table_data)) + " table(s)")
-    cf.log("Filtered " + str(no_filtered) + " table(s)")
-    cf.log(str(len(filtered_tables)) + " table(s) after filtering")
+        cf.log("Extracted %d table(s)", len(table_data))
+    cf.log("Filtered %d table(s)", no_filtered)
+    cf.log("%d table(s) after filtering", len(filtered_tables))
 
+    if isinstance(result, sc.Incomplete):
+        return sc.Incomplete(filtered_tables, result.reason)
     return filtered_tables
 
 
@@ -388,7 +691,7 @@ def __extract_tables(full_path, coordinates, table_modes, table_line_scale, tabl
     file = os.path.basename(full_path)
     tables = []
     try:
-        cf.log('Get tables: ' + full_path)
+        cf.log('Get tables: %s', full_path)
         if mode == 'no_table':
             return tables
         if mode == 'lattice':
@@ -396,17 +699,24 @@ def __extract_tables(full_path, coordinates, table_modes, table_line_scale, tabl
         else:
             # both stream and OCR need coordinates
             table_coords, org_size, pt_size = tau.format_coordinates(full_path, coordinates)
+            if mode == 'stream':
+                # camelot parses a page once for all tables on it
+                page_boxes = defaultdict(list)
+                for cds in table_coords:
+                    page_boxes[cds['page']].append(cds['box'])
+                for page, boxes in page_boxes.items():
+                    tables += tau.extract_stream_page_tables(full_path, page, boxes, org_size, pt_size)
+                return tables
             for i, cds in enumerate(table_coords):
                 new_coords = cds['box']
-                if mode == 'stream':
-                    tables += tau.extract_stream_tables(full_path, new_coords, org_size, pt_size, cds)
-                elif mode == 'ocr':
+                if mode == 'ocr':
                     tables += tau.extract_ocr_tables(file, cds, new_coords, i, image_folder, ocr_pdf_path,
-                                                     ocr_image_path)
+                                                     ocr_image_path, full_path=full_path)
                 else:
                     raise ValueError("Table Extraction: No or wrong extraction mode specified")
     except Exception as ex:
-        cf.log('Error reading table:' + full_path + ' ' + str(ex))
+        cf.log('Error reading table:%s %s', full_path, ex)
+        return sc.Incomplete(tables, str(ex))
     return tables
 
 
@@ -436,12 +746,14 @@ def __filter_tables(table_data, tokenizer, table_filter_max_row_thresh, table_fi
 
 
 class PDFDataExtractor:
-    def __init__(self, directory, tokenizer, cores_no=1, coordinates=None):
+    def __init__(self, directory, tokenizer, cores_no=1, coordinates=None, worker_pool=None):
         self.paths = cf.find_pdf_file_paths_in_directories(directory)
         self.extraction_results = None
         self.tokenizer = tokenizer
         self.no_cores = cores_no
         self.table_coordinates = coordinates
+        # shared pool of the pipeline, if none is set, a pool is started for every extraction
+        self.worker_pool = worker_pool
 
     def extract_data_from_pdfs(self, func=None, df=None, config=None):
         """
@@ -463,6 +775,8 @@ class PDFDataExtractor:
             self.extraction_results = pd.DataFrame(self.paths, columns=['FullPath'])
         else:
             self.extraction_results = df
+        if 'DocumentHash' not in self.extraction_results.columns:
+            self.extraction_results = add_document_hashes(self.extraction_results)
         self.__adjust_cores_if_needed()
         self.__parallelize_data_extraction(func, config)
         return self.extraction_results
@@ -472,14 +786,118 @@ class PDFDataExtractor:
             self.no_cores = len(self.extraction_results["FullPath"])
 
     def __parallelize_data_extraction(self, func, config):
-        df_split = np.array_split(self.extraction_results, self.no_cores)
-        pool = Pool(self.no_cores)
+        if self.worker_pool is not None:
+            self.__run_in_pool(self.worker_pool, func, config)
+        else:
+            with wp.WorkerPool(self.no_cores, assets={'config': config, 'tokenizer': self.tokenizer}) as pool:
+                self.__run_in_pool(pool, func, config)
+
+    def __run_in_pool(self, pool, func, config):
+        if config is not None and func in (process_texts, extract_all_data_from_files):
+            self.__prefetch_large_documents(pool, config)
+        per_document = config is not None and (config.schedule_by_cost or config.document_timeout
+                                                or config.document_max_memory_mb)
+        if per_document:
+            # one document per task, the most expensive ones first, so no worker idles while another one is stuck
+            df_split = self.__split_by_cost(config)
+        else:
+            df_split = wp.split_dataframe(self.extraction_results, self.no_cores)
+        input_columns, output_columns = TASK_COLUMNS.get(func.__name__, (None, None))
+        if input_columns is not None:
+            df_split = [part[[column for column in input_columns if column in part.columns]] for part in df_split]
         if func.__name__ == 'process_texts':
-            inputs = [(df_in, config) for df_in in df_split]
-            self.extraction_results = pd.concat(pool.starmap(func, inputs))
+            args = [(pool.ref('config'),) for _ in df_split]
         else:
-            inputs = [(part, self.tokenizer, self.table_coordinates, config) for part in df_split]
-            results = pool.starmap(func, inputs)
-            self.extraction_results = pd.concat(results)
-        pool.close()
-        pool.join()
+            args = [(pool.ref('tokenizer'), self.__get_partition_coordinates(part), pool.ref('config'))
+                    for part in df_split]
+        # with one document per task, a failing document is retried and quarantined without stopping the others, also
+        # if it hangs or its worker dies
+        inputs = [(func, output_columns, per_document, part) + part_args for part, part_args in zip(df_split, args)]
+        deadline = get_task_deadline(config) if per_document else None
+        on_lost = functools.partial(_quarantine_lost_task, config) if per_document else None
+        results = pd.concat(list(pool.imap_unordered(_run_task, inputs, stage=func.__name__, deadline=deadline,
+                                                     on_lost=on_lost)))
+        results = results.reindex(self.extraction_results.index)
+        if output_columns is None:
+            self.extraction_results = results
+            return
+        extraction_results = self.extraction_results.drop(columns=list(PREFETCHED_COLUMNS.values()), errors='ignore')
+        for column in results.columns:
+            extraction_results[column] = results[column]
+        if func is extract_all_data_from_files:
+            extraction_results = cf.reorder_columns(extraction_results, get_result_columns(config))
+        self.extraction_results = extraction_results
+
+    def __prefetch_large_documents(self, pool, config):
+        # large documents are split into page ranges that are read by all workers, instead of one worker reading the
+        # whole document while the others idle
+        if not config.page_split_min_pages:
+            return
+        docs = {}
+        for path, doc_hash in zip(self.extraction_results['FullPath'], self.extraction_results['DocumentHash']):
+            page_count = su.count_pages(path)
+            if page_count >= config.page_split_min_pages:
+                docs[path] = (doc_hash, page_count)
+        if not docs:
+            return
+        cf.log('Reading %d large documents in ranges of %d pages', len(docs), config.page_split_size)
+        cache = sc.get_stage_cache(config)
+
+        texts = {}
+        if config.do_text_extraction:
+            texts = self.__read_page_ranges(pool, functools.partial(read_pdf_text_pages, backend=config.text_backend),
+                                            'text', docs, cache, config)
+            self.extraction_results[PREFETCHED_COLUMNS['Text']] = self.extraction_results['FullPath'].map(texts)
+
+        if config.do_ocr or config.force_ocr:
+            ocr_pages = {path: get_ocr_pages(pages, config.dtd_max_page_num, config.ocr_min_page_threshold,
+                                             config.force_ocr) for path, pages in texts.items()}
+            ocr_docs = {path: docs[path] for path, pages in ocr_pages.items() if pages}
+            ocr_texts = self.__read_page_ranges(pool, functools.partial(ocr_pdf_pages, dpi=config.ocr_dpi), 'ocr',
+                                                ocr_docs, cache, config, selected_pages=ocr_pages)
+            self.extraction_results[PREFETCHED_COLUMNS['OCRedText']] = \
+                self.extraction_results['FullPath'].map(ocr_texts)
+
+    @staticmethod
+    def __read_page_ranges(pool, func, stage, docs, cache, config, selected_pages=None):
+        # reads all pages of the documents, or only the selected pages per document, in ranges of consecutive pages
+        results = {}
+        keys = {}
+        tasks = []
+        for path, (doc_hash, page_count) in docs.items():
+            if cache is not None and doc_hash:
+                keys[path] = cache.key(stage, doc_hash, config)
+                found, value = cache.load(stage, keys[path])
+                if found:
+                    results[path] = value
+                    continue
+            pages = range(page_count) if selected_pages is None else selected_pages[path]
+            tasks += [(func, stage, path, first_page, last_page)
+                      for first_page, last_page in su.get_page_ranges(pages, config.page_split_size)]
+
+        pages = defaultdict(dict)
+        incomplete = set()
+        for path, range_pages in pool.imap_unordered(_page_range_task, tasks, stage=stage):
+            if isinstance(range_pages, sc.Incomplete):
+                incomplete.add(path)
+            pages[path].update(sc.unwrap(range_pages))
+        for path, doc_pages in pages.items():
+            if not doc_pages:
+                continue
+            # the ranges finish in any order
+            results[path] = {page: doc_pages[page] for page in sorted(doc_pages)}
+            # the text counts the pages that were read, OCR the pages of the document
+            results[path]['total pages'] = docs[path][1] if stage == 'ocr' else len(doc_pages)
+            # a range that failed is read again in the next run
+            if path in keys and path not in incomplete:
+                cache.save(stage, keys[path], results[path])
+        return results
+
+    def __split_by_cost(self, config):
+        positions = {path: i for i, path in enumerate(self.extraction_results['FullPath'])}
+        ordered_paths = su.order_by_cost(list(positions.keys()), config)
+        return [self.extraction_results.iloc[[positions[path]]] for path in ordered_paths]
+
+    def __get_partition_coordinates(self, part):
+        # only send the coordinates of the documents in the partition to the worker
+        return select_coordinates(self.table_coordinates, part['FullPath'])
@@ -0,0 +1,203 @@
+"""
+This class holds a parsed pdf, so the pdf is only parsed once per process although the text extraction, the OCR and
+the metadata all need it: the cross-reference table, the page tree and the document info are read when the session is
+opened, the fonts and other resources of the pages are shared by all pages, and the text of every page is only laid
+out once.
+
+The sessions of the most recently used documents stay open, see :func:`get_session`. A session is bound to the size and
+modification time of the file, a changed file is parsed again.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from pdf2image import pdfinfo_from_path
+from pdfminer.converter import PDFPageAggregator
+from pdfminer.layout import LAParams
+from pdfminer.layout import LTTextBox
+from pdfminer.pdfdevice import PDFTextDevice
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdffont import PDFUnicodeNotDefined
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfparser import PDFParser
+
+import plix.helpers.common_functions as cf
+
+# number of documents that are kept open per process
+MAX_SESSIONS = 2
+
+# open sessions of the current process, the most recently used last
+_sessions = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_session(full_path):
+    """
+    Returns the session of a pdf, it is opened if the pdf has no open session yet. The least recently used session is
+    closed if more than :data:`MAX_SESSIONS` are open.
+
+    :param str full_path: path to the pdf file
+
+    :returns: the session
+    :rtype: PdfSession
+    """
+    stat = os.stat(full_path)
+    key = (os.path.abspath(full_path), stat.st_size, stat.st_mtime_ns)
+    with _lock:
+        if key in _sessions:
+            _sessions.move_to_end(key)
+            return _sessions[key]
+    # parse outside of the lock, another thread may read an other document in the meantime
+    session = PdfSession(full_path)
+    with _lock:
+        if key in _sessions:
+            session.close()
+            return _sessions[key]
+        _sessions[key] = session
+        while len(_sessions) > MAX_SESSIONS:
+            _, evicted = _sessions.popitem(last=False)
+            evicted.close()
+    return session
+
+
+def get_page_count(full_path):
+    """
+    Returns the number of pages of a pdf from its session, so a process that reads the pdf does not parse it again
+    only to count the pages. If pdfminer can not parse the pdf, the pages are counted by poppler, which also renders
+    the pages for the OCR, so a broken pdf is still OCRed completely.
+
+    :param str full_path: path to the pdf file
+
+    :returns: number of pages, 1 if the pdf can not be read
+    :rtype: int
+    """
+    try:
+        return max(1, get_session(full_path).page_count)
+    except Exception as ex:
+        cf.log('Could not count pages of %s with pdfminer %s', full_path, ex)
+    try:
+        return max(1, int(pdfinfo_from_path(full_path)['Pages']))
+    except Exception as ex:
+        cf.log('Could not count pages of %s %s', full_path, ex)
+        return 1
+
+
+def close_sessions():
+    """
+    Closes the sessions of all documents.
+    """
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+class PdfSession:
+    def __init__(self, full_path):
+        """
+        Opens and parses a pdf. The pages are only laid out when their text is requested.
+
+        :param str full_path: path to the pdf file
+        """
+        self.full_path = full_path
+        self.__fp = open(full_path, mode='rb')
+        try:
+            self.document = PDFDocument(PDFParser(self.__fp))
+            self.pages = list(PDFPage.create_pages(self.document))
+        except Exception:
+            self.__fp.close()
+            raise
+        self.__texts = {}
+        self.__resource_manager = PDFResourceManager(caching=True)
+        # pdfminer objects are not thread-safe, the stages of the pipeline may read the same document at the same time
+        self.__lock = threading.RLock()
+
+    @property
+    def page_count(self):
+        """
+        Number of pages of the pdf.
+        """
+        return len(self.pages)
+
+    @property
+    def info(self):
+        """
+        Document info dictionaries of the pdf, the values may be references that still have to be resolved.
+        """
+        return self.document.info
+
+    def get_page_texts(self, first_page=0, last_page=None, layout=True):
+        """
+        Returns the text of a range of pages. Every page is only read once, further calls take the text from the
+        session.
+
+        :param int first_page: number of the first page, starting at 0
+        :param int last_page: number of the page after the last page, None until the end
+        :param bool layout: group the characters into text boxes with the layout analysis of pdfminer, otherwise the
+            characters are joined in the order of the content stream, which is faster but keeps e.g. columns interleaved
+
+        :returns: text per page, the keys are the page numbers
+        :rtype: dict
+        """
+        last_page = self.page_count if last_page is None else min(last_page, self.page_count)
+        with self.__lock:
+            missing = [i for i in range(first_page, last_page) if (layout, i) not in self.__texts]
+            if missing:
+                if layout:
+                    laparams = LAParams(char_margin=40, all_texts=True)
+                    device = PDFPageAggregator(self.__resource_manager, laparams=laparams)
+                else:
+                    device = _RawTextDevice(self.__resource_manager)
+                interpreter = PDFPageInterpreter(self.__resource_manager, device)
+                for i in missing:
+                    interpreter.process_page(self.pages[i])
+                    if layout:
+                        text = '\n'.join([lobj.get_text() for lobj in device.get_result()
+                                          if isinstance(lobj, LTTextBox)])
+                    else:
+                        text = device.get_text()
+                    self.__texts[(layout, i)] = text.replace('\xa0', ' ')
+            return {i: self.__texts[(layout, i)] for i in range(first_page, last_page)}
+
+    def close(self):
+        """
+        Closes the file of the pdf, after a running read of the pages.
+        """
+        with self.__lock:
+            self.__fp.close()
+
+
+class _RawTextDevice(PDFTextDevice):
+    # collects the characters of a page in the order of the content stream, without creating layout objects: a line
+    # break is added when the baseline changes or the text jumps back, a space for a gap wider than a fifth of the
+    # font size
+    def __init__(self, resource_manager):
+        super().__init__(resource_manager)
+        self.__chunks = []
+        self.__last = None
+
+    def begin_page(self, page, ctm):
+        self.__chunks = []
+        self.__last = None
+
+    def render_char(self, matrix, font, fontsize, scaling, rise, cid, *args):
+        try:
+            text = font.to_unichr(cid)
+        except PDFUnicodeNotDefined:
+            text = '(cid:{})'.format(cid)
+        advance = font.char_width(cid) * fontsize * scaling
+        a, b, _, d, x, y = matrix
+        height = abs(d * fontsize) or abs(b * fontsize) or 1.0
+        if self.__last is not None:
+            last_end, last_y, last_height = self.__last
+            if abs(y - last_y) > 0.5 * max(height, last_height) or x < last_end - 2 * height:
+                self.__chunks.append('\n')
+            elif x - last_end > 0.2 * height and not text.isspace():
+                self.__chunks.append(' ')
+        self.__chunks.append(text)
+        self.__last = (x + advance * a, y, height)
+        return advance
+
+    def get_text(self):
+        return ''.join(self.__chunks)
@@ -0,0 +1,94 @@
+"""
+This class holds the journal of a streamed pipeline run. Every finished document is appended with its KVU tuples as
+soon as it is done, so a run that crashed or was stopped can be resumed: the documents in the journal are skipped and
+their results are read from the journal instead.
+
+The journal is a JSON lines file with one entry per document::
+
+    {"FullPath": "...", "DocumentHash": "...", "kvu_text": [{...}, ...], "kvu_table": [{...}, ...]}
+"""
+import json
+import os
+
+import pandas as pd
+
+import plix.classes.stage_cache as sc
+import plix.helpers.common_functions as cf
+
+
+class RunJournal:
+    def __init__(self, journal_file):
+        self.journal_file = journal_file
+
+    def reset(self):
+        """
+        Removes the entries of previous runs.
+        """
+        if os.path.exists(self.journal_file):
+            os.remove(self.journal_file)
+
+    def load(self):
+        """
+        Loads the finished documents. Entries of documents that were changed since, or that were cut off by a crash,
+        are ignored.
+
+        :returns: the entries per path of the pdf
+        :rtype: dict
+        """
+        entries = {}
+        if not os.path.exists(self.journal_file):
+            return entries
+        with open(self.journal_file, encoding='utf-8') as fp:
+            for line in fp:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    cf.log('Journal: skipping incomplete entry')
+                    continue
+                path = entry['FullPath']
+                if os.path.exists(path) and sc.hash_file(path) == entry['DocumentHash']:
+                    entries[path] = entry
+        cf.log('Journal: %d documents already finished', len(entries))
+        # rewrite the journal without the ignored entries, so new entries are not appended to a cut off line
+        tmp_path = self.journal_file + '.tmp'
+        with open(tmp_path, mode='w', encoding='utf-8') as fp:
+            fp.writelines(json.dumps(entry) + '\n' for entry in entries.values())
+        os.replace(tmp_path, self.journal_file)
+        return entries
+
+    def append(self, result):
+        """
+        Appends a finished document. The entry is flushed to the disk immediately.
+
+        :param dict result: result of the document, see :meth:`plix.pipeline.Pipeline.iter_pipeline`
+        """
+        entry = {
+            'FullPath': result['FullPath'],
+            'DocumentHash': result['extraction'].get('DocumentHash') or sc.hash_file(result['FullPath']),
+            'kvu_text': json.loads(result['kvu_text'].to_json(orient='records')),
+            'kvu_table': json.loads(result['kvu_table'].to_json(orient='records'))
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(self.journal_file)), exist_ok=True)
+        with open(self.journal_file, mode='a', encoding='utf-8') as fp:
+            fp.write(json.dumps(entry) + '\n')
+            fp.flush()
+            os.fsync(fp.fileno())
+
+    @staticmethod
+    def to_result(entry):
+        """
+        Converts a journal entry back to the result format of :meth:`plix.pipeline.Pipeline.iter_pipeline`. The
+        extraction results are not journaled, 'extraction' only holds the path and hash.
+
+        :param dict entry: the journal entry
+
+        :returns: the result of the document
+        :rtype: dict
+        """
+        columns = cf.kvu_list_to_df([]).columns
+        return {
+            'FullPath': entry['FullPath'],
+            'extraction': pd.Series({'FullPath': entry['FullPath'], 'DocumentHash': entry['DocumentHash']}),
+            'kvu_text': pd.DataFrame(entry['kvu_text'], columns=columns),
+            'kvu_table': pd.DataFrame(entry['kvu_table'], columns=columns)
+        }
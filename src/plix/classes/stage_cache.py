@@ -0,0 +1,235 @@
+"""
+This class holds a content-addressed cache for the outputs of the pipeline stages.
+
+Every stage output of a document (raw text, OCR text, coordinates, raw tables, normalized tables, KVU tuples) is stored
+in its own file. The cache key is built from a hash of the PDF bytes and only the :class:`plix.config.Config` fields
+the stage depends on. Thus, adding a new data sheet to a folder or changing a table setting only invalidates the
+affected documents and stages, everything else is reused.
+
+The cache folder has the following layout::
+
+    stage_cache/
+        <stage>/
+            <key>.pkl
+"""
+import hashlib
+import json
+import os
+import pickle
+
+import plix.helpers.common_functions as cf
+
+# increase when the output format of a stage changes, this invalidates all cached entries
+CACHE_VERSION = 1
+# config fields each stage depends on, changing one of them invalidates the cached output of the stage
+# derived stages (normalization, KVU extraction) additionally pass a hash of their input data as `extra`
+TEXT_FIELDS = ['text_backend']
+OCR_FIELDS = TEXT_FIELDS + ['do_text_extraction', 'dtd_max_page_num', 'ocr_min_page_threshold', 'force_ocr', 'ocr_dpi',
+                            'ocr_engine']
+COORDINATE_FIELDS = ['table_modes']
+# the tables are filtered with the vocabulary of the tokenizer, the OCR tables are read by the OCR engine
+TABLE_FIELDS = COORDINATE_FIELDS + ['table_line_scale', 'table_whitespace_thresh', 'filter_table',
+                                    'table_filter_empty_thresh', 'table_filter_meaningful_thresh',
+                                    'table_filter_spaces_thresh', 'table_filter_max_row_thresh', 'vocab_file',
+                                    'ocr_engine']
+STAGE_CONFIG_FIELDS = {
+    'text': TEXT_FIELDS,
+    'ocr': OCR_FIELDS,
+    'coordinates': COORDINATE_FIELDS,
+    'tables': TABLE_FIELDS,
+    'normalized_tables': ['do_table_multiple_normalization'],
+    'kvu_text': ['pdf_max_len_text'],
+    'kvu_table': ['do_pivot_search'],
+}
+
+_HASH_CHUNK_SIZE = 1 << 20
+_file_hashes = {}
+
+
+def hash_file(file_path):
+    """
+    Calculates the SHA-256 hash of a file's content. The hash is memoized per path, size and modification time,
+    so a file is only read once per process.
+
+    :param str file_path: path to the file
+
+    :returns: hex digest of the file content
+    :rtype: str
+    """
+    stat = os.stat(file_path)
+    memo_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+    if memo_key not in _file_hashes:
+        sha = hashlib.sha256()
+        with open(file_path, mode='rb') as fp:
+            for chunk in iter(lambda: fp.read(_HASH_CHUNK_SIZE), b''):
+                sha.update(chunk)
+        _file_hashes[memo_key] = sha.hexdigest()
+    return _file_hashes[memo_key]
+
+
+def hash_object(obj):
+    """
+    Calculates a stable hash for a json-like object, e.g. the domain knowledge or the coordinates of a document.
+
+    :param Any obj: object to hash
+
+    :returns: hex digest of the object
+    :rtype: str
+    """
+    try:
+        dump = json.dumps(obj, sort_keys=True, default=str)
+    except TypeError:
+        # e.g. page dictionaries with int page numbers and the str key 'total pages'
+        dump = repr(obj)
+    return hashlib.sha256(dump.encode('utf-8')).hexdigest()
+
+
+def unwrap(value):
+    """
+    Returns the output of a stage, also if it is marked as :class:`Incomplete`.
+
+    :param Any value: the stage output
+
+    :returns: the output without the mark
+    :rtype: Any
+    """
+    return value.value if isinstance(value, Incomplete) else value
+
+
+def get_stage_cache(config):
+    """
+    Creates the stage cache for a config, if it is enabled.
+
+    :param plix.config.Config config: pipeline config object
+
+    :returns: the stage cache or None if caching is disabled
+    :rtype: StageCache
+    """
+    if config is None or not config.use_stage_cache:
+        return None
+    return StageCache(config.stage_cache_folder)
+
+
+def fetch(cache, stage, doc_hash, config, compute, *args, extra=None):
+    """
+    Convenience function that works with a disabled cache (None) as well. See :meth:`StageCache.fetch`.
+
+    :param StageCache cache: the stage cache or None
+    :param str stage: name of the stage
+    :param str doc_hash: hash of the pdf file
+    :param plix.config.Config config: pipeline config object
+    :param function compute: function to calculate the stage output, it is called with `args`
+    :param Any extra: additional input the output depends on, e.g. the domain knowledge
+
+    :returns: the stage output
+    :rtype: Any
+    """
+    if cache is None or not doc_hash:
+        return unwrap(compute(*args))
+    return cache.fetch(stage, doc_hash, config, compute, *args, extra=extra)
+
+
+class StageCache:
+    def __init__(self, cache_folder):
+        self.cache_folder = cache_folder
+
+    def key(self, stage, doc_hash, config, extra=None):
+        """
+        Builds the cache key of a stage output for a document.
+
+        :param str stage: name of the stage, one of `STAGE_CONFIG_FIELDS`
+        :param str doc_hash: hash of the pdf file
+        :param plix.config.Config config: pipeline config object
+        :param Any extra: additional input the output depends on, e.g. the domain knowledge
+
+        :returns: the key
+        :rtype: str
+        """
+        fields = {field: getattr(config, field, None) for field in STAGE_CONFIG_FIELDS[stage]}
+        return hash_object([CACHE_VERSION, stage, doc_hash, fields, extra])
+
+    def load(self, stage, key):
+        """
+        Loads a cached stage output.
+
+        :param str stage: name of the stage
+        :param str key: cache key
+
+        :returns: a flag whether the entry was found and the output
+        :rtype: tuple
+        """
+        path = self.__entry_path(stage, key)
+        if not os.path.exists(path):
+            return False, None
+        try:
+            with open(path, mode='rb') as fp:
+                return True, pickle.load(fp)
+        except (OSError, EOFError, pickle.UnpicklingError) as ex:
+            cf.log('Stage cache: could not read %s %s', path, ex)
+            return False, None
+
+    def save(self, stage, key, value):
+        """
+        Saves a stage output. The file is written atomically, so parallel workers never read half-written entries.
+
+        :param str stage: name of the stage
+        :param str key: cache key
+        :param Any value: the stage output
+        """
+        path = self.__entry_path(stage, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, mode='wb') as fp:
+            pickle.dump(value, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def contains(self, stage, doc_hash, config, extra=None):
+        """
+        Checks whether a stage output of a document is cached.
+
+        :returns: true if the output is cached
+        :rtype: bool
+        """
+        return os.path.exists(self.__entry_path(stage, self.key(stage, doc_hash, config, extra)))
+
+    def fetch(self, stage, doc_hash, config, compute, *args, extra=None):
+        """
+        Returns the cached stage output of a document. If there is none, it is calculated with `compute(*args)` and
+        saved, unless the calculation failed and returned an :class:`Incomplete` output.
+
+        :param str stage: name of the stage
+        :param str doc_hash: hash of the pdf file
+        :param plix.config.Config config: pipeline config object
+        :param function compute: function to calculate the stage output
+        :param Any extra: additional input the output depends on, e.g. the domain knowledge
+
+        :returns: the stage output
+        :rtype: Any
+        """
+        key = self.key(stage, doc_hash, config, extra)
+        found, value = self.load(stage, key)
+        if found:
+            cf.log('Stage cache: reusing %s output', stage)
+            return value
+        value = compute(*args)
+        if isinstance(value, Incomplete):
+            cf.log('Stage cache: not saving the incomplete %s output (%s)', stage, value.reason)
+            return value.value
+        self.save(stage, key, value)
+        return value
+
+    def __entry_path(self, stage, key):
+        return os.path.join(self.cache_folder, stage, key + '.pkl')
+
+
+class Incomplete:
+    def __init__(self, value, reason):
+        """
+        Marks the output of a stage that failed, e.g. the pages that were read before an error. The output is used by
+        the pipeline, but it is not cached, so the stage runs again in the next run instead of reusing the failure.
+
+        :param Any value: the stage output
+        :param str reason: the error
+        """
+        self.value = value
+        self.reason = reason
@@ -0,0 +1,152 @@
+"""
+This class holds the pipeline steps as a graph of stages. Every stage declares the data it reads and writes: columns of
+the extraction results (e.g. 'allText') or whole artifacts (e.g. 'coordinates', 'kvu_text').
+
+A stage depends on the stages declared before it that write one of its inputs. The graph runs every stage as soon as
+the stages it depends on are finished, so independent branches run at the same time, e.g. the text and table KVU
+extraction, or the text extraction and the coordinate detection. The stages only orchestrate, the work is done in the
+worker pool of the pipeline, so threads are enough to run them concurrently.
+
+Example plan, see :meth:`StageGraph.format_plan`::
+
+    1. extract_coordinates      reads: pdfs                        writes: coordinates
+       extract_text             reads: FullPath                    writes: Text, cleanText, ...
+    2. extract_tables           reads: FullPath, coordinates       writes: TableData
+       classify_text            reads: allText                     writes: Classification, ClassificationCount
+"""
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import plix.helpers.common_functions as cf
+
+
+class Stage:
+    def __init__(self, name, func, inputs, outputs, enabled=True, cached=None):
+        """
+        A step of the pipeline.
+
+        :param str name: name of the stage
+        :param function func: function that runs the stage, it is called without arguments
+        :param list inputs: data the stage reads
+        :param list outputs: data the stage writes
+        :param bool enabled: whether the config needs the stage
+        :param function cached: optional function that returns how many documents of the stage are in the stage cache
+            and how many there are, it is only called for the plan
+        """
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.enabled = enabled
+        self.cached = cached
+
+    def __repr__(self):
+        return 'Stage({})'.format(self.name)
+
+
+class StageGraph:
+    def __init__(self, stages, available=None):
+        """
+        Builds the graph of the enabled stages.
+
+        :param list stages: the stages in the order of the pipeline, a stage can only depend on earlier stages
+        :param list available: data that is loaded before the run, e.g. the extraction results of the previous run
+        """
+        self.stages = [stage for stage in stages if stage.enabled]
+        self.available = set(available or [])
+        self.dependencies = {}
+        for i, stage in enumerate(self.stages):
+            self.dependencies[stage.name] = [previous.name for previous in self.stages[:i]
+                                             if set(previous.outputs) & set(stage.inputs)]
+
+    def get_missing_inputs(self, stage):
+        """
+        Returns the inputs of a stage that are neither loaded nor written by an earlier stage.
+
+        :param Stage stage: the stage
+
+        :returns: the missing inputs
+        :rtype: list
+        """
+        produced = set(self.available)
+        for previous in self.stages[:self.stages.index(stage)]:
+            produced.update(previous.outputs)
+        return [data for data in stage.inputs if data not in produced]
+
+    def get_plan(self):
+        """
+        Orders the stages in levels. The stages of a level only depend on stages of earlier levels, so they can run at
+        the same time.
+
+        :returns: the stages per level
+        :rtype: list
+        """
+        levels = {}
+        for stage in self.stages:
+            levels[stage.name] = 1 + max([levels[name] for name in self.dependencies[stage.name]], default=0)
+        return [[stage for stage in self.stages if levels[stage.name] == level]
+                for level in range(1, max(levels.values(), default=0) + 1)]
+
+    def format_plan(self):
+        """
+        Describes the execution plan, e.g. for a dry run.
+
+        :returns: one line per stage
+        :rtype: str
+        """
+        lines = []
+        for level, stages in enumerate(self.get_plan(), start=1):
+            for i, stage in enumerate(stages):
+                line = '{:<4}{:<27}reads: {:<40} writes: {}'.format(str(level) + '.' if i == 0 else '', stage.name,
+                                                                    ', '.join(stage.inputs) or '-',
+                                                                    ', '.join(stage.outputs))
+                if stage.cached is not None:
+                    line += ' ({}/{} documents cached)'.format(*stage.cached())
+                missing = self.get_missing_inputs(stage)
+                if missing:
+                    line += ' (not available: {})'.format(', '.join(missing))
+                lines.append(line)
+        if self.available:
+            lines.append('loaded: ' + ', '.join(sorted(self.available)))
+        return '\n'.join(lines) if lines else 'No stages to run'
+
+    def get_needed_inputs(self, finished):
+        """
+        Returns the data that the stages which are not finished yet still read.
+
+        :param set finished: names of the finished stages
+
+        :returns: the inputs of the other stages
+        :rtype: set
+        """
+        return {data for stage in self.stages if stage.name not in finished for data in stage.inputs}
+
+    def run(self, max_parallel=None, on_finished=None):
+        """
+        Runs the stages, every stage starts as soon as the stages it depends on are finished. If a stage fails, the
+        running stages are finished, no further stages are started and the error is raised.
+
+        :param int max_parallel: maximum number of stages that run at the same time, None for no limit
+        :param function on_finished: optional function that is called with the names of the finished stages after
+            every stage, e.g. to free data that no other stage reads
+        """
+        pending = list(self.stages)
+        finished = set()
+        running = {}
+        with ThreadPoolExecutor(max_workers=max_parallel or max(1, len(self.stages))) as executor:
+            while pending or running:
+                for stage in [stage for stage in pending if set(self.dependencies[stage.name]) <= finished]:
+                    if max_parallel and len(running) >= max_parallel:
+                        break
+                    pending.remove(stage)
+                    running[executor.submit(stage.func)] = stage
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    if future.exception() is not None:
+                        cf.log('Stage %s failed: %s', stage.name, future.exception(), level=logging.ERROR)
+                        wait(running)
+                        raise future.exception()
+                    finished.add(stage.name)
+                    if on_finished is not None:
+                        on_finished(set(finished))
@@ -4,11 +4,11 @@ Detects tables and calculates their bounding boxes.
 import os
 import pathlib
 
-import cv2
-import pytesseract
-
+import plix.classes.ocr_engine as oe
 import plix.helpers.common_functions as cf
 
+cv2 = cf.lazy_import('cv2')
+
 
 def get_tables_boundary(image_folder, table_image_folder, is_debug):
     """
@@ -22,51 +22,97 @@ def get_tables_boundary(image_folder, table_image_folder, is_debug):
     :rtype: dict
     """
     detected_table = {}
-    files = __get_files_in_directory(image_folder, extension='.png')
+    files = get_page_images(image_folder)
     if not files:
         cf.log("Table Coordinate Calculator: Error no image files found, returning..")
         return detected_table
     # read each image file
     for image_file in files:
-        img = cv2.imread(str(image_file))
-        if img is None:
-            cf.log("Table Coordinate Calculator: Error loading image {}, returning..".format(image_file))
+        page_table = get_image_tables_boundary(image_file, table_image_folder, is_debug)
+        if page_table is None:
             return detected_table
-
-        boxes = DetectTable(img).run()
-        # ignore small boxes or nested boxes (relative to the page size)
-        selected_boxes = _select_boxes(boxes, min_height=1, min_width=1)
-        # read each box >> crop to small images
-        # and check if the cropped image contains (readable) text
-        ind = 0
-        detected_table_count = 0
-        coordinates = []
-        # coordinate is [x1,y1,x2,y2] originates in top left corner
-        for b in selected_boxes:
-            # select the area from y1:y2, x1:x2
-            crop_img = img.copy()[b[1]:b[3], b[0]:b[2]]
-            # ocr for text in the cropped area
-            text_rows, text_boxes, text_img_ratio = _detect_text(crop_img)
-            # consider only a box with text more than one row
-            # and if the image contains at least 20% of text
-            # draw rectangles over the image (x1,y1), (x2,y2)
-            coordinates.append(b)
-            if is_debug:
-                cv2.rectangle(img, (b[0], b[1]), (b[2], b[3]), (0, 0, 255), 4)
-                # draw rectanles over the cropped image
-                for tb in text_boxes:
-                    cv2.rectangle(crop_img, (tb[0], tb[1]), (tb[2], tb[3]), (255, 0, 255), 2)
-            detected_table_count += 1
-            ind += 1
-        # save a page with boxes only if a table is detected
-        if detected_table_count > 0:
-            filename = os.path.basename(image_file)
-            if is_debug:
-                cv2.imwrite(str(pathlib.PurePath(table_image_folder, filename)), img)
-            detected_table[filename] = coordinates
+        detected_table.update(page_table)
     return detected_table
 
 
+def get_page_images(image_folder):
+    """
+    Lists the images of pdf pages in a folder, e.g. to detect the tables of every page in a separate task.
+
+    :param str image_folder: path to folder of converted pages to image
+
+    :returns: paths of the images
+    :rtype: list
+    """
+    return __get_files_in_directory(image_folder, extension='.png')
+
+
+def get_image_tables_boundary(image_file, table_image_folder, is_debug):
+    """
+    Detects tables in the image file of a pdf page.
+
+    :param str image_file: path to the image
+    :param str table_image_folder: folder where debug images are saved
+    :param bool is_debug: if this is set, an image with the bounding boxes of the tables is saved
+
+    :returns: the table coordinates per image name, empty if the page has no tables, None if the image can not be read
+    :rtype: dict
+    """
+    img = cv2.imread(str(image_file))
+    if img is None:
+        cf.log("Table Coordinate Calculator: Error loading image %s, returning..", image_file)
+        return None
+    filename = os.path.basename(image_file)
+    coordinates = get_page_tables_boundary(img, filename, table_image_folder, is_debug)
+    return {filename: coordinates} if coordinates else {}
+
+
+def get_page_tables_boundary(img, filename, table_image_folder, is_debug):
+    """
+    Detects tables in the image of a pdf page.
+
+    :param np.ndarray img: the page as single-channel uint8 (grayscale) or 3-channel BGR image, it is not changed
+    :param str filename: name of the page image, the debug image is saved with this name
+    :param str table_image_folder: folder where debug images are saved
+    :param bool is_debug: if this is set, an image with the bounding boxes of the tables is saved
+
+    :returns: the coordinates of the tables, [x1, y1, x2, y2] from the top left corner
+    :rtype: list
+    """
+    boxes = DetectTable(img).run()
+    if is_debug:
+        # the boxes are drawn in colour on a copy
+        img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR) if len(img.shape) == 2 else img.copy()
+    # ignore small boxes or nested boxes (relative to the page size)
+    selected_boxes = _select_boxes(boxes, min_height=1, min_width=1)
+    # read each box >> crop to small images
+    # and check if the cropped image contains (readable) text
+    ind = 0
+    detected_table_count = 0
+    coordinates = []
+    # coordinate is [x1,y1,x2,y2] originates in top left corner
+    for b in selected_boxes:
+        # select the area from y1:y2, x1:x2
+        crop_img = img[b[1]:b[3], b[0]:b[2]].copy()
+        # ocr for text in the cropped area
+        text_rows, text_boxes, text_img_ratio = _detect_text(crop_img)
+        # consider only a box with text more than one row
+        # and if the image contains at least 20% of text
+        # draw rectangles over the image (x1,y1), (x2,y2)
+        coordinates.append(b)
+        if is_debug:
+            cv2.rectangle(img, (b[0], b[1]), (b[2], b[3]), (0, 0, 255), 4)
+            # draw rectanles over the cropped image
+            for tb in text_boxes:
+                cv2.rectangle(crop_img, (tb[0], tb[1]), (tb[2], tb[3]), (255, 0, 255), 2)
+        detected_table_count += 1
+        ind += 1
+    # save a page with boxes only if a table is detected
+    if detected_table_count > 0 and is_debug:
+        cv2.imwrite(str(pathlib.PurePath(table_image_folder, filename)), img)
+    return coordinates
+
+
 def _select_boxes(boxes, min_height=0, min_width=0):
     # select only if the width and height are enough
     selected_boxes = []
@@ -78,8 +124,9 @@ def _select_boxes(boxes, min_height=0, min_width=0):
 
 
 def _detect_text(img):
-    text = pytesseract.image_to_string(img, lang='eng', config='--psm 12 --oem 3')
-    boxes = pytesseract.image_to_boxes(img)
+    engine = oe.get_engine()
+    text = engine.image_to_string(img, psm=12, oem=3)
+    boxes = engine.image_to_boxes(img)
     img_h = img.shape[0]
     img_w = img.shape[1]
     row_boxes = boxes.split('\n')
@@ -14,22 +14,37 @@ The resulting file has the following format:
 import os
 
 import PIL
+import numpy as np
 import pandas as pd
 import pytesseract
-from pdf2image import convert_from_path
 
+import plix.classes.metrics_collector as mc
+import plix.classes.page_image_cache as pic
+import plix.classes.pdf_session as ps
 import plix.classes.table_coordinate_calculator as tcc
 import plix.helpers.common_functions as cf
+import plix.helpers.scheduling_utils as su
 
 SPLIT_THRESHOLD = 40
+# resolution of the page images for the table detection
+COORDINATE_DPI = 300
+# number of pages that are rendered at once, the images of a document are not all held in memory
+RENDER_BATCH_PAGES = 10
 
 
 def extract_coordinates(pdf_paths, image_folder, table_image_folder, table_modes, tesser_path, method='opencv',
-                        is_debug=False):
+                        is_debug=False, worker_pool=None, in_memory=False):
     """
     This func contains the main functionality. It calls the coordinate calculation and then stores all important data
     in a dataframe.
 
+    With `in_memory`, the pages go from the page image cache to the table detection as single-channel uint8 arrays,
+    without writing and reading PNG files. The page images are only saved in debug mode.
+
+    With a worker pool, the pages are detected in parallel: every task renders and scans a range of pages of a document
+    (or a single page image from the disk), so a long document is spread over all workers. The results are merged into
+    the same {image name: coordinates} structure.
+
     :param list pdf_paths: paths to all pdfs
     :param str image_folder: path to where the converted images are saved
     :param str table_image_folder: path to where the images of the found tables are saved
@@ -37,14 +52,53 @@ def extract_coordinates(pdf_paths, image_folder, table_image_folder, table_modes
     :param str tesser_path: path to Tesseract exe
     :param str method: one of the two methods
     :param bool is_debug: set debug parameter, will save the images of the detected tables if set to True
+    :param plix.classes.worker_pool.WorkerPool worker_pool: optional pool to convert and scan the documents in parallel
+    :param bool in_memory: pass the page images to the table detection in memory instead of as PNG files
     """
     if os.name == "nt":
         pytesseract.pytesseract.tesseract_cmd = tesser_path
 
     df = pd.DataFrame(pdf_paths, columns=['FullPath'])
-    if method.lower() == 'opencv':
-        df['size'] = df['FullPath'].apply(lambda file: __calculate_size(file, image_folder, table_modes))
-        coordinates = tcc.get_tables_boundary(image_folder, table_image_folder, is_debug)
+    if method.lower() == 'opencv' and in_memory:
+        page_counts = {file: su.count_pages(file) for file in df['FullPath']
+                       if cf.get_mode(file, table_modes) not in ['no_table', 'lattice']}
+        batch_pages = __get_batch_pages(page_counts, worker_pool)
+        inputs = [(file, first_page, min(first_page + batch_pages - 1, page_count), page_count, image_folder,
+                   table_image_folder, table_modes, is_debug)
+                  for file, page_count in page_counts.items() for first_page in range(1, page_count + 1, batch_pages)]
+        if worker_pool is None:
+            results = [__detect_page_tables(*args) for args in inputs]
+        else:
+            results = worker_pool.starmap(__detect_page_tables, inputs, stage='table_detection')
+        sizes = {}
+        coordinates = {}
+        for args, (size, page_boundaries) in zip(inputs, results):
+            sizes[args[0]] = sizes.get(args[0]) or size
+            coordinates.update(page_boundaries)
+        df['size'] = pd.Series([sizes.get(file, []) for file in df['FullPath']], index=df.index, dtype=object)
+        df['tableCoords'] = df['FullPath'].apply(lambda file: __find_coordinates(file, coordinates, table_modes))
+    elif method.lower() == 'opencv':
+        if worker_pool is None:
+            df['size'] = df['FullPath'].apply(lambda file: __calculate_size(file, image_folder, table_modes))
+        else:
+            inputs = [(file, image_folder, table_modes) for file in df['FullPath']]
+            sizes = worker_pool.starmap(__calculate_size, inputs, stage='rasterization')
+            df['size'] = pd.Series(sizes, index=df.index, dtype=object)
+        # only detect tables in the images of the given documents, the image folder may hold pages of other runs
+        coordinates = {}
+        doc_folders = {__get_document_folder(file, image_folder): file for file, size in zip(df['FullPath'], df['size'])
+                       if size}
+        if worker_pool is None:
+            boundaries = [__get_tables_boundary(file, doc_folder, table_image_folder, is_debug)
+                          for doc_folder, file in sorted(doc_folders.items())]
+        else:
+            # one task per page image
+            inputs = [(file, image_file, table_image_folder, is_debug)
+                      for doc_folder, file in sorted(doc_folders.items())
+                      for image_file in tcc.get_page_images(doc_folder)]
+            boundaries = worker_pool.starmap(__get_image_tables_boundary, inputs, stage='table_detection')
+        for document_boundaries in boundaries:
+            coordinates.update(document_boundaries)
         df['tableCoords'] = df['FullPath'].apply(lambda file: __find_coordinates(file, coordinates, table_modes))
     else:
         raise ValueError('No or wrong method specified. Please use opencv')
@@ -63,6 +117,10 @@ def __get_short_name(name):
     return name.replace(' ', '')[:SPLIT_THRESHOLD].rstrip()
 
 
+def __get_document_folder(file, target_folder):
+    return os.path.join(target_folder, __get_short_name(__get_filename(file)))
+
+
 # ---------------
 # Functionality
 
@@ -77,15 +135,16 @@ def __filter_boxes(boxes, box_type):
                 f_box = {'page': int(file.split('-')[-1].split('.')[0]), 'box': b['box']}
                 # add to box_type
                 filtered_boxes.append(f_box)
-    cf.log("Table Extraction: Found " + str(len(filtered_boxes)) + " " + box_type + " coordinates")
+    cf.log("Table Extraction: Found %d %s coordinates", len(filtered_boxes), box_type)
     return filtered_boxes
 
 
+@mc.measured('rasterization')
 def __calculate_size(file, target_folder, table_modes):
     # call opencv
     # if no images in config opencv input -> make input
     name = __get_filename(file)
-    file_folder = os.path.join(target_folder, __get_short_name(name))
+    file_folder = __get_document_folder(file, target_folder)
 
     table_cat = cf.get_mode(file, table_modes)
     if table_cat not in ['no_table', 'lattice']:
@@ -95,10 +154,8 @@ def __calculate_size(file, target_folder, table_modes):
         im_paths = os.listdir(file_folder)
         if not im_paths:
             # if no images have been converted yet
-            cf.log("Coordinate Extraction: " + name + " No images found. Converting pdf to images...")
-            _ = convert_from_path(file, dpi=300, output_folder=file_folder,
-                                  output_file=table_cat + "_" + name[:SPLIT_THRESHOLD] + "-300-", fmt='png',
-                                  grayscale=True, thread_count=4)  # pdf2image
+            cf.log("Coordinate Extraction: %s No images found. Converting pdf to images...", name)
+            __render_page_images(file, file_folder, table_cat + "_" + name[:SPLIT_THRESHOLD] + "-300-")
             im_paths = os.listdir(file_folder)
 
         return list(PIL.Image.open(os.path.join(file_folder, im_paths[0])).size)
@@ -106,13 +163,70 @@ def __calculate_size(file, target_folder, table_modes):
         return []
 
 
+def __render_page_images(file, file_folder, prefix):
+    # the images stay in the page image cache for the OCR of the tables, the files are named like the ones of pdftoppm
+    page_count = ps.get_page_count(file)
+    cache = pic.get_cache()
+    for first_page in range(1, page_count + 1, RENDER_BATCH_PAGES):
+        last_page = min(first_page + RENDER_BATCH_PAGES - 1, page_count)
+        images = cache.get_document(file, COORDINATE_DPI, pic.GRAYSCALE, first_page=first_page, last_page=last_page)
+        for page, image in images.items():
+            image.save(os.path.join(file_folder, '{}-{:0{}d}.png'.format(prefix, page, len(str(page_count)))))
+
+
+@mc.measured('table_detection')
+def __get_tables_boundary(file, doc_folder, table_image_folder, is_debug):
+    return tcc.get_tables_boundary(doc_folder, table_image_folder, is_debug)
+
+
+def __get_image_tables_boundary(file, image_file, table_image_folder, is_debug):
+    with mc.measure('table_detection', file, pages=1):
+        return tcc.get_image_tables_boundary(image_file, table_image_folder, is_debug) or {}
+
+
+def __get_batch_pages(page_counts, worker_pool):
+    # pages per task, smaller than the render batch if there are fewer pages than workers can take
+    if worker_pool is None:
+        return RENDER_BATCH_PAGES
+    return max(1, min(RENDER_BATCH_PAGES, -(-sum(page_counts.values()) // worker_pool.processes)))
+
+
+def __detect_page_tables(file, first_page, last_page, page_count, target_folder, table_image_folder, table_modes,
+                         is_debug):
+    # renders a range of pages and scans them in memory, returns the size of the page images and the coordinates per
+    # page, keyed by the names the page images have on disk
+    name = __get_filename(file)
+    prefix = cf.get_mode(file, table_modes) + "_" + name[:SPLIT_THRESHOLD] + "-300-"
+    file_folder = __get_document_folder(file, target_folder)
+    if is_debug:
+        os.makedirs(file_folder, exist_ok=True)
+    size = []
+    coordinates = {}
+    with mc.measure('table_detection', file, pages=last_page - first_page + 1):
+        images = pic.get_cache().get_document(file, COORDINATE_DPI, pic.GRAYSCALE, first_page=first_page,
+                                              last_page=last_page)
+        for page, image in images.items():
+            filename = '{}-{:0{}d}.png'.format(prefix, page, len(str(page_count)))
+            if is_debug:
+                image.save(os.path.join(file_folder, filename))
+            size = size or list(image.size)
+            # the page stays in the page image cache for the OCR of the tables, the detection gets its own copy of the
+            # pixels, so the cached image is not changed
+            page_coordinates = tcc.get_page_tables_boundary(np.array(image, dtype=np.uint8), filename,
+                                                            table_image_folder, is_debug)
+            if page_coordinates:
+                coordinates[filename] = page_coordinates
+    cf.log("Coordinate Extraction: %s pages %d-%d scanned in memory", name, first_page, last_page)
+    return size, coordinates
+
+
 def __find_coordinates(file, coordinates, table_modes):
     name = __get_filename(file)
     table_coords = []
     if 'no_table' in file or 'lattice' in file:
         return table_coords
 
-    cf.log("Getting the coordinates for " + name)
+    cf.log("Getting the coordinates for %s", name)
     short_name = name[:SPLIT_THRESHOLD]
     table_cat = cf.get_mode(file, table_modes)
     for key, value in coordinates.items():
@@ -123,5 +237,5 @@ def __find_coordinates(file, coordinates, table_modes):
                 # value = list of lists of coordinates
                 table_coord = {'page': page, 'box': box}
                 table_coords.append(table_coord)
-    cf.log("Table Extraction: Found " + str(len(table_coords)) + " coordinates")
+    cf.log("Table Extraction: Found %d coordinates", len(table_coords))
     return table_coords
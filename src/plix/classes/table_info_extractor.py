@@ -10,13 +10,12 @@ The resulting files have the following format:
 +-----------+------------------+-----+--------------------------------------+---------------------+------------------------------------------------------+--------------------------------+-------------------------------+
 """
 import pandas as pd
-from nltk import edit_distance
-from nltk import ngrams
-
 import plix.helpers.common_functions as cf
 import plix.helpers.extraction_utils as eu
 import plix.helpers.kvu_utils as kvuu
 
+nltk = cf.lazy_import('nltk')
+
 
 def extract_table_kvu(df, labels, units, do_pivot_search, normalized_input=True, unit_check=True, use_synonyms=True,
                       lev_dist=1):
@@ -81,13 +80,13 @@ def __find_tuples(tables, files, classes, labels, units, do_pivot_search, unit_c
                         results.append(possible_kvu_tuple)
                         count += 1
                         continue
-    cf.log("Found " + str(count) + " key-value-unit tuples")
+    cf.log("Found %d key-value-unit tuples", count)
     return results
 
 
 def __extract_ngrams(cell, synonym):
     n = len(synonym.split(" "))
-    return list(ngrams(cell.split(" "), n))
+    return list(nltk.ngrams(cell.split(" "), n))
 
 
 def __match_key_value_unit(table, row, key, units, file, t_num, classes, j, do_pivot_search, unit_check, use_synonyms,
@@ -100,7 +99,7 @@ def __match_key_value_unit(table, row, key, units, file, t_num, classes, j, do_p
             n_grams = __extract_ngrams(cell, synonym)
             for gram in n_grams:
                 gram = " ".join(word for word in gram)
-                if edit_distance(gram, synonym) <= lev_dist:
+                if nltk.edit_distance(gram, synonym) <= lev_dist:
                     # if synonym in cell:
                     value, unit = __find_value_unit(table, j, k, units_and_symbols, do_pivot_search, unit_check)
                     if kvuu.is_value_unit_sane(value, unit, (units_and_symbols['allowed_symbols'] +
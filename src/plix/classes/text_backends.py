@@ -0,0 +1,102 @@
+"""
+This class holds the backends that read the raw text of the pdf pages. The backend is chosen with
+`config.text_backend`:
+
+* 'pdfminer': layout analysis of pdfminer, the characters are grouped into text boxes (default)
+* 'pdfminer_raw': pdfminer without layout analysis, the characters are joined in the order of the content stream.
+  Blocks that are drawn last come last, e.g. the title and authors of a paper can follow the abstract
+* 'pdfium': text extraction of PDFium, much faster for born-digital pdfs, it needs the optional dependency pypdfium2
+  (`pip install plix[pdfium]`)
+
+All backends yield the text page by page, with the page numbers starting at 0. The text of the different
+backends differs in the order and the whitespace, the KVU extraction is tuned to the default backend, see
+`benchmarks/text_backends.py`.
+"""
+import re
+
+import plix.classes.pdf_session as ps
+
+DEFAULT_BACKEND = 'pdfminer'
+# PDFium marks a hyphen at the end of a line with U+FFFE and joins the lines, soft hyphens are U+00AD
+SOFT_HYPHEN_PATTERN = re.compile('[\ufffe\xad](\r?\n)?')
+
+
+def get_backend(name):
+    """
+    Returns a text backend.
+
+    :param str name: name of the backend, see :data:`BACKENDS`
+
+    :returns: the backend
+    :rtype: TextBackend
+    """
+    if name not in BACKENDS:
+        raise ValueError("Unknown text backend '{}', please use one of {}".format(name, ', '.join(BACKENDS)))
+    return BACKENDS[name]()
+
+
+class TextBackend:
+    name = None
+
+    def iter_pages(self, full_path, first_page=0, last_page=None):
+        """
+        Reads the text of a range of pages of a pdf file. The pages are yielded as soon as they are read, so the caller
+        keeps the pages before an error.
+
+        :param str full_path: path to the pdf file
+        :param int first_page: number of the first page to read, starting at 0
+        :param int last_page: number of the page after the last page to read, None to read until the end
+
+        :returns: the page numbers and texts
+        :rtype: Iterator[tuple]
+        """
+        raise NotImplementedError
+
+
+class PdfminerBackend(TextBackend):
+    name = 'pdfminer'
+    layout = True
+
+    def iter_pages(self, full_path, first_page=0, last_page=None):
+        session = ps.get_session(full_path)
+        last_page = session.page_count if last_page is None else min(last_page, session.page_count)
+        for i in range(first_page, last_page):
+            yield i, session.get_page_texts(i, i + 1, layout=self.layout)[i]
+
+
+class PdfminerRawBackend(PdfminerBackend):
+    name = 'pdfminer_raw'
+    layout = False
+
+
+class PdfiumBackend(TextBackend):
+    name = 'pdfium'
+
+    def __init__(self):
+        self.__pdfium = self.__import_pdfium()
+
+    def iter_pages(self, full_path, first_page=0, last_page=None):
+        pdf = self.__pdfium.PdfDocument(full_path)
+        try:
+            last_page = len(pdf) if last_page is None else min(last_page, len(pdf))
+            for i in range(first_page, last_page):
+                page = pdf[i]
+                text_page = page.get_textpage()
+                text = text_page.get_text_range()
+                text_page.close()
+                page.close()
+                yield i, SOFT_HYPHEN_PATTERN.sub('', text).replace('\r\n', '\n').replace('\xa0', ' ')
+        finally:
+            pdf.close()
+
+    @staticmethod
+    def __import_pdfium():
+        try:
+            import pypdfium2
+        except ImportError as ex:
+            raise ImportError("text_backend 'pdfium' needs pypdfium2, install it with: pip install pypdfium2") from ex
+        return pypdfium2
+
+
+# backends per name
+BACKENDS = {backend.name: backend for backend in [PdfminerBackend, PdfminerRawBackend, PdfiumBackend]}
@@ -25,7 +25,7 @@ def __do_text_classification(df):
     texts = df['allText']
     files = df['Filename']
     for i, (t, f) in enumerate(zip(texts, files)):
-        cf.log('Classifying ' + f)
+        cf.log('Classifying %s', f)
         # include file name ( = title) since it is not extracted sometimes
         text = f + ' ' + t
         found_classes = []
@@ -5,12 +5,13 @@ from a dataframe.
 
 import re
 
-from nltk import sent_tokenize
-
+import plix.classes.tokenizer as tk
 import plix.helpers.common_functions as cf
 import plix.helpers.extraction_utils as eu
 import plix.helpers.kvu_utils as kvuu
 
+nltk = cf.lazy_import('nltk')
+
 
 def extract_text_kvu(df, keywords, units, max_len_text):
     """
@@ -43,7 +44,7 @@ def __find_tuples(text_pages, files, classes, keywords, units, max_len_text):
                 if key_kvu_tuples:
                     results = results + key_kvu_tuples
                     count += len(key_kvu_tuples)
-    cf.log("Found " + str(count) + " key-value-unit tuples")
+    cf.log("Found %d key-value-unit tuples", count)
     return results
 
 
@@ -90,7 +91,8 @@ def __get_left_and_right_text_window(text, key, match_start_pos, max_len_text):
     shorten_right_bound = match_start_pos + max_len_text if (match_start_pos + max_len_text) < text_len \
         else text_len - 1
     shortened_text = text[shorten_left_bound:shorten_right_bound]
-    sentences = sent_tokenize(shortened_text)
+    tk.ensure_nltk_data()
+    sentences = nltk.sent_tokenize(shortened_text)
     ind = __get_key_sentence_index(key, sentences)
     sentence = sentences[ind]
     split_sentence = re.split(key, sentence, maxsplit=1)
@@ -12,22 +12,29 @@ import os
 import re
 from itertools import chain
 
-import nltk
-
+import plix.helpers.common_functions as cf
 import plix.nlp_assets as nlp_assets
 
-try:
-    nltk.data.find("words")
-except LookupError:
-    nltk.download("words", quiet=True)
-try:
-    nltk.data.find("omw-1.4")
-except LookupError:
-    nltk.download("omw-1.4", quiet=True)
-try:
-    nltk.data.find("punkt")
-except LookupError:
-    nltk.download("punkt", quiet=True)
+nltk = cf.lazy_import('nltk')
+
+# nltk resources that are downloaded if they are missing
+NLTK_RESOURCES = ["words", "omw-1.4", "punkt"]
+_nltk_data_checked = False
+
+
+def ensure_nltk_data():
+    """
+    Downloads the nltk resources, if they are missing. The check runs once per process.
+    """
+    global _nltk_data_checked
+    if _nltk_data_checked:
+        return
+    for resource in NLTK_RESOURCES:
+        try:
+            nltk.data.find(resource)
+        except LookupError:
+            nltk.download(resource, quiet=True)
+    _nltk_data_checked = True
 
 
 def whitespace_tokenize(text):
@@ -55,6 +62,7 @@ def tokenize(text):
     :returns: the tokenized text
     :rtype: list
     """
+    ensure_nltk_data()
     data = nltk.word_tokenize(text)
     for i, word in enumerate(data):
         data[i] = re.findall(nlp_assets.REGEX['tokenize'], data[i], re.UNICODE)
@@ -98,6 +106,7 @@ class Tokenizer:
         :param list or set to_add: list of words to add to the dictionary
         """
         # set of all english words from nltk
+        ensure_nltk_data()
         english = set(w.lower() for w in nltk.corpus.words.words())
         new_vocab = sorted(list(set.union(english, set(to_add))))  # cast to set to remove duplicates
         # write vocabulary to file to load later
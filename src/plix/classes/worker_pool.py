@@ -0,0 +1,591 @@
+"""
+This class holds a long-lived pool of worker processes that is shared by all pipeline stages (text, table, coordinate,
+normalization and KVU extraction).
+
+Each worker loads the heavy modules (camelot, cv2, pint, pdfminer, ...) and assets (tokenizer, config, domain knowledge,
+spellchecker) once in its initializer. Tasks reference the assets with :class:`AssetRef` objects, so only the name of
+an asset is pickled per task and not e.g. the whole vocabulary of the tokenizer.
+Workers are recycled after `max_tasks_per_child` tasks to contain the memory growth of pdfminer and camelot.
+A task can limit its wall time and memory with :func:`limits`. As this can not interrupt a task that hangs in C code or
+whose worker is killed, e.g. by the kernel when the memory runs out, the parent checks the running tasks as well: a
+task whose worker died or that exceeded its deadline is given up, the workers are restarted and the other running
+tasks are sent again, see :meth:`WorkerPool.imap_unordered`.
+
+If the pool has memory estimates per stage, the number of tasks of a stage that run at the same time is chosen from
+the free memory and the memory a task of the stage needs, see :meth:`WorkerPool.get_stage_workers`. The workers
+measure the peak memory of every task, so the estimates are replaced by measured values during the run, e.g. fewer
+OCR tasks and more KVU tasks run at the same time.
+"""
+import importlib
+import itertools
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing import Pool
+
+import numpy as np
+
+import plix.classes.metrics_collector as mc
+import plix.classes.ocr_engine as oe
+import plix.classes.page_image_cache as pic
+import plix.helpers.common_functions as cf
+
+# modules that are expensive to import, they are loaded when a worker starts
+PRELOADED_MODULES = ['plix.classes.pdf_data_extractor', 'plix.classes.table_coordinate_calculator',
+                     'plix.helpers.kvu_utils']
+# third-party modules that are imported lazily, they are loaded when a worker starts if a step of the config needs them
+PRELOADED_STEP_MODULES = {
+    'do_table': ['camelot', 'cv2'],
+    'do_new_coordinates': ['cv2'],
+    'do_normalization': ['nltk'],
+    'do_text_info_extraction': ['nltk', 'pint'],
+    'do_table_info_extraction': ['nltk', 'pint'],
+}
+
+# seconds between two memory checks of :func:`limits`
+MEMORY_CHECK_INTERVAL = 0.5
+# memory in MB that a task of a stage without estimate needs on top of the idle worker, until a task was measured
+DEFAULT_STAGE_MEMORY_MB = 500
+# seconds between two checks of the running tasks by the parent
+TASK_CHECK_INTERVAL = 1.0
+
+_worker_assets = {}
+# queue of the current worker to report the start of a task to the parent
+_started_queue = None
+
+
+class LimitExceeded(BaseException):
+    """
+    Raised by :func:`limits` if a task runs too long or uses too much memory. It is no subclass of Exception, so the
+    error handling of the extraction functions, which catches all exceptions of a pdf, does not swallow it.
+    """
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class TaskLost(Exception):
+    """
+    Raised for a task that the parent gave up, because its worker died or it exceeded its deadline.
+    """
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class AssetRef:
+    """
+    Reference to an asset that is loaded in every worker. It is resolved to the asset before a task is run.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return 'AssetRef({})'.format(self.name)
+
+
+def get_asset(name):
+    """
+    Returns an asset of the current worker process.
+
+    :param str name: name of the asset
+
+    :returns: the asset or None if it is not loaded
+    :rtype: Any
+    """
+    return _worker_assets.get(name)
+
+
+def _init_worker(assets, log_queue, started_queue):
+    global _started_queue
+    _started_queue = started_queue
+    cf.init_worker_logging(log_queue)
+    _worker_assets.update(assets)
+    for module in PRELOADED_MODULES:
+        importlib.import_module(module)
+    config = assets.get('config')
+    mc.configure(config)
+    pic.configure(config)
+    oe.configure(config)
+    if config is not None:
+        for step, modules in PRELOADED_STEP_MODULES.items():
+            if getattr(config, step, False):
+                for module in modules:
+                    importlib.import_module(module)
+        if os.name == "nt":
+            importlib.import_module('pytesseract').pytesseract.tesseract_cmd = config.tesseract_path
+        importlib.import_module('plix.classes.pdf_data_extractor').get_spellchecker(config.vocab_file)
+        if config.do_text_info_extraction or config.do_table_info_extraction:
+            importlib.import_module('plix.helpers.kvu_utils').get_unit_registry()
+
+
+@contextmanager
+def limits(timeout=None, max_memory_mb=None):
+    """
+    Limits the wall time and the memory (RSS) of the code in the `with` block. If a limit is exceeded,
+    :class:`LimitExceeded` is raised in the block with the reason 'timeout' or 'memory'.
+
+    The limits are enforced with SIGALRM, so they only work in the main thread on POSIX systems, e.g. in the workers.
+    Elsewhere, the block runs without limits. Code that runs in C extensions or waits for a subprocess is interrupted
+    as soon as it returns to Python. For code that never returns, the parent gives up the task after its deadline, see
+    :meth:`WorkerPool.imap_unordered`.
+
+    :param float timeout: maximum wall time in seconds, None for no limit
+    :param float max_memory_mb: maximum RSS of the process in MB, None for no limit
+    """
+    if (not timeout and not max_memory_mb) or not hasattr(signal, 'SIGALRM') \
+            or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+    state = {'active': True, 'reason': 'timeout'}
+
+    def handler(signum, frame):
+        if state['active']:
+            state['active'] = False
+            raise LimitExceeded(state['reason'])
+
+    previous_handler = signal.signal(signal.SIGALRM, handler)
+    stop = threading.Event()
+    watchdog = None
+    if max_memory_mb:
+        watchdog = threading.Thread(target=_watch_memory, args=(max_memory_mb, state, stop), daemon=True)
+        watchdog.start()
+    if timeout:
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        yield
+    finally:
+        state['active'] = False
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        stop.set()
+        if watchdog is not None:
+            watchdog.join()
+        signal.signal(signal.SIGALRM, previous_handler)
+
+
+def _watch_memory(max_memory_mb, state, stop):
+    while not stop.wait(MEMORY_CHECK_INTERVAL):
+        rss = mc.get_rss_mb()
+        if rss is not None and rss > max_memory_mb:
+            state['reason'] = 'memory'
+            signal.pthread_kill(threading.main_thread().ident, signal.SIGALRM)
+            return
+
+
+def _resolve(arg):
+    return _worker_assets[arg.name] if isinstance(arg, AssetRef) else arg
+
+
+def _run_task(task):
+    func, args = task
+    return func(*[_resolve(arg) for arg in args])
+
+
+def _run_measured_task(task):
+    # returns the memory the task needed on top of the idle worker, it is used to size the stages
+    rss = mc.get_rss_mb()
+    with mc.track_peak_rss() as peak:
+        value = _run_task(task)
+    peak_rss = peak['peak_rss_mb']
+    return value, None if rss is None or peak_rss is None else max(0.0, peak_rss - rss)
+
+
+def _run_tracked_task(task):
+    # reports the start to the parent, so it can check the deadline of the task and notice if the worker dies
+    task_id, measured, func, args = task
+    _started_queue.put((task_id, os.getpid()))
+    return _run_measured_task((func, args)) if measured else (_run_task((func, args)), None)
+
+
+def _is_alive(pid):
+    # signal 0 only checks that the process exists, on Windows os.kill would stop it
+    if os.name != 'posix':
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def split_dataframe(df, parts):
+    """
+    Splits a dataframe into row partitions of equal size.
+
+    :param pd.DataFrame df: the dataframe
+    :param int parts: number of partitions
+
+    :returns: the partitions
+    :rtype: list
+    """
+    parts = max(1, min(parts, len(df.index)))
+    return [df.iloc[idx] for idx in np.array_split(np.arange(len(df.index)), parts)]
+
+
+class _Task:
+    # a task that was sent to the workers and is not finished yet
+    def __init__(self, func, args, measured, deadline, on_lost, callback, error_callback):
+        self.func = func
+        self.args = args
+        self.measured = measured
+        self.deadline = deadline
+        self.on_lost = on_lost
+        self.callback = callback
+        self.error_callback = error_callback
+        self.pid = None
+        self.started = None
+        self.missing = False
+
+
+class WorkerPool:
+    def __init__(self, processes, assets=None, max_tasks_per_child=None, memory_estimates=None, memory_reserve_mb=0,
+                 in_process_max_rows=0):
+        self.processes = max(1, processes)
+        self.assets = assets if assets is not None else {}
+        self.max_tasks_per_child = max_tasks_per_child
+        # memory in MB a task needs on top of the idle worker per stage, None to always use all workers
+        self.memory_estimates = memory_estimates
+        # memory in MB that is kept free for the main process and the system
+        self.memory_reserve_mb = memory_reserve_mb
+        # dataframes with at most this many rows are processed in the main process while the workers are not running
+        self.in_process_max_rows = in_process_max_rows
+        self.__pool = None
+        self.__started = None
+        self.__measured_memory = {}
+        self.__lock = threading.Lock()
+        # running tasks per id, a task gets a new id when it is sent again
+        self.__tasks = {}
+        self.__task_ids = itertools.count()
+        self.__task_lock = threading.RLock()
+        self.__watcher = None
+        self.__stop_watcher = threading.Event()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+
+    def start(self):
+        """
+        Starts the worker processes, if they are not running yet.
+        """
+        with self.__task_lock:
+            if self.__pool is None:
+                cf.log('Starting worker pool with %d processes', self.processes)
+                self.__pool, self.__started = self.__create_pool()
+                self.__stop_watcher = threading.Event()
+                self.__watcher = threading.Thread(target=self.__watch_tasks, args=(self.__stop_watcher,), daemon=True)
+                self.__watcher.start()
+
+    def close(self):
+        """
+        Waits for all tasks to finish and stops the workers.
+        """
+        if self.__pool is not None:
+            self.__stop_watching()
+            self.__pool.close()
+            self.__pool.join()
+            self.__pool = None
+
+    def terminate(self):
+        """
+        Stops the workers immediately. Tasks that are still running fail with :class:`TaskLost`.
+        """
+        if self.__pool is not None:
+            self.__stop_watching()
+            self.__pool.terminate()
+            self.__pool.join()
+            self.__pool = None
+            with self.__task_lock:
+                tasks = list(self.__tasks.values())
+                self.__tasks.clear()
+            for task in tasks:
+                task.error_callback(TaskLost('terminated'))
+
+    def ref(self, name):
+        """
+        Creates a reference to an asset of the workers.
+
+        :param str name: name of the asset
+
+        :returns: the reference
+        :rtype: AssetRef
+        """
+        if name not in self.assets:
+            raise KeyError('Worker pool has no asset ' + name)
+        return AssetRef(name)
+
+    def get_stage_memory(self, stage):
+        """
+        Returns the memory a task of a stage needs on top of the idle worker: the largest measured one, or the estimate
+        if no task of the stage is finished yet.
+
+        :param str stage: name of the stage
+
+        :returns: the memory in MB
+        :rtype: float
+        """
+        with self.__lock:
+            if stage in self.__measured_memory:
+                return self.__measured_memory[stage]
+        return self.memory_estimates.get(stage, DEFAULT_STAGE_MEMORY_MB)
+
+    def get_stage_workers(self, stage, running=0):
+        """
+        Returns how many tasks of a stage may run at the same time. Without memory estimates, all workers are used.
+        Otherwise, as many tasks as fit into the free memory minus `memory_reserve_mb` are added to the running ones.
+        It is checked again whenever a task is finished, so the number adapts to the memory of the other stages.
+
+        :param str stage: name of the stage
+        :param int running: number of tasks of the stage that are running
+
+        :returns: the number of tasks, at least 1 and at most the number of workers
+        :rtype: int
+        """
+        if self.memory_estimates is None or stage is None:
+            return self.processes
+        available = mc.get_available_memory_mb()
+        if available is None:
+            return self.processes
+        task_memory = max(1.0, self.get_stage_memory(stage))
+        workers = running + int((available - self.memory_reserve_mb) // task_memory)
+        return max(1, min(self.processes, workers))
+
+    def starmap(self, func, iterable, stage=None):
+        """
+        Runs `func` for every argument tuple and returns the results in order.
+
+        :param function func: module-level function to run
+        :param iterable iterable: argument tuples, may contain :class:`AssetRef` objects
+        :param str stage: name of the stage, it limits the tasks that run at the same time, see
+            :meth:`get_stage_workers`
+
+        :returns: the results
+        :rtype: list
+        """
+        self.start()
+        results = dict(self.__imap(func, iterable, stage))
+        return [results[i] for i in range(len(results))]
+
+    def apply(self, func, args, deadline=None, on_lost=None):
+        """
+        Runs `func(*args)` in a worker and waits for the result. It can be called from several threads at once.
+
+        :param function func: module-level function to run
+        :param tuple args: arguments, may contain :class:`AssetRef` objects
+        :param float deadline: seconds after which the task is given up, see :meth:`imap_unordered`
+        :param function on_lost: function that returns the result of a task that was given up, see
+            :meth:`imap_unordered`
+
+        :returns: the result
+        :rtype: Any
+        """
+        self.start()
+        finished = queue.Queue()
+        self.__submit(_Task(func, args, False, deadline, on_lost, callback=lambda value: finished.put((value, None)),
+                            error_callback=lambda ex: finished.put((None, ex))))
+        value, error = finished.get()
+        if error is not None:
+            raise error
+        return value[0]
+
+    def imap_unordered(self, func, iterable, stage=None, deadline=None, on_lost=None):
+        """
+        Runs `func` for every argument tuple and yields the results as soon as they are finished.
+
+        A task is given up if its worker dies, e.g. when it is killed by the kernel because the memory ran out, or if it
+        runs longer than `deadline`. Then, the workers are restarted, since a worker that hangs can not be stopped
+        otherwise, and the other running tasks are sent again. The result of the task is `on_lost(args, reason)`
+        with the reason 'timeout' or 'worker died'. Without `on_lost`, :class:`TaskLost` is raised.
+        If a task fails, no further tasks are started and the running ones are waited for before the error is raised.
+
+        :param function func: module-level function to run
+        :param iterable iterable: argument tuples, may contain :class:`AssetRef` objects
+        :param str stage: name of the stage, it limits the tasks that run at the same time, see
+            :meth:`get_stage_workers`
+        :param float deadline: seconds a task may run, None for no limit
+        :param function on_lost: function that returns the result of a task that was given up, it is called in the
+            parent with the arguments of the task and the reason
+
+        :returns: generator of the results
+        :rtype: generator
+        """
+        self.start()
+        return (value for _, value in self.__imap(func, iterable, stage, deadline, on_lost))
+
+    def map_partitions(self, func, df, *args, stage=None):
+        """
+        Splits a dataframe into one partition per worker and runs `func(partition, *args)` on them. If the workers are
+        not running and the dataframe has at most `in_process_max_rows` rows, `func` runs on the whole dataframe in the
+        current process, since starting the workers and loading their assets takes longer, e.g. in a re-run of the KVU
+        extraction on a few documents.
+
+        :param function func: module-level function to run
+        :param pd.DataFrame df: the dataframe
+        :param args: further arguments, may contain :class:`AssetRef` objects
+        :param str stage: name of the stage, it limits the tasks that run at the same time, see
+            :meth:`get_stage_workers`
+
+        :returns: the results per partition in order
+        :rtype: list
+        """
+        if df is None or len(df.index) == 0:
+            return []
+        if self.__pool is None and len(df.index) <= self.in_process_max_rows:
+            return [func(df, *[self.assets[arg.name] if isinstance(arg, AssetRef) else arg for arg in args])]
+        return self.starmap(func, [(part,) + args for part in split_dataframe(df, self.processes)], stage=stage)
+
+    def __create_pool(self):
+        # every pool gets its own queue, a worker that is terminated while it writes to a queue may break it. The
+        # messages are written right away, not by a background thread, so they arrive even if the worker dies.
+        started = multiprocessing.SimpleQueue()
+        pool = Pool(self.processes, initializer=_init_worker, initargs=(self.assets, cf.get_log_queue(), started),
+                    maxtasksperchild=self.max_tasks_per_child)
+        return pool, started
+
+    def __stop_watching(self):
+        if self.__watcher is not None:
+            self.__stop_watcher.set()
+            self.__watcher.join()
+            self.__watcher = None
+
+    def __submit(self, task):
+        with self.__task_lock:
+            task_id = next(self.__task_ids)
+            task.pid = task.started = None
+            task.missing = False
+            self.__tasks[task_id] = task
+            self.__pool.apply_async(_run_tracked_task, ((task_id, task.measured, task.func, task.args),),
+                                    callback=lambda value: self.__finish(task_id, value, None),
+                                    error_callback=lambda ex: self.__finish(task_id, None, ex))
+
+    def __finish(self, task_id, value, error):
+        with self.__task_lock:
+            task = self.__tasks.pop(task_id, None)
+        # the task was given up or sent again after a restart of the workers
+        if task is None:
+            return
+        if error is None:
+            task.callback(value)
+        else:
+            task.error_callback(error)
+
+    def __watch_tasks(self, stop):
+        while not stop.wait(TASK_CHECK_INTERVAL):
+            lost = self.__find_lost_tasks()
+            if lost:
+                self.__restart(lost)
+
+    def __find_lost_tasks(self):
+        # returns the reason per id of the tasks that exceeded their deadline or whose worker died
+        now = time.monotonic()
+        lost = {}
+        with self.__task_lock:
+            while not self.__started.empty():
+                task_id, pid = self.__started.get()
+                if task_id in self.__tasks:
+                    self.__tasks[task_id].pid = pid
+                    self.__tasks[task_id].started = now
+            for task_id, task in self.__tasks.items():
+                if task.started is None:
+                    continue
+                if task.deadline and now - task.started > task.deadline:
+                    lost[task_id] = 'timeout'
+                elif not _is_alive(task.pid):
+                    # a worker that is recycled exits right after its result was sent, so a missing worker is only
+                    # noticed if the result does not arrive until the next check
+                    if task.missing:
+                        lost[task_id] = 'worker died'
+                    task.missing = True
+        return lost
+
+    def __restart(self, lost):
+        with self.__task_lock:
+            lost_tasks = [(self.__tasks.pop(task_id), reason) for task_id, reason in lost.items()
+                          if task_id in self.__tasks]
+            if not lost_tasks:
+                return
+            cf.log('Worker pool: giving up %d task(s), restarting the workers', len(lost_tasks), level=logging.WARNING)
+            pool = self.__pool
+            self.__pool, self.__started = self.__create_pool()
+            running = list(self.__tasks.values())
+            self.__tasks.clear()
+            for task in running:
+                self.__submit(task)
+        # the results of the old workers are ignored, so the callbacks do not wait for the lock while it terminates
+        pool.terminate()
+        pool.join()
+        for task, reason in lost_tasks:
+            cf.log('Task %s given up (%s)', task.func.__name__, reason, level=logging.WARNING)
+            if task.on_lost is None:
+                task.error_callback(TaskLost(reason))
+                continue
+            try:
+                value = task.on_lost(task.args, reason)
+            except Exception as ex:
+                task.error_callback(ex)
+                continue
+            task.callback((value, None))
+
+    @staticmethod
+    def __drain(finished, running):
+        for _ in range(running):
+            _, _, error = finished.get()
+            if error is not None:
+                cf.log('Worker pool: task failed after an earlier error: %s', error, level=logging.WARNING)
+
+    def __imap(self, func, iterable, stage, deadline=None, on_lost=None):
+        # yields (position, result) of every task, new tasks are only started while the stage has memory left
+        finished = queue.Queue()
+        tasks = enumerate(iterable)
+        sized = self.memory_estimates is not None and stage is not None
+        running = 0
+        has_tasks = True
+        previous_workers = None
+        try:
+            while True:
+                workers = self.get_stage_workers(stage, running)
+                if sized and workers != previous_workers and has_tasks:
+                    cf.log('Stage %s: %d tasks at the same time (%.0f MB per task)', stage, workers,
+                           self.get_stage_memory(stage))
+                    previous_workers = workers
+                while has_tasks and running < workers:
+                    task = next(tasks, None)
+                    if task is None:
+                        has_tasks = False
+                        break
+                    position, args = task
+                    self.__submit(_Task(func, args, sized, deadline, on_lost,
+                                        callback=lambda value, i=position: finished.put((i, value, None)),
+                                        error_callback=lambda ex: finished.put((None, None, ex))))
+                    running += 1
+                if running == 0:
+                    return
+                position, value, error = finished.get()
+                running -= 1
+                if error is not None:
+                    raise error
+                result, memory = value
+                if memory is not None:
+                    with self.__lock:
+                        self.__measured_memory[stage] = max(memory, self.__measured_memory.get(stage, 0.0))
+                yield position, result
+        finally:
+            # after an error or if the results are not read any further, the running tasks are waited for, so they do
+            # not keep workers and memory from the next tasks
+            self.__drain(finished, running)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Command line interface of PLIX.
+
+The arguments of :class:`plix.config.Config` and the domain knowledge are read from JSON files. `plix run` processes
+the documents in streaming mode and journals every finished document, so a run that crashed can be continued with
+`--resume`. `plix serve` starts the service, see :mod:`plix.service`.
+
+Example::
+
+    plix run --config config.json --dk motor_dk.json --jobs 8
+    plix run --config config.json --dk motor_dk.json --jobs 8 --resume
+    plix serve --config config.json --dk motor_dk.json
+"""
+import argparse
+
+import plix.helpers.common_functions as cf
+from plix.config import Config
+from plix.pipeline import Pipeline
+from plix.service import PlixService
+
+
+def _jobs(value):
+    # number of worker processes or 'auto'
+    return value if value == 'auto' else int(value)
+
+
+def load_config(args, **overrides):
+    """
+    Creates the config from the JSON file given on the command line.
+
+    :param argparse.Namespace args: the parsed arguments
+    :param overrides: config arguments that replace the ones from the file
+
+    :returns: the config
+    :rtype: plix.config.Config
+    """
+    kwargs = cf.load_json(args.config)
+    if args.datasheets_folder:
+        kwargs['datasheets_folder'] = args.datasheets_folder
+    kwargs.update(overrides)
+    return Config(**kwargs)
+
+
+def run(args):
+    """
+    Runs the pipeline document by document and journals the finished documents. With `--dry-run`, only the plan of
+    the run is printed.
+
+    :param argparse.Namespace args: the parsed arguments
+    """
+    overrides = {'stream_documents': True, 'resume': args.resume}
+    if args.jobs:
+        overrides['dataframe_cores'] = args.jobs
+    if args.journal:
+        overrides['journal_file'] = args.journal
+    pipeline = Pipeline(load_config(args, **overrides))
+    if args.dry_run:
+        # the plan of the streaming run, the config is not changed
+        print(pipeline.format_plan())
+        return
+    pipeline.run_pipeline(cf.load_json(args.dk))
+
+
+def serve(args):
+    """
+    Runs the service until it is interrupted.
+
+    :param argparse.Namespace args: the parsed arguments
+    """
+    overrides = {}
+    if args.jobs:
+        overrides['dataframe_cores'] = args.jobs
+    if args.host:
+        overrides['service_host'] = args.host
+    if args.port:
+        overrides['service_port'] = args.port
+    if args.socket:
+        overrides['service_socket'] = args.socket
+    config = load_config(args, **overrides)
+    PlixService(Pipeline(config)).run(cf.load_json(args.dk))
+
+
+def main(argv=None):
+    """
+    Entry point of the `plix` command.
+
+    :param list argv: command line arguments, if None `sys.argv` is used
+    """
+    parser = argparse.ArgumentParser(prog='plix', description='PDF list information extraction.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--config', required=True,
+                        help='JSON file with the arguments of plix.config.Config, incl. datasheets_folder')
+    common.add_argument('--dk', required=True, help='JSON file with the domain knowledge')
+    common.add_argument('--datasheets-folder', dest='datasheets_folder', help='replaces the folder of the config')
+    common.add_argument('--jobs', '-j', type=_jobs,
+                        help="number of worker processes, 'auto' to size them by the free cores and memory")
+
+    run_parser = subparsers.add_parser('run', parents=[common], help='process all pdfs of the datasheets folder')
+    run_parser.add_argument('--resume', action='store_true',
+                            help='skip the documents that were finished in the previous run')
+    run_parser.add_argument('--journal', help='journal file, default is journal.jsonl in the output folder')
+    run_parser.add_argument('--dry-run', dest='dry_run', action='store_true',
+                            help='print the steps that would run with their inputs and outputs and exit')
+    run_parser.set_defaults(func=run)
+
+    serve_parser = subparsers.add_parser('serve', parents=[common], help='start the service with the HTTP API')
+    serve_parser.add_argument('--host')
+    serve_parser.add_argument('--port', type=int)
+    serve_parser.add_argument('--socket', help='unix socket to listen on instead of host and port')
+    serve_parser.set_defaults(func=serve)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
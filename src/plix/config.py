@@ -23,6 +23,12 @@ class Config:
         self.ocr_pdf_path = kwargs.get('ocr_pdf_path', os.path.join(self.output_folder, 'ocr_pdfs'))
         self.ocr_image_path = kwargs.get('ocr_image_path', os.path.join(self.output_folder, 'ocr_tables'))
         self.result_file = kwargs.get('result_file', os.path.join(self.output_folder, 'extracted_pdf_data'))
+        self.stage_cache_folder = kwargs.get('stage_cache_folder', os.path.join(self.output_folder, 'stage_cache'))
+        self.journal_file = kwargs.get('journal_file', os.path.join(self.output_folder, 'journal.jsonl'))
+        # format of the intermediate results: 'pickle' (pkl and csv) or 'parquet' (needs pyarrow)
+        self.storage_format = kwargs.get('storage_format', 'pickle')
+        # compression of the parquet columns, e.g. 'zstd', 'snappy' or 'none'
+        self.storage_compression = kwargs.get('storage_compression', 'zstd')
 
     def __init_table_extraction_config(self, **kwargs):
         ########################################
@@ -49,6 +55,10 @@ class Config:
         self.do_new_coordinates = kwargs.get('do_new_coordinates', True)
         # extract text from pdf
         self.do_text_extraction = kwargs.get('do_text_extraction', True)
+        # backend that reads the text of the pages: 'pdfminer', 'pdfminer_raw' or 'pdfium'. 'pdfminer_raw' keeps the
+        # order of the content stream, so blocks that are drawn last, e.g. the title and authors of some papers, are at
+        # the end of the page text
+        self.text_backend = kwargs.get('text_backend', 'pdfminer')
         # run OCR if necessary
         self.do_ocr = kwargs.get('do_ocr', True)
         # force to run OCR even when not necessary
@@ -71,12 +81,42 @@ class Config:
         self.do_pivot_search = kwargs.get('do_pivot_search', False)
         # merge text and table key-value pairs after extraction
         self.do_merge = kwargs.get('do_merge', True)
+        # run all steps per document in one worker and return the results document by document
+        self.stream_documents = kwargs.get('stream_documents', False)
+        # in streaming mode, skip the documents that were finished in the journal of the previous run
+        self.resume = kwargs.get('resume', False)
+        # run the steps that do not depend on each other at the same time, e.g. the text and table KVU extraction
+        self.parallel_stages = kwargs.get('parallel_stages', True)
+        # only print the steps that would run with their inputs and outputs, without running them
+        self.dry_run = kwargs.get('dry_run', False)
+        # cache the output of every stage per document, so only new or changed pdfs are processed in re-runs
+        self.use_stage_cache = kwargs.get('use_stage_cache', True)
+        # keep only the text columns that later steps read: the text variants are dropped as soon as MeaningfulText is
+        # chosen (their raw texts stay in the stage cache) and the other text columns once no further step needs them
+        self.lean_memory = kwargs.get('lean_memory', False)
+
+    def __init_service_config(self, **kwargs):
+        ########################################
+        # SERVICE CONFIGURATION                #
+        ########################################
+        # address of the HTTP API
+        self.service_host = kwargs.get('service_host', '127.0.0.1')
+        self.service_port = kwargs.get('service_port', 8765)
+        # listen on this unix socket instead of host and port, if set
+        self.service_socket = kwargs.get('service_socket', None)
+        # number of documents that may wait for a worker, further requests are rejected with 503
+        self.service_queue_size = kwargs.get('service_queue_size', 16)
+        # maximum size of an uploaded pdf in MB
+        self.service_max_upload_mb = kwargs.get('service_max_upload_mb', 100)
+        # folder where uploaded pdfs are saved
+        self.service_upload_folder = kwargs.get('service_upload_folder', os.path.join(self.output_folder, 'uploads'))
 
     def __init__(self, datasheets_folder, **kwargs):
         self.datasheets_folder = datasheets_folder
         self.__init_data_defaults(datasheets_folder, **kwargs)
         self.__init_pipeline_configuration(**kwargs)
         self.__init_table_extraction_config(**kwargs)
+        self.__init_service_config(**kwargs)
 
         # others
         self.tesseract_path = kwargs.get("tesseract_path", os.path.join("..", "..", "libs", "Tesseract-OCR",
@@ -87,8 +127,57 @@ class Config:
         self.force_vocab_reload = kwargs.get('force_vocab_reload', False)
         # if less words, run ocr
         self.ocr_min_page_threshold = kwargs.get('ocr_min_page_threshold', 600)
+        # number of worker processes, 'auto' for one per core with the tasks per stage limited by the free memory
         self.dataframe_cores = kwargs.get('dataframe_cores', 2)
+        # with dataframe_cores='auto': memory in MB that is kept free for the main process and the system
+        self.worker_memory_reserve_mb = kwargs.get('worker_memory_reserve_mb', 1024)
+        # with dataframe_cores='auto': memory in MB a task of a stage needs on top of an idle worker, until the first
+        # task of the stage is measured
+        self.worker_memory_estimates_mb = kwargs.get('worker_memory_estimates_mb', {
+            'extract_all_data_from_files': 2000, 'process_texts': 1500, 'process_tables': 1500, 'ocr': 1500,
+            'text': 300, 'rasterization': 1000, 'table_detection': 1000, 'normalize': 300, 'kvu_text': 300,
+            'kvu_table': 300, 'document': 2000})
+        # run the normalization and KVU extraction in the main process if there are at most this many documents and the
+        # workers are not started yet, e.g. for a re-run of the KVU extraction, 0 to always use the workers
+        self.in_process_max_documents = kwargs.get('in_process_max_documents', 20)
+        # hand out one pdf at a time to the workers, ordered by estimated cost, instead of equal-count slices
+        self.schedule_by_cost = kwargs.get('schedule_by_cost', True)
+        # pdfs with at least this many pages are read in page ranges by all workers, 0 to disable
+        self.page_split_min_pages = kwargs.get('page_split_min_pages', 0)
+        # number of pages per range of a split pdf
+        self.page_split_size = kwargs.get('page_split_size', 10)
+        # restart a worker process after this many tasks to free memory of pdfminer and camelot, None to never restart
+        self.worker_max_tasks = kwargs.get('worker_max_tasks', 20)
+        # maximum wall time in seconds to extract the data of one pdf, None for no limit
+        self.document_timeout = kwargs.get('document_timeout', None)
+        # maximum memory (RSS) in MB of a worker while it extracts the data of one pdf, None for no limit
+        self.document_max_memory_mb = kwargs.get('document_max_memory_mb', None)
+        # config changes for the retry of a pdf that failed or exceeded a limit, if the retry fails it is quarantined
+        self.document_retry_config = kwargs.get('document_retry_config', {'do_ocr': False, 'force_ocr': False,
+                                                                          'ocr_dpi': 300})
+        # resolution of the page images for OCR
+        self.ocr_dpi = kwargs.get('ocr_dpi', 600)
+        # memory in MB per process for rendered page images, they are shared by the table detection and the OCR
+        self.page_image_cache_mb = kwargs.get('page_image_cache_mb', 1024)
+        # pass the page images to the table detection in memory, they are only saved as PNG files in debug mode
+        self.in_memory_rasterization = kwargs.get('in_memory_rasterization', True)
+        # OCR engine: 'tesserocr' (tesseract API kept in memory), 'pytesseract' (a tesseract process per image) or
+        # 'auto' (tesserocr if it is installed)
+        self.ocr_engine = kwargs.get('ocr_engine', 'auto')
+        # maximum number of tesseract API instances per process, for OCR in several threads at the same time
+        self.ocr_engine_pool_size = kwargs.get('ocr_engine_pool_size', 2)
+        # folder of the tesseract language data for tesserocr, None for the default of the installation
+        self.tessdata_path = kwargs.get('tessdata_path', None)
         self.dtd_max_page_num = kwargs.get('dtd_max_page_num', 50)
         self.pdf_max_len_text = kwargs.get('pdf_max_len_text', 100)
         self.log_file = kwargs.get('log_file', os.path.join(self.output_folder, os.pardir, 'log.txt'))
+        # record wall time, CPU time, memory and pages per second of every stage and document
+        self.collect_metrics = kwargs.get('collect_metrics', True)
+        # base path of the metrics report, '.json' and '.csv' are appended
+        self.metrics_file = kwargs.get('metrics_file', os.path.join(self.output_folder, os.pardir, 'metrics'))
+        # optional file for the metrics in the Prometheus text format, e.g. for the node exporter textfile collector
+        self.metrics_prometheus_file = kwargs.get('metrics_prometheus_file', None)
+        # folder where every process saves its records during a run
+        self.metrics_spool_folder = kwargs.get('metrics_spool_folder', os.path.join(self.output_folder,
+                                                                                    'metrics_spool'))
         self.debug_mode = kwargs.get('debug_mode', False)
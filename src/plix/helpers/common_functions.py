@@ -1,23 +1,41 @@
 """
 Miscellaneous functions that are used in several modules.
 """
+import atexit
+import importlib.util
+import json
 import logging
+import multiprocessing
 import os
 import sys
 from glob import glob
+from logging.handlers import QueueHandler, QueueListener
 
 import pandas as pd
 
+_logger = logging.getLogger('PLIX')
+# queue and listener that write the log records of all processes
+_log_queue = None
+_log_listener = None
+# log file and print flag of the running listener
+_log_settings = None
+
 
 def init_logging(logfile: str = 'logfile.log', do_print: bool = True) -> None:
     """
     Method to init the logging.
 
+    The records of all processes are put into one queue and written by a single listener thread in the main process,
+    so the worker processes do not write to the log file at the same time. Calling it again with the same arguments
+    does not add further handlers.
+
     :param str logfile: file where to save the logging
     :param bool do_print: if this is set, logging will be printed in console
     """
-    logger = logging.getLogger('PLIX')
-    logger.setLevel(logging.INFO)
+    global _log_queue, _log_listener, _log_settings
+    if _log_settings == (os.path.abspath(logfile), do_print):
+        return
+    stop_logging()
 
     filehandle = logging.FileHandler(filename=logfile, encoding='utf-8', mode='a+')
     streamhandle = logging.StreamHandler(sys.stdout)
@@ -30,27 +48,87 @@ def init_logging(logfile: str = 'logfile.log', do_print: bool = True) -> None:
     filehandle.setFormatter(format_)
     streamhandle.setFormatter(format_)
 
-    logger.addHandler(filehandle)
-    logger.addHandler(streamhandle)
+    if _log_queue is None:
+        _log_queue = multiprocessing.Queue()
+        # the records that are still in the queue are written when the program exits
+        atexit.register(stop_logging)
+    _log_listener = QueueListener(_log_queue, filehandle, streamhandle, respect_handler_level=True)
+    _log_listener.start()
+    _log_settings = (os.path.abspath(logfile), do_print)
+    init_worker_logging(_log_queue)
+
+
+def init_worker_logging(log_queue):
+    """
+    Sends the log records of the current process to the listener of the main process, e.g. in the initializer of a
+    worker. Handlers inherited from the main process are removed.
+
+    :param multiprocessing.Queue log_queue: the queue of the listener, see :func:`get_log_queue`
+    """
+    _logger.setLevel(logging.INFO)
+    for handler in list(_logger.handlers):
+        _logger.removeHandler(handler)
+    if log_queue is not None:
+        _logger.addHandler(QueueHandler(log_queue))
+
+
+def get_log_queue():
+    """
+    Returns the queue of the log listener, e.g. to pass it to worker processes.
+
+    :returns: the queue, None if the logging is not initialized
+    :rtype: multiprocessing.Queue
+    """
+    return _log_queue if _log_listener is not None else None
+
 
+def stop_logging():
+    """
+    Writes the queued log records and stops the listener.
+    """
+    global _log_listener, _log_settings
+    if _log_listener is not None:
+        _log_listener.stop()
+        for handler in _log_listener.handlers:
+            handler.close()
+        _log_listener = None
+        _log_settings = None
 
-def log(message, level=logging.INFO):
+
+def lazy_import(name):
+    """
+    Imports a module lazily: it is loaded when one of its attributes is used for the first time. Heavy dependencies
+    (camelot, cv2, nltk, pint, ...) are imported like this, so they only slow down the start of a process that needs
+    them.
+
+    :param str name: name of the module
+
+    :returns: the module
+    :rtype: module
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError("No module named '{}'".format(name), name=name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def log(message, *args, level=logging.INFO):
     """
-    Logs a message to the log file and optionally prints the message.
+    Logs a message to the log file and optionally prints the message. The message is only formatted if the level is
+    enabled, so pass the values as `args`, e.g. ``log('Reading file: %s', filename)``.
 
-    :param str message: message that should be logged
+    :param str message: message that should be logged, with %-style placeholders for `args`
+    :param args: values of the placeholders
     :param int level: logging level
     """
-    logger = logging.getLogger('PLIX')
-    if level == logging.INFO:
-        logger.info(message)
-    elif level == logging.WARNING:
-        logger.warning(message)
-    elif level == logging.error:
-        logger.error(message)
-    else:
-        # logging.DEBUG
-        logger.debug(message)
+    if _logger.isEnabledFor(level):
+        _logger.log(level, message, *args)
 
 
 def is_folder_and_not_empty(path):
@@ -96,6 +174,19 @@ def load_df(fname):
     return pd.read_pickle(fname + '.pkl')
 
 
+def load_json(fname):
+    """
+    loads a json file, e.g. the domain knowledge or the arguments of the config.
+
+    :param str fname: path to the json file
+
+    :returns: the content
+    :rtype: dict
+    """
+    with open(fname, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
 def df_pkl_exists(fname):
     """
     Checks whether a pkl file exists.
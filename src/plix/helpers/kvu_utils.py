@@ -1,12 +1,25 @@
 """
 This file provides methods for the KVU extraction.
 """
-import pint
-
 import plix.helpers.common_functions as cf
 
-# for unit conversions
-ureg = pint.UnitRegistry()
+pint = cf.lazy_import('pint')
+
+# for unit conversions, created on first use since building it takes a while
+_unit_registry = None
+
+
+def get_unit_registry():
+    """
+    Returns the pint unit registry of the process.
+
+    :returns: the unit registry
+    :rtype: pint.UnitRegistry
+    """
+    global _unit_registry
+    if _unit_registry is None:
+        _unit_registry = pint.UnitRegistry()
+    return _unit_registry
 
 
 def is_value_unit_sane(value, unit, allowed_units):
@@ -108,17 +121,17 @@ def transform_unit(kvu_list, units):
         if units[key]['base_symbols']:
             base_unit = units[key]['base_symbols'][0]
             if not unit == base_unit:
-                cf.log('Unit transform needed: ' + str(kv_pair))
+                cf.log('Unit transform needed: %s', kv_pair)
                 try:
                     value = value.replace(" ", "")
                     unit = unit.replace(" ", "")
-                    quantity = ureg.Quantity(float(value), unit)
+                    quantity = get_unit_registry().Quantity(float(value), unit)
                     kv_pair[3] = quantity.to(base_unit).magnitude
                     kv_pair[4] = base_unit
                 except ValueError as er:
                     print("error converting: " + value)
         if needs_radius_conversion(key, kv_pair):  # radius -> diameter
-            cf.log('Radius to diameter conversion needed: ' + str(kv_pair))
+            cf.log('Radius to diameter conversion needed: %s', kv_pair)
             kv_pair[3] = str(float(value) * 2)
     return kvu_list
 
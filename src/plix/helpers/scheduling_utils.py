@@ -0,0 +1,157 @@
+"""
+This file provides methods to estimate the processing cost of pdf files and to order them for the parallel extraction.
+
+The workers get one document at a time, starting with the most expensive one. Thus, a large scanned document is not
+processed last by a core that got an unlucky share of the files, and the wall-clock time follows the total work divided
+by the number of cores.
+"""
+import os
+
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfparser import PDFParser
+from pdfminer.pdftypes import resolve1
+
+import plix.classes.stage_cache as sc
+import plix.helpers.common_functions as cf
+
+# relative cost per page for the different extraction steps
+TEXT_PAGE_COST = 1.0
+OCR_PAGE_COST = 12.0
+TABLE_MODE_PAGE_COST = {
+    'lattice': 2.0,
+    'stream': 1.5,
+    'ocr': 4.0,
+    'no_table': 0.0,
+    '': 0.0
+}
+# relative cost per MB of the file
+FILE_SIZE_COST = 0.5
+# pdfs with more bytes per page are most likely scanned documents that need OCR
+SCANNED_BYTES_PER_PAGE = 150000
+
+# page counts per document hash
+_page_counts = {}
+
+
+def count_pages(full_path):
+    """
+    Counts the pages of a pdf in the main process, e.g. for the scheduling and the metrics report. Only the document
+    catalog is read, the pages are not parsed, and the count is kept per content hash, so every pdf is only read once.
+    The workers take the count from the session of the pdf, see :func:`plix.classes.pdf_session.get_page_count`.
+
+    :param str full_path: path to the pdf
+
+    :returns: number of pages, 1 if the pdf can not be read
+    :rtype: int
+    """
+    try:
+        doc_hash = sc.hash_file(full_path)
+        if doc_hash not in _page_counts:
+            with open(full_path, mode='rb') as fp:
+                doc = PDFDocument(PDFParser(fp))
+                _page_counts[doc_hash] = max(1, int(resolve1(resolve1(doc.catalog['Pages'])['Count'])))
+        return _page_counts[doc_hash]
+    except Exception as ex:
+        cf.log('Scheduling: could not count pages of %s %s', full_path, ex)
+        return 1
+
+
+def get_page_ranges(pages, max_size):
+    """
+    Groups page numbers into ranges of consecutive pages, e.g. to read the pages of a large document in parallel.
+
+    :param iterable pages: page numbers, starting at 0
+    :param int max_size: maximum number of pages per range
+
+    :returns: the ranges as first page and the page after the last page
+    :rtype: list
+    """
+    ranges = []
+    for page in sorted(pages):
+        if ranges and ranges[-1][1] == page and ranges[-1][1] - ranges[-1][0] < max_size:
+            ranges[-1][1] = page + 1
+        else:
+            ranges.append([page, page + 1])
+    return [tuple(page_range) for page_range in ranges]
+
+
+def will_run_ocr(full_path, page_count, config):
+    """
+    Guesses whether OCR will be run for a pdf.
+
+    :param str full_path: path to the pdf
+    :param int page_count: number of pages
+    :param plix.config.Config config: pipeline config object
+
+    :returns: true if OCR is likely
+    :rtype: bool
+    """
+    if config.force_ocr:
+        return True
+    if not config.do_ocr:
+        return False
+    is_ocr_category = cf.get_mode(full_path, config.table_modes) == 'ocr'
+    return is_ocr_category or os.path.getsize(full_path) / page_count > SCANNED_BYTES_PER_PAGE
+
+
+def estimate_document_cost(full_path, config):
+    """
+    Estimates the relative processing cost of a pdf from its page count, table category, file size and whether OCR
+    will be triggered.
+
+    :param str full_path: path to the pdf
+    :param plix.config.Config config: pipeline config object
+
+    :returns: the estimated cost
+    :rtype: float
+    """
+    page_count = count_pages(full_path)
+    cost = page_count * TEXT_PAGE_COST
+    if will_run_ocr(full_path, page_count, config):
+        cost += min(page_count, config.dtd_max_page_num) * OCR_PAGE_COST
+    if config.do_table:
+        cost += page_count * TABLE_MODE_PAGE_COST.get(cf.get_mode(full_path, config.table_modes), 0.0)
+    cost += os.path.getsize(full_path) / 1e6 * FILE_SIZE_COST
+    return cost
+
+
+def order_by_cost(paths, config):
+    """
+    Orders pdf files by their estimated cost, the most expensive comes first.
+
+    :param list paths: paths to the pdfs
+    :param plix.config.Config config: pipeline config object
+
+    :returns: the ordered paths
+    :rtype: list
+    """
+    costs = {path: estimate_document_cost(path, config) for path in paths}
+    return sorted(paths, key=lambda path: costs[path], reverse=True)
+
+
+def get_available_cores():
+    """
+    Returns the number of cores the current process may run on.
+
+    :returns: the number of cores
+    :rtype: int
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return max(1, len(os.sched_getaffinity(0)))
+    return os.cpu_count() or 1
+
+
+def get_worker_count(config):
+    """
+    Returns the number of worker processes for `config.dataframe_cores`. With 'auto', one worker per available core is
+    started and the number of tasks that run at the same time is chosen per stage from the free memory, see
+    :meth:`plix.classes.worker_pool.WorkerPool.get_stage_workers`.
+
+    :param plix.config.Config config: pipeline config object
+
+    :returns: the number of workers
+    :rtype: int
+    """
+    if config.dataframe_cores == 'auto':
+        return get_available_cores()
+    return max(1, int(config.dataframe_cores))
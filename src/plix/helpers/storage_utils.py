@@ -0,0 +1,313 @@
+"""
+This file provides methods to save and load the intermediate results (extraction results, coordinates, KVU tuples)
+as Parquet files.
+
+Unlike pickle and CSV, Parquet stores every column separately and compressed. Single columns can be loaded without
+reading the rest of the file, e.g. only `NormalizedTableData` for the table KVU extraction, and the file is memory
+mapped while it is read. The nested columns of the extraction results are stored with Arrow types:
+
++----------+-----------------------------------------------+------------------------------------------------------+
+| encoding |                    columns                    |                      arrow type                      |
++==========+===============================================+======================================================+
+| pages    | text per page, e.g. `Text`, `MeaningfulText`  | map<string, string>, key is the page number          |
++----------+-----------------------------------------------+------------------------------------------------------+
+| tables   | list of tables, e.g. `TableData`              | list<struct<columns: list<string>,                   |
+|          |                                               | rows: list<list<string>>>>                           |
++----------+-----------------------------------------------+------------------------------------------------------+
+| native   | strings, numbers, lists of strings, ...       | inferred by arrow                                    |
++----------+-----------------------------------------------+------------------------------------------------------+
+| pickle   | everything else, e.g. the metadata            | binary, one pickled object per row                   |
++----------+-----------------------------------------------+------------------------------------------------------+
+
+The encoding of each column is saved in the metadata of the file, so the loaded dataframe equals the saved one.
+Parquet needs the optional dependency pyarrow (`pip install plix[parquet]`).
+
+The extraction results are saved in segments, see :func:`save_segment`: every pipeline step only writes the columns
+it produced to a new segment file, and a manifest (`<file>.manifest.json`) lists which segment holds which column.
+:func:`load_results` puts the segments back together, so the steps never rewrite the columns of earlier steps.
+"""
+import hashlib
+import json
+import math
+import os
+import pickle
+
+import pandas as pd
+
+import plix.helpers.common_functions as cf
+
+PARQUET_EXTENSION = '.parquet'
+# key of the plix information in the metadata of a parquet file
+METADATA_KEY = b'plix'
+INDEX_COLUMN = '__index__'
+# the only key of a page dictionary that is not a page number
+TOTAL_PAGES_KEY = 'total pages'
+MANIFEST_EXTENSION = '.manifest.json'
+# extensions of the files a segment can be saved in
+SEGMENT_EXTENSIONS = ['.pkl', '.csv', PARQUET_EXTENSION]
+
+
+def save_results(df, fname, config):
+    """
+    Saves a dataframe in the format set in `config.storage_format`.
+
+    :param pd.DataFrame df: dataframe with intermediate results
+    :param str fname: path to save to, without extension
+    :param plix.config.Config config: pipeline config object
+    """
+    if config.storage_format == 'parquet':
+        save_parquet(df, fname, compression=config.storage_compression)
+    else:
+        cf.save_df(df, fname)
+
+
+def save_segment(df, fname, stage, config, columns=None):
+    """
+    Saves the columns a pipeline step produced as a new segment of the results in `fname` and adds it to the manifest.
+    Segments whose columns were all replaced are removed. Columns in `columns` that are not in `df` are removed from the
+    saved results, e.g. the text variants in the lean mode. If `columns` is None or the documents in `df` differ from
+    the saved ones, all columns are saved and replace the previous segments.
+
+    :param pd.DataFrame df: the complete results
+    :param str fname: path of the results, without extension
+    :param str stage: name of the pipeline step, it is part of the segment file name
+    :param plix.config.Config config: pipeline config object
+    :param list columns: the columns the step produced
+    """
+    manifest = __load_manifest(fname)
+    documents = __hash_documents(df)
+    if manifest is None:
+        manifest = {'version': 0, 'documents': documents, 'segments': []}
+    if columns is None or manifest['documents'] != documents:
+        manifest['documents'] = documents
+        replaced = list(manifest.get('columns', [])) + list(df.columns)
+        columns = list(df.columns)
+    else:
+        replaced = list(columns)
+        columns = [column for column in columns if column in df.columns]
+    manifest['version'] += 1
+    segment = {'file': '{}.{}.{}'.format(os.path.basename(fname), stage, manifest['version']), 'columns': columns}
+    save_results(df[columns], os.path.join(os.path.dirname(fname), segment['file']), config)
+
+    removed = []
+    for previous in manifest['segments']:
+        previous['columns'] = [column for column in previous['columns'] if column not in replaced]
+        if not previous['columns']:
+            removed.append(previous)
+    manifest['segments'] = [previous for previous in manifest['segments'] if previous['columns']] + [segment]
+    # columns that are not in `df` anymore stay in the results as long as a segment holds them
+    kept = [column for previous in manifest['segments'][:-1] for column in previous['columns']]
+    ordered = manifest.get('columns', []) if kept else []
+    manifest['columns'] = [column for column in ordered + [c for c in df.columns if c not in ordered]
+                           if column in df.columns or column in kept]
+    tmp_path = fname + MANIFEST_EXTENSION + '.tmp'
+    with open(tmp_path, mode='w', encoding='utf-8') as fp:
+        json.dump(manifest, fp, indent=1)
+    os.replace(tmp_path, fname + MANIFEST_EXTENSION)
+    # the old segments are only removed after the new manifest is in place, so a crash leaves a consistent state
+    for previous in removed:
+        for extension in SEGMENT_EXTENSIONS:
+            path = os.path.join(os.path.dirname(fname), previous['file']) + extension
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def load_results(fname, config, columns=None):
+    """
+    Loads a dataframe saved with :func:`save_results` or :func:`save_segment`. If there is no file in
+    `config.storage_format`, the file in the other format is loaded. Segments are only read if they hold one of
+    `columns`.
+
+    :param str fname: path to the file, without extension
+    :param plix.config.Config config: pipeline config object
+    :param list columns: optional columns to load, None to load all columns
+
+    :returns: the dataframe
+    :rtype: pd.DataFrame
+    """
+    manifest = __load_manifest(fname)
+    if manifest is not None:
+        return __load_segments(fname, manifest, config, columns)
+    if config.storage_format == 'parquet':
+        use_parquet = os.path.exists(fname + PARQUET_EXTENSION) or not cf.df_pkl_exists(fname)
+    else:
+        use_parquet = not cf.df_pkl_exists(fname) and os.path.exists(fname + PARQUET_EXTENSION)
+    if use_parquet:
+        return load_parquet(fname, columns=columns)
+    df = cf.load_df(fname)
+    return df if columns is None else df[[c for c in columns if c in df.columns]]
+
+
+def save_parquet(df, fname, compression='zstd'):
+    """
+    Saves a dataframe as a Parquet file. The file is written atomically.
+
+    :param pd.DataFrame df: the dataframe
+    :param str fname: path to save to, without extension
+    :param str compression: compression codec of the columns, e.g. 'zstd', 'snappy' or 'none'
+    """
+    pa, pq = __import_pyarrow()
+    arrays = [pa.array(list(df.index))]
+    names = [INDEX_COLUMN]
+    encodings = {}
+    for column in df.columns:
+        encodings[str(column)], array = __encode_column(pa, df[column])
+        arrays.append(array)
+        names.append(str(column))
+    table = pa.Table.from_arrays(arrays, names=names)
+    table = table.replace_schema_metadata({METADATA_KEY: json.dumps({'encodings': encodings}).encode('utf-8')})
+    tmp_path = '{}{}.{}.tmp'.format(fname, PARQUET_EXTENSION, os.getpid())
+    pq.write_table(table, tmp_path, compression=compression)
+    os.replace(tmp_path, fname + PARQUET_EXTENSION)
+
+
+def load_parquet(fname, columns=None):
+    """
+    Loads a dataframe saved with :func:`save_parquet`. The file is memory mapped and only the given columns are read.
+
+    :param str fname: path to the file, without extension
+    :param list columns: optional columns to load, None to load all columns
+
+    :returns: the dataframe
+    :rtype: pd.DataFrame
+    """
+    pa, pq = __import_pyarrow()
+    path = fname + PARQUET_EXTENSION
+    if columns is not None:
+        available = pq.read_schema(path).names
+        columns = [INDEX_COLUMN] + [c for c in columns if c in available and c != INDEX_COLUMN]
+    table = pq.read_table(path, columns=columns, memory_map=True)
+    encodings = json.loads(table.schema.metadata[METADATA_KEY])['encodings']
+    data = {}
+    for name in table.column_names:
+        if name != INDEX_COLUMN:
+            data[name] = __decode_column(pa, table.column(name), encodings.get(name, 'native'))
+    return pd.DataFrame(data, index=pd.Index(table.column(INDEX_COLUMN).to_pylist()),
+                        columns=[name for name in table.column_names if name != INDEX_COLUMN])
+
+
+def __load_manifest(fname):
+    if not os.path.exists(fname + MANIFEST_EXTENSION):
+        return None
+    with open(fname + MANIFEST_EXTENSION, encoding='utf-8') as fp:
+        return json.load(fp)
+
+
+def __load_segments(fname, manifest, config, columns):
+    columns = [column for column in manifest['columns'] if columns is None or column in columns]
+    parts = []
+    for segment in manifest['segments']:
+        segment_columns = [column for column in segment['columns'] if column in columns]
+        if segment_columns:
+            parts.append(load_results(os.path.join(os.path.dirname(fname), segment['file']), config,
+                                      columns=segment_columns))
+    if not parts:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(parts, axis=1)[[column for column in columns if any(column in part for part in parts)]]
+
+
+def __hash_documents(df):
+    # the segments can only be joined if they hold the same documents in the same order
+    documents = [str(index) for index in df.index]
+    if 'FullPath' in df.columns:
+        documents += [str(path) for path in df['FullPath']]
+    return hashlib.sha256(json.dumps(documents).encode('utf-8')).hexdigest()
+
+
+def __import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as ex:
+        raise ImportError("storage_format 'parquet' needs pyarrow, install it with: pip install pyarrow") from ex
+    return pyarrow, pyarrow.parquet
+
+
+def __is_null(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def __is_page_dict(value):
+    if not isinstance(value, dict):
+        return False
+    for key, text in value.items():
+        if key == TOTAL_PAGES_KEY:
+            if not isinstance(text, int):
+                return False
+        elif not isinstance(key, int) or not isinstance(text, str):
+            return False
+    return True
+
+
+def __is_table_list(value):
+    if not isinstance(value, list):
+        return False
+    for table in value:
+        if not isinstance(table, pd.DataFrame) or not table.index.equals(pd.RangeIndex(len(table.index))):
+            return False
+        if not all(isinstance(cell, str) or __is_null(cell) for cell in table.values.ravel()):
+            return False
+    return True
+
+
+def __get_encoding(values):
+    values = [value for value in values if not __is_null(value)]
+    if values and all(__is_page_dict(value) for value in values):
+        return 'pages'
+    if values and all(__is_table_list(value) for value in values):
+        return 'tables'
+    if any(isinstance(value, (dict, pd.DataFrame)) for value in values):
+        return 'pickle'
+    return 'native'
+
+
+def __encode_column(pa, series):
+    values = list(series)
+    encoding = __get_encoding(values) if series.dtype == object else 'native'
+    if encoding == 'pages':
+        return encoding, pa.array([None if __is_null(pages) else [(str(key), str(text)) for key, text in pages.items()]
+                                   for pages in values], type=pa.map_(pa.string(), pa.string()))
+    if encoding == 'tables':
+        table_type = pa.struct([('columns', pa.list_(pa.string())), ('rows', pa.list_(pa.list_(pa.string())))])
+        return encoding, pa.array([None if __is_null(tables) else [__encode_table(table) for table in tables]
+                                   for tables in values], type=pa.list_(table_type))
+    if encoding == 'native':
+        try:
+            return encoding, pa.array(values, from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            # e.g. mixed types like numbers and strings in one column
+            pass
+    return 'pickle', pa.array([pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL) for value in values],
+                              type=pa.binary())
+
+
+def __encode_table(table):
+    # the column labels are saved as json to keep their type, e.g. the int labels of camelot
+    return {
+        'columns': [json.dumps(label) for label in table.columns],
+        'rows': [[None if __is_null(cell) else cell for cell in row] for row in table.values.tolist()]
+    }
+
+
+def __decode_column(pa, column, encoding):
+    # nested arrow types would become numpy arrays in pandas, they are loaded as lists like in the saved dataframe
+    if encoding == 'native' and not pa.types.is_nested(column.type):
+        return column.to_pandas().values
+    values = column.to_pylist()
+    if encoding == 'pages':
+        return [None if pages is None else {__decode_page_key(key): int(text) if key == TOTAL_PAGES_KEY else text
+                                            for key, text in pages} for pages in values]
+    if encoding == 'tables':
+        return [None if tables is None else [__decode_table(table) for table in tables] for tables in values]
+    if encoding == 'native':
+        return values
+    return [pickle.loads(value) for value in values]
+
+
+def __decode_page_key(key):
+    return key if key == TOTAL_PAGES_KEY else int(key)
+
+
+def __decode_table(table):
+    return pd.DataFrame(table['rows'], columns=[json.loads(label) for label in table['columns']],
+                        dtype=object).fillna(float('nan'))
@@ -6,17 +6,23 @@ import random
 import re
 from string import printable
 
-import camelot
-import cv2
 import ftfy
 import numpy as np
 import pandas as pd
-import pytesseract
-from pattern.text.en import singularize
+from PIL import Image
 
+import plix.classes.ocr_engine as oe
+import plix.classes.page_image_cache as pic
+import plix.classes.stage_cache as sc
 import plix.helpers.common_functions as cf
 import plix.nlp_assets as nlp_assets
 
+camelot = cf.lazy_import('camelot')
+cv2 = cf.lazy_import('cv2')
+
+# resolution of the page images the table coordinates refer to
+PAGE_IMAGE_DPI = 300
+
 
 ####################################################################################################################
 # PUBLIC EXTRACTION METHODS                                                                                        #
@@ -54,27 +60,45 @@ def extract_stream_tables(full_path, new_coords, org_size, pt_size, cds):
     :param list pt_size: size of page image in pt
     :param dict cds: coordinates dict from file
 
+    :returns: extracted tables
+    :rtype: pd.DataFrame
+    """
+    return extract_stream_page_tables(full_path, cds['page'], [new_coords], org_size, pt_size)
+
+
+def extract_stream_page_tables(full_path, page, boxes, org_size, pt_size):
+    """
+    Method to extract the stream tables of a page. Camelot parses the page once for all table areas.
+
+    :param str full_path: path to pdf
+    :param int page: page number, starting at 1
+    :param list boxes: coordinates of the table bounding boxes on the page
+    :param list org_size: size of page image in px
+    :param list pt_size: size of page image in pt
+
     :returns: extracted tables
     :rtype: pd.DataFrame
     """
     tables = []
     cf.log("Table Extraction: Stream mode")
-    conv_coords = __transform_from_to(new_coords, org_size, pt_size)  # px -> pt
-    # sort to fit for camelot, transform y coordinates to fit origin in bottom left
-    conv_coords = __sort_camelot_coordinates(conv_coords, pt_size[1])
-    conv_coords = ','.join([str(x) for x in conv_coords])  # camelot needs coordinates as a comma-separated string
+    table_areas = []
+    for new_coords in boxes:
+        conv_coords = __transform_from_to(new_coords, org_size, pt_size)  # px -> pt
+        # sort to fit for camelot, transform y coordinates to fit origin in bottom left
+        conv_coords = __sort_camelot_coordinates(conv_coords, pt_size[1])
+        table_areas.append(','.join([str(x) for x in conv_coords]))  # camelot needs a comma-separated string
     try:
-        tables_str = camelot.read_pdf(full_path, pages=str(cds['page']), table_areas=[conv_coords], flavor='stream',
+        tables_str = camelot.read_pdf(full_path, pages=str(page), table_areas=table_areas, flavor='stream',
                                       edge_tol=500)
         for d in tables_str:
             if not d.df.empty:
                 tables.append(d.df)
     except Exception as ex:
-        cf.log("Table Extraction: Camelot error, pdf has no text or no table. Error message: " + str(ex))
+        cf.log("Table Extraction: Camelot error, pdf has no text or no table. Error message: %s", ex)
     return tables
 
 
-def extract_ocr_tables(file, cds, new_coords, i, image_folder, ocr_pdf_path, ocr_image_path):
+def extract_ocr_tables(file, cds, new_coords, i, image_folder, ocr_pdf_path, ocr_image_path, full_path=None):
     """
     Method to extract ocr tables.
 
@@ -86,6 +110,7 @@ def extract_ocr_tables(file, cds, new_coords, i, image_folder, ocr_pdf_path, ocr
     :param str image_folder: folder where the images of the pdf pages are
     :param str ocr_pdf_path: path where to store the generated table pdfs
     :param str ocr_image_path: path where the table images are
+    :param str full_path: path to the pdf, if set the page image is taken from the page image cache
 
     :returns: extracted tables
     :rtype: pd.DataFrame
@@ -98,14 +123,14 @@ def extract_ocr_tables(file, cds, new_coords, i, image_folder, ocr_pdf_path, ocr
     if not os.path.exists(ocr_pdf_path):
         os.mkdir(ocr_pdf_path)
     if not os.path.isfile(pdf_file):  # if none have been generated before
-        __generate_pdf_from_ocr(file, image_folder, pdf_file, cds, new_coords, ocr_image_path)
+        __generate_pdf_from_ocr(file, image_folder, pdf_file, cds, new_coords, ocr_image_path, full_path)
     # table extraction from table pdfs
     try:
         tables_cam = camelot.read_pdf(pdf_file, flavor='stream', edge_tol=500)
         for d in tables_cam:
             tables.append(d.df)
     except Exception as ex:
-        cf.log("Table Extraction: Camelot error, pdf has no text or no table. Error message: " + str(ex))
+        cf.log("Table Extraction: Camelot error, pdf has no text or no table. Error message: %s", ex)
     return tables
 
 
@@ -193,22 +218,39 @@ def __remove_lines(image):
     return removed_horizontal
 
 
-def __generate_pdf_from_ocr(file, image_folder, pdf_file, cds, new_coords, ocr_image_path):
-    prepared_image = __prepare_ocr_image(file, image_folder, cds, new_coords, ocr_image_path)
+def __generate_pdf_from_ocr(file, image_folder, pdf_file, cds, new_coords, ocr_image_path, full_path):
+    prepared_image = __prepare_ocr_image(file, image_folder, cds, new_coords, ocr_image_path, full_path)
     # table image + OCR'ed text to pdf
-    pdf = pytesseract.image_to_pdf_or_hocr(prepared_image, extension='pdf', config='--psm 4')
+    pdf = oe.get_engine().image_to_pdf(prepared_image, psm=4)
     with open(pdf_file, 'w+b') as f:
         f.write(pdf)  # pdf type is bytes by default
 
 
-def __prepare_ocr_image(file, image_folder, cds, new_coords, ocr_image_path):
+def __load_page_image(image_folder, page, full_path):
+    # the page images of the coordinate detection, from the page image cache or decoded from their file
+    if full_path is None:
+        return cv2.imread(__get_image_path_from_page_no(image_folder, page))
+    cache = pic.get_cache()
+    doc_hash = sc.hash_file(full_path)
+    image = cache.get_cached(doc_hash, page, PAGE_IMAGE_DPI, pic.GRAYSCALE)
+    image_file = __get_image_path_from_page_no(image_folder, page) \
+        if image is None and os.path.isdir(image_folder) else ''
+    if image_file:
+        image = cache.put(doc_hash, page, PAGE_IMAGE_DPI, pic.GRAYSCALE, Image.open(image_file))
+    elif image is None:
+        # the page images were not saved, see :func:`plix.classes.table_coordinates_client.extract_coordinates`
+        image = cache.get_pages(full_path, [page], PAGE_IMAGE_DPI, pic.GRAYSCALE)[page]
+    # same channels as cv2.imread of the png
+    return cv2.cvtColor(np.asarray(image), cv2.COLOR_GRAY2BGR)
+
+
+def __prepare_ocr_image(file, image_folder, cds, new_coords, ocr_image_path, full_path):
     # generate name for image, since they are all stored in the same directory, add random number to prevent
     # overwriting of an image
     image_file = os.path.join(ocr_image_path, ('table_' + file.replace(' ', '')[:40].rstrip() + str(cds['page']) + '_' +
                                                str(random.randrange(1, 1000000)) + '.png'))
     cf.log("Table Extraction: Generating OCR pdfs...")
-    img_p = __get_image_path_from_page_no(image_folder, cds['page'])
-    img = cv2.imread(img_p)
+    img = __load_page_image(image_folder, cds['page'], full_path)
     crop_img = img[new_coords[1]:new_coords[3], new_coords[0]:new_coords[2]]  # crop to table
     no_line_img = __remove_lines(crop_img)
     if not os.path.exists(ocr_image_path):
@@ -381,6 +423,8 @@ def __should_filter(col):
 
 
 def __find_meaningful_cells(col, tokenizer):
+    # Pattern takes long to import and is only needed to filter tables
+    from pattern.text.en import singularize
     j = 0
     len_col = 0
     for entry in col:
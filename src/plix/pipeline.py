@@ -3,38 +3,50 @@
 This class is for running PLIX' whole workflow.
 Before you run it for the first time, please check the settings in the :class:`config` file.
 """
-import datetime
+import copy
 import functools
+import logging
 import os
 import shutil
 import sys
+import threading
 from itertools import chain
 
 import pandas as pd
 
+import plix.classes.metrics_collector as mc
 import plix.classes.normalizer as nm
+import plix.classes.ocr_engine as oe
 import plix.classes.pdf_data_extractor as pde
+import plix.classes.run_journal as rj
+import plix.classes.stage_cache as sc
+import plix.classes.stage_graph as sg
 import plix.classes.table_coordinates_client as tcc
 import plix.classes.table_info_extractor as taie
 import plix.classes.text_classifier as tc
 import plix.classes.text_info_extractor as teie
+import plix.classes.tokenizer as tk
+import plix.classes.worker_pool as wp
 import plix.helpers.common_functions as cf
+import plix.helpers.scheduling_utils as su
+import plix.helpers.storage_utils as stu
 import plix.nlp_assets as nlp_assets
 from plix.classes.tokenizer import Tokenizer
 
-
-def timer(func):
-    @functools.wraps(func)
-    def wrapper_timer(*args, **kwargs):
-        cf.log("STARTED {}".format(func.__name__))
-        then = datetime.datetime.now()
-        value = func(*args, **kwargs)
-        now = datetime.datetime.now()
-        run_time = now - then
-        cf.log("FINISHED {} in {}".format(func.__name__, run_time))
-        return value
-
-    return wrapper_timer
+# columns of the extraction results that identify a document
+RESULT_BASE_COLUMNS = ['Filename', 'FullPath', 'DocumentHash']
+# columns of the extraction results that the KVU extraction reads
+TEXT_KVU_COLUMNS = ['NormalizedText', 'MeaningfulText', 'Classification']
+TABLE_KVU_COLUMNS = ['NormalizedTableData', 'TableData', 'Classification']
+# columns of the extraction results that each step produces, only these are saved after the step
+STEP_COLUMNS = {
+    'extract_text': pde.TEXT_COLUMNS,
+    'extract_tables': ['TableData'],
+    'classify_text': ['Classification', 'ClassificationCount'],
+    'normalize': ['NormalizedTableData', 'NormalizedText']
+}
+# text columns that are removed from the extraction results with `config.lean_memory` once no further step reads them
+LEAN_TEXT_COLUMNS = ['allText', 'MeaningfulText', 'NormalizedText']
 
 
 def _split_unit(unit):
@@ -64,6 +76,158 @@ def _create_keywords_list(units, keywords):
     return keywords
 
 
+def _document_hashes(df):
+    if 'DocumentHash' in df.columns:
+        return df['DocumentHash']
+    return [None] * len(df.index)
+
+
+def _document_paths(df):
+    if 'FullPath' in df.columns:
+        return df['FullPath']
+    return [None] * len(df.index)
+
+
+def _run_per_document(df, stage, func, input_columns, cache, config, dk_hash):
+    # runs `func` document by document, so only documents with changed inputs have to be processed again
+    results = []
+    input_columns = [c for c in ['Filename'] + input_columns if c in df.columns]
+    for i, (full_path, doc_hash) in enumerate(zip(_document_paths(df), _document_hashes(df))):
+        document = df.iloc[[i]]
+        inputs = document[input_columns].values.tolist()
+        with mc.measure(stage, full_path):
+            results += sc.fetch(cache, stage, doc_hash, config, func, document, extra=[dk_hash, inputs])
+    return results
+
+
+def _classify_documents(df):
+    classes_, counts = tc.classify_texts(df)
+    df.loc[:, 'Classification'] = pd.Series(classes_.values, index=df.index)
+    df.loc[:, 'ClassificationCount'] = pd.Series(counts.values, index=df.index)
+    return df
+
+
+def _normalize_documents(df, keywords, config, cache, dk_hash):
+    # table normalizer
+    if cf.df_has_column(df, "TableData"):
+        normalized_tables = []
+        for full_path, doc_hash, tables in zip(_document_paths(df), _document_hashes(df), df['TableData']):
+            with mc.measure('table_normalization', full_path):
+                normalized_tables.append(sc.fetch(cache, 'normalized_tables', doc_hash, config, nm.normalize_tables,
+                                                  tables, keywords, config.do_table_multiple_normalization,
+                                                  extra=[dk_hash, tables]))
+        df.loc[:, 'NormalizedTableData'] = pd.Series(normalized_tables, index=df.index)
+
+    # text normalizer
+    if cf.df_has_column(df, "MeaningfulText"):
+        normalized_texts = []
+        for full_path, text in zip(_document_paths(df), df['MeaningfulText']):
+            with mc.measure('text_normalization', full_path):
+                normalized_texts.append(nm.normalize_text_per_page(text))
+        df.loc[:, 'NormalizedText'] = pd.Series(normalized_texts, index=df.index)
+    return df
+
+
+def _extract_text_kvu(df, keywords, units, config, cache, dk_hash):
+    return _run_per_document(df, 'kvu_text',
+                             lambda d: teie.extract_text_kvu(d, keywords, units, config.pdf_max_len_text),
+                             TEXT_KVU_COLUMNS, cache, config, dk_hash)
+
+
+def _extract_table_kvu(df, keywords, units, config, cache, dk_hash):
+    return _run_per_document(df, 'kvu_table',
+                             lambda d: taie.extract_table_kvu(d, keywords, units,
+                                                              do_pivot_search=config.do_pivot_search),
+                             TABLE_KVU_COLUMNS, cache, config, dk_hash)
+
+
+def process_document(full_path, tokenizer, coordinates, config, keywords, units, dk_hash=None):
+    """
+    Runs all steps set in `config` for a single pdf file: data extraction, text classification, normalization and
+    KVU extraction. This is the unit of work of the streaming mode, see :meth:`Pipeline.iter_pipeline`.
+
+    :param str full_path: path to the pdf file
+    :param plix.tokenizer.Tokenizer tokenizer: tokenizer object
+    :param pd.DataFrame coordinates: extracted table coordinates
+    :param plix.config.Config config: pipeline config object
+    :param list keywords: keys and synonyms of the domain knowledge
+    :param dict units: units of the domain knowledge
+    :param str dk_hash: hash of the domain knowledge for the stage cache
+
+    :returns: the extraction results of the document (one row), its text KVU tuples and its table KVU tuples
+    :rtype: tuple
+    """
+    cache = sc.get_stage_cache(config)
+    with mc.measure('document', full_path):
+        document = pde.add_document_hashes(pd.DataFrame([full_path], columns=['FullPath']))
+        document = pde.run_guarded(pde.extract_all_data_from_files, document, tokenizer, coordinates, config)
+        if config.do_text_class:
+            document = _classify_documents(document)
+        if config.do_normalization:
+            document = _normalize_documents(document, keywords, config, cache, dk_hash)
+        kvu_text = _extract_text_kvu(document, keywords, units, config, cache, dk_hash) \
+            if config.do_text_info_extraction else []
+        kvu_table = _extract_table_kvu(document, keywords, units, config, cache, dk_hash) \
+            if config.do_table_info_extraction else []
+    return document, kvu_text, kvu_table
+
+
+def calculate_document_coordinates(full_path, config):
+    """
+    Calculates the table coordinates of a single pdf file, e.g. of a file that was sent to the service.
+    The coordinates are saved in the stage cache.
+
+    :param str full_path: path to the pdf file
+    :param plix.config.Config config: pipeline config object
+
+    :returns: the coordinates in the format of :func:`plix.classes.table_coordinates_client.extract_coordinates`
+    :rtype: pd.DataFrame
+    """
+    size, table_coords = sc.fetch(sc.get_stage_cache(config), 'coordinates', sc.hash_file(full_path), config,
+                                  _extract_document_coordinates, full_path, config)
+    return pd.DataFrame([[full_path, size, table_coords]], columns=['FullPath', 'size', 'tableCoords'])
+
+
+def _extract_document_coordinates(full_path, config):
+    coordinates = tcc.extract_coordinates([full_path], config.image_folder, config.table_image_folder,
+                                          config.table_modes, config.tesseract_path, method='opencv',
+                                          is_debug=config.debug_mode, in_memory=config.in_memory_rasterization)
+    return [coordinates['size'].iloc[0], coordinates['tableCoords'].iloc[0]]
+
+
+def process_new_document(full_path, tokenizer, config, keywords, units, dk_hash=None):
+    """
+    Runs :func:`process_document` for a pdf file whose table coordinates are not known yet.
+
+    :param str full_path: path to the pdf file
+    :param plix.tokenizer.Tokenizer tokenizer: tokenizer object
+    :param plix.config.Config config: pipeline config object
+    :param list keywords: keys and synonyms of the domain knowledge
+    :param dict units: units of the domain knowledge
+    :param str dk_hash: hash of the domain knowledge for the stage cache
+
+    :returns: the extraction results of the document (one row), its text KVU tuples and its table KVU tuples
+    :rtype: tuple
+    """
+    coordinates = calculate_document_coordinates(full_path, config) if config.do_table else None
+    return process_document(full_path, tokenizer, coordinates, config, keywords, units, dk_hash)
+
+
+def _quarantine_lost_document(config, args, reason):
+    # result of a :func:`process_document` or :func:`process_new_document` task that the parent gave up
+    document = pde.add_document_hashes(pd.DataFrame([args[0]], columns=['FullPath']))
+    return pde.quarantine(pde.extract_all_data_from_files, document, config, reason), [], []
+
+
+def _to_document_result(document, kvu_text, kvu_table):
+    return {
+        'FullPath': document['FullPath'].iloc[0],
+        'extraction': document.iloc[0],
+        'kvu_text': cf.kvu_list_to_df(kvu_text),
+        'kvu_table': cf.kvu_list_to_df(kvu_table)
+    }
+
+
 class Pipeline(object):
 
     def __init__(self, config):
@@ -80,6 +244,13 @@ class Pipeline(object):
         self.units = None
         self.tokenizer = None
         self.data_extractor = None
+        self.stage_cache = None
+        self.dk_hash = None
+        self.worker_pool = None
+        self.metrics = mc.MetricsCollector(config)
+        oe.configure(config)
+        # steps that run at the same time change different columns of the extraction results
+        self.__results_lock = threading.Lock()
         cf.init_logging(logfile=self.config.log_file, do_print=self.config.debug_mode)
 
     ####################################################################################################################
@@ -123,8 +294,11 @@ class Pipeline(object):
         if self.config.do_normalization:
             self.keywords = nm.normalize_keyword_dk(self.keywords)
             self.units = nm.normalize_unit_dk(self.units)
+        self.dk_hash = sc.hash_object([self.keywords, self.units])
 
     def __load_tokenizer(self, force_refresh=False):
+        # download missing nltk resources before the workers start, so they do not download them at the same time
+        tk.ensure_nltk_data()
         tokenizer = Tokenizer(self.config.vocab_file)
         # generate vocab if not done yet, empty vocab file yields length of 1
         if tokenizer.get_vocab_len() < 2 or force_refresh:
@@ -135,45 +309,250 @@ class Pipeline(object):
         return tokenizer
 
     def __load_pdf_data_extractor(self):
-        return pde.PDFDataExtractor(self.config.datasheets_folder, self.tokenizer, self.config.dataframe_cores)
+        return pde.PDFDataExtractor(self.config.datasheets_folder, self.tokenizer, su.get_worker_count(self.config),
+                                    worker_pool=self.worker_pool)
+
+    def __load_worker_pool(self):
+        assets = {'config': self.config, 'tokenizer': self.tokenizer, 'keywords': self.keywords, 'units': self.units}
+        memory_estimates = self.config.worker_memory_estimates_mb if self.config.dataframe_cores == 'auto' else None
+        return wp.WorkerPool(su.get_worker_count(self.config), assets=assets,
+                             max_tasks_per_child=self.config.worker_max_tasks, memory_estimates=memory_estimates,
+                             memory_reserve_mb=self.config.worker_memory_reserve_mb,
+                             in_process_max_rows=self.config.in_process_max_documents)
+
+    def __shutdown_worker_pool(self):
+        if self.worker_pool is not None:
+            self.worker_pool.close()
+
+    def __load_cached_coordinates(self, pdf_paths):
+        cached_rows = []
+        new_paths = []
+        for path in pdf_paths:
+            found, value = False, None
+            if self.stage_cache is not None:
+                key = self.stage_cache.key('coordinates', sc.hash_file(path), self.config)
+                found, value = self.stage_cache.load('coordinates', key)
+            if found:
+                cached_rows.append([path] + value)
+            else:
+                new_paths.append(path)
+        return pd.DataFrame(cached_rows, columns=['FullPath', 'size', 'tableCoords']), new_paths
+
+    def __save_cached_coordinates(self, coordinate_results):
+        if self.stage_cache is None:
+            return
+        for _, row in coordinate_results.iterrows():
+            key = self.stage_cache.key('coordinates', sc.hash_file(row['FullPath']), self.config)
+            self.stage_cache.save('coordinates', key, [row['size'], row['tableCoords']])
+
+    def __copy_data_extractor(self):
+        # the extractor keeps the dataframe of its current extraction, so steps that run at the same time need a copy
+        return copy.copy(self.data_extractor)
+
+    def __get_results(self, columns):
+        # a copy of the columns a step reads, other steps may add columns to the extraction results in the meantime
+        with self.__results_lock:
+            return self.extraction_results[[c for c in columns if c in self.extraction_results.columns]].copy()
+
+    def __set_results(self, step, results):
+        # only the columns produced by the step are replaced
+        with self.__results_lock:
+            for column in STEP_COLUMNS[step]:
+                if column in results.columns:
+                    self.extraction_results[column] = results[column]
+            if self.config.save_intermediate_results:
+                stu.save_segment(self.extraction_results, self.config.result_file, step, self.config,
+                                 STEP_COLUMNS[step])
+
+    def __free_text_columns(self, graph, finished):
+        # the saved results still hold the removed columns
+        needed = graph.get_needed_inputs(finished)
+        with self.__results_lock:
+            if self.extraction_results is None:
+                return
+            for column in LEAN_TEXT_COLUMNS:
+                if column in self.extraction_results.columns and column not in needed:
+                    cf.log('Lean memory: removing %s from the extraction results', column)
+                    del self.extraction_results[column]
+
+    def __count_cached_documents(self, stage):
+        paths = cf.find_pdf_file_paths_in_directories(self.config.datasheets_folder)
+        cache = sc.get_stage_cache(self.config)
+        if cache is None:
+            return 0, len(paths)
+        return sum(cache.contains(stage, sc.hash_file(path), self.config) for path in paths), len(paths)
+
+    def __get_loaded_data(self):
+        # data that is loaded in :meth:`__preload_assets` instead of computed by a stage
+        loaded = ['pdfs']
+        if not self.config.is_new_data:
+            loaded += list(self.extraction_results.columns) if self.extraction_results is not None \
+                else pde.get_result_columns(self.config)
+        if self.config.do_table and not self.config.do_new_coordinates:
+            loaded.append('coordinates')
+        if self.config.do_merge and not self.config.is_new_data and not self.config.do_text_info_extraction:
+            loaded.append('kvu_text')
+        if self.config.do_merge and not self.config.is_new_data and not self.config.do_table_info_extraction:
+            loaded.append('kvu_table')
+        return loaded
+
+    def get_stage_graph(self):
+        """
+        Builds the graph of the pipeline steps that are set in the config, see :class:`classes.stage_graph`.
+
+        :returns: the graph
+        :rtype: plix.classes.stage_graph.StageGraph
+        """
+        config = self.config
+        text_cached = functools.partial(self.__count_cached_documents, 'text') \
+            if config.use_stage_cache and config.do_text_extraction else None
+        text_columns = [column for column in STEP_COLUMNS['extract_text']
+                        if column in pde.get_result_columns(config)]
+        stages = [
+            sg.Stage('extract_coordinates', self.extract_coordinates, ['pdfs'], ['coordinates'],
+                     enabled=config.do_new_coordinates,
+                     cached=functools.partial(self.__count_cached_documents, 'coordinates')
+                     if config.use_stage_cache else None),
+            sg.Stage('prepare_dataset', self.prepare_dataset, ['pdfs'] + (['coordinates'] if config.do_table else []),
+                     pde.get_result_columns(config), enabled=config.is_new_data, cached=text_cached),
+            sg.Stage('extract_text', self.extract_text, ['FullPath'], text_columns,
+                     enabled=not config.is_new_data and config.do_text_extraction, cached=text_cached),
+            sg.Stage('extract_tables', self.extract_tables, ['FullPath', 'coordinates'], STEP_COLUMNS['extract_tables'],
+                     enabled=not config.is_new_data and config.do_table),
+            sg.Stage('classify_text', self.classify_text, ['allText'], STEP_COLUMNS['classify_text'],
+                     enabled=config.do_text_class),
+            sg.Stage('normalize', self.normalize, ['TableData', 'MeaningfulText'], STEP_COLUMNS['normalize'],
+                     enabled=config.do_normalization),
+            sg.Stage('extract_text_information', self.extract_text_information, TEXT_KVU_COLUMNS, ['kvu_text'],
+                     enabled=config.do_text_info_extraction),
+            sg.Stage('extract_table_information', self.extract_table_information, TABLE_KVU_COLUMNS, ['kvu_table'],
+                     enabled=config.do_table_info_extraction),
+            sg.Stage('merge_info_extraction', self.merge_info_extraction, ['kvu_text', 'kvu_table'], ['kvu_merged'],
+                     enabled=config.do_merge or (config.do_text_info_extraction and config.do_table_info_extraction))
+        ]
+        return sg.StageGraph(stages, self.__get_loaded_data())
+
+    def get_streaming_graph(self):
+        """
+        Builds the graph of the streaming mode, see :meth:`iter_pipeline`. The steps of a document run in one worker,
+        so they are a single stage, see :meth:`get_streaming_document_steps`.
+
+        :returns: the graph
+        :rtype: plix.classes.stage_graph.StageGraph
+        """
+        config = self.config
+        outputs = (pde.get_result_columns(config)
+                   + (STEP_COLUMNS['classify_text'] if config.do_text_class else [])
+                   + (STEP_COLUMNS['normalize'] if config.do_normalization else [])
+                   + (['kvu_text'] if config.do_text_info_extraction else [])
+                   + (['kvu_table'] if config.do_table_info_extraction else []))
+        stages = [
+            sg.Stage('extract_coordinates', self.extract_coordinates, ['pdfs'], ['coordinates'],
+                     enabled=config.do_new_coordinates,
+                     cached=functools.partial(self.__count_cached_documents, 'coordinates')
+                     if config.use_stage_cache else None),
+            sg.Stage('process_document', process_document, ['pdfs'] + (['coordinates'] if config.do_table else []),
+                     outputs),
+            sg.Stage('merge_info_extraction', self.merge_info_extraction, ['kvu_text', 'kvu_table'], ['kvu_merged'],
+                     enabled=config.do_merge or (config.do_text_info_extraction and config.do_table_info_extraction))
+        ]
+        loaded = [data for data in self.__get_loaded_data() if data in ['pdfs', 'coordinates', 'kvu_text', 'kvu_table']]
+        return sg.StageGraph(stages, loaded)
+
+    def get_streaming_document_steps(self):
+        """
+        Returns the steps that :func:`process_document` runs for every document in streaming mode.
+
+        :returns: the names of the steps in their order
+        :rtype: list
+        """
+        config = self.config
+        steps = [('extract_text', config.do_text_extraction), ('extract_tables', config.do_table),
+                 ('classify_text', config.do_text_class), ('normalize', config.do_normalization),
+                 ('extract_text_information', config.do_text_info_extraction),
+                 ('extract_table_information', config.do_table_info_extraction)]
+        return [name for name, enabled in steps if enabled]
+
+    def format_plan(self):
+        """
+        Describes the execution plan of the mode set in the config, e.g. for a dry run: the graph of
+        :meth:`get_streaming_graph` and the steps per document if `config.stream_documents` is set, otherwise the graph
+        of :meth:`get_stage_graph`.
+
+        :returns: one line per stage
+        :rtype: str
+        """
+        if not self.config.stream_documents:
+            return self.get_stage_graph().format_plan()
+        return '{}\nper document: {}'.format(self.get_streaming_graph().format_plan(),
+                                             ', '.join(self.get_streaming_document_steps()) or '-')
+
+    def __get_result_columns(self):
+        # the steps before the KVU extraction change the extraction results and save them again, so they need all
+        # columns
+        if self.config.do_text_extraction or self.config.do_table or self.config.do_text_class \
+                or self.config.do_normalization:
+            return None
+        columns = list(RESULT_BASE_COLUMNS)
+        if self.config.do_text_info_extraction:
+            columns += TEXT_KVU_COLUMNS
+        if self.config.do_table_info_extraction:
+            columns += TABLE_KVU_COLUMNS
+        return columns
 
-    @timer
+    @mc.measured_stage
     def __preload_assets(self):
         try:
             if not self.config.is_new_data:
-                self.extraction_results = cf.load_df(self.config.dataframe_file)
-                # 11 is the column length after DE.read_files_to_dataframe
-                assert len(self.extraction_results.columns) >= 11
+                columns = self.__get_result_columns()
+                self.extraction_results = stu.load_results(self.config.dataframe_file, self.config, columns=columns)
+                if self.config.lean_memory:
+                    self.extraction_results = self.extraction_results.drop(columns=pde.TEXT_VARIANT_COLUMNS,
+                                                                           errors='ignore')
+                # 11 is the column length after DE.read_files_to_dataframe, the lean mode has no text variants
+                min_columns = 11 - (len(pde.TEXT_VARIANT_COLUMNS) if self.config.lean_memory else 0)
+                assert columns is not None or len(self.extraction_results.columns) >= min_columns
             if self.config.do_table and not self.config.do_new_coordinates:
-                self.data_extractor.table_coordinates = cf.load_df(self.config.coordinate_file)
-            if self.config.do_merge and not self.config.is_new_data and not self.config.do_text_info_extraction:
-                self.kvu_text_results = cf.load_df(self.config.text_info_file)
-            if self.config.do_merge and not self.config.is_new_data and not self.config.do_table_info_extraction:
-                self.kvu_table_results = cf.load_df(self.config.table_info_file)
+                self.data_extractor.table_coordinates = stu.load_results(self.config.coordinate_file, self.config)
+            self.__load_missing_kvu_results()
         except FileNotFoundError as e:
-            cf.log("Error preloading assets: " + str(e))
+            cf.log("Error preloading assets: %s", e, level=logging.ERROR)
             sys.exit(1)
 
+    def __load_missing_kvu_results(self):
+        # the merge reads the KVU results of a disabled extraction from the files of the previous run
+        if self.config.do_merge and not self.config.is_new_data and not self.config.do_text_info_extraction:
+            self.kvu_text_results = stu.load_results(self.config.text_info_file, self.config)
+        if self.config.do_merge and not self.config.is_new_data and not self.config.do_table_info_extraction:
+            self.kvu_table_results = stu.load_results(self.config.table_info_file, self.config)
+
     ####################################################################################################################
     # PIPELINE STEPS                                                                                                   #
     ####################################################################################################################
 
-    @timer
+    @mc.measured_stage
     def extract_coordinates(self):
         """
         This will generate table coordinates for files in the stream and ocr category.
         Please see :class:`classes.table_coordinates_client` for more information.
         """
         pdf_paths = self.data_extractor.paths
-        coordinate_results = tcc.extract_coordinates(pdf_paths, self.config.image_folder,
+        cached_coordinates, new_paths = self.__load_cached_coordinates(pdf_paths)
+        cf.log("Coordinates: %d cached, %d new documents", len(cached_coordinates.index), len(new_paths))
+        coordinate_results = tcc.extract_coordinates(new_paths, self.config.image_folder,
                                                      self.config.table_image_folder,
                                                      self.config.table_modes, self.config.tesseract_path,
-                                                     method='opencv', is_debug=self.config.debug_mode)
+                                                     method='opencv', is_debug=self.config.debug_mode,
+                                                     worker_pool=self.worker_pool,
+                                                     in_memory=self.config.in_memory_rasterization)
+        self.__save_cached_coordinates(coordinate_results)
+        coordinate_results = pd.concat([cached_coordinates, coordinate_results], ignore_index=True)
+        coordinate_results = (coordinate_results.set_index('FullPath').reindex(pdf_paths).reset_index())
         self.data_extractor.table_coordinates = coordinate_results
         if self.config.save_intermediate_results:
-            cf.save_df(self.data_extractor.table_coordinates, self.config.coordinate_file)
+            stu.save_results(self.data_extractor.table_coordinates, self.config.coordinate_file, self.config)
 
-    @timer
+    @mc.measured_stage
     def prepare_dataset(self):
         """
         This executes the data set preparation and data extraction. This needs to be run, when new data sheets are used
@@ -182,129 +561,267 @@ class Pipeline(object):
         For more information, please see :class:`classes.pdf_data_extractor` and
         :class:`classes.text_classifier`.
         """
-        extraction_results = self.data_extractor.extract_data_from_pdfs(config=self.config)
-        self.extraction_results = extraction_results
-        # save data frame
-        if self.config.save_intermediate_results:
-            cf.save_df(self.extraction_results, self.config.result_file)
-
-    @timer
+        extraction_results = self.__copy_data_extractor().extract_data_from_pdfs(config=self.config)
+        with self.__results_lock:
+            self.extraction_results = extraction_results
+            # save data frame
+            if self.config.save_intermediate_results:
+                stu.save_segment(self.extraction_results, self.config.result_file, 'prepare_dataset', self.config)
+
+    @mc.measured_stage
     def extract_text(self):
         """
         This step extracts the test if and only if config.is_new_data` is false and
         `config.do_text_info_extraction` is set.
         """
-        extraction_results = self.data_extractor.extract_data_from_pdfs(pde.process_texts, self.extraction_results,
-                                                                        config=self.config)
-        self.extraction_results = extraction_results
-        if self.config.save_intermediate_results:
-            cf.save_df(self.extraction_results, self.config.result_file)
+        results = self.__copy_data_extractor().extract_data_from_pdfs(
+            pde.process_texts, self.__get_results(RESULT_BASE_COLUMNS), config=self.config)
+        self.__set_results('extract_text', results)
 
-    @timer
+    @mc.measured_stage
     def extract_tables(self):
         """
         This step extracts the test if and only if `config.is_new_data` is false and
         `config.do_table_info_extraction` is set.
         """
-        extraction_results = self.data_extractor.extract_data_from_pdfs(pde.process_tables, self.extraction_results,
-                                                                        config=self.config)
-        self.extraction_results = extraction_results
-        if self.config.save_intermediate_results:
-            cf.save_df(self.extraction_results, self.config.result_file)
+        results = self.__copy_data_extractor().extract_data_from_pdfs(
+            pde.process_tables, self.__get_results(RESULT_BASE_COLUMNS), config=self.config)
+        self.__set_results('extract_tables', results)
 
-    @timer
+    @mc.measured_stage
     def classify_text(self):
         """
         Classifies the texts of all documents with the given classes.
         """
-        classes_, counts = tc.classify_texts(self.extraction_results)
-        self.extraction_results.loc[:, 'Classification'] = classes_
-        self.extraction_results.loc[:, 'ClassificationCount'] = counts
-        if self.config.save_intermediate_results:
-            cf.save_df(self.extraction_results, self.config.result_file)
+        self.__set_results('classify_text', _classify_documents(self.__get_results(['Filename', 'allText'])))
 
-    @timer
+    @mc.measured_stage
     def normalize(self):
         """
         Normalization step. Formats text/tables/domain knowledge into a predefined format for easier KVU extraction
         """
-        # table normalizer
-        if cf.df_has_column(self.extraction_results, "TableData"):
-            self.extraction_results.loc[:, 'NormalizedTableData'] = nm.normalize_tables_from_pd_series(
-                self.extraction_results['TableData'], self.keywords, self.config.do_table_multiple_normalization)
+        pool = self.worker_pool
+        documents = self.__get_results(RESULT_BASE_COLUMNS + ['TableData', 'MeaningfulText'])
+        results = pd.concat(pool.map_partitions(_normalize_documents, documents, pool.ref('keywords'),
+                                                pool.ref('config'), self.stage_cache, self.dk_hash, stage='normalize'))
+        self.__set_results('normalize', results)
 
-        # text normalizer
-        if cf.df_has_column(self.extraction_results, "MeaningfulText"):
-            self.extraction_results.loc[:, 'NormalizedText'] = nm.normalize_text_from_pd_series(
-                self.extraction_results['MeaningfulText'])
-
-        if self.config.save_intermediate_results:
-            cf.save_df(self.extraction_results, self.config.result_file)
-
-    @timer
+    @mc.measured_stage
     def extract_text_information(self):
         """
         Extract KVU tuples from the running text.
         """
-        kvu_text_results = teie.extract_text_kvu(self.extraction_results, self.keywords, self.units,
-                                                 self.config.pdf_max_len_text)
+        pool = self.worker_pool
+        documents = self.__get_results(RESULT_BASE_COLUMNS + TEXT_KVU_COLUMNS)
+        kvu_text_results = list(chain.from_iterable(pool.map_partitions(
+            _extract_text_kvu, documents, pool.ref('keywords'), pool.ref('units'), pool.ref('config'),
+            self.stage_cache, self.dk_hash, stage='kvu_text')))
         self.kvu_text_results = cf.kvu_list_to_df(kvu_text_results)
         if self.config.save_intermediate_results:
-            cf.save_df(self.kvu_text_results, self.config.text_info_file)
+            stu.save_results(self.kvu_text_results, self.config.text_info_file, self.config)
 
-    @timer
+    @mc.measured_stage
     def extract_table_information(self):
         """
         Extracts key-value-unit tuples of all tables.
         """
-        kvu_table_results = taie.extract_table_kvu(self.extraction_results, self.keywords, self.units,
-                                                   do_pivot_search=self.config.do_pivot_search)
+        pool = self.worker_pool
+        documents = self.__get_results(RESULT_BASE_COLUMNS + TABLE_KVU_COLUMNS)
+        kvu_table_results = list(chain.from_iterable(pool.map_partitions(
+            _extract_table_kvu, documents, pool.ref('keywords'), pool.ref('units'), pool.ref('config'),
+            self.stage_cache, self.dk_hash, stage='kvu_table')))
         self.kvu_table_results = cf.kvu_list_to_df(kvu_table_results)
         if self.config.save_intermediate_results:
-            cf.save_df(self.kvu_table_results, self.config.table_info_file)
+            stu.save_results(self.kvu_table_results, self.config.table_info_file, self.config)
 
-    @timer
+    @mc.measured_stage
     def merge_info_extraction(self):
         """
         This func merges the results from the text and table key-value extraction.
         The result is saved in a new file.
         """
         self.merged_kvu_results = taie.remove_text_table_duplicates(self.kvu_table_results, self.kvu_text_results)
-        cf.log("Entries after merging: " + str(len(self.merged_kvu_results.index)))
+        cf.log("Entries after merging: %d", len(self.merged_kvu_results.index))
         if self.config.save_intermediate_results:
             cf.save_df(self.merged_kvu_results, self.config.merged_info_file, target=['csv', 'xlsx'])
 
-    def run_pipeline(self, key_value_retrieval_dict):
+    def iter_pipeline(self, key_value_retrieval_dict, exclude=None):
+        """
+        Streaming mode of the pipeline. Every pdf runs through data extraction, text classification, normalization and
+        KVU extraction in one worker, see :func:`process_document`. The results are yielded as soon as a document is
+        finished, so the memory only holds the documents currently processed and first results are available early.
+        The order of the documents is not preserved.
+
+        The table coordinates are calculated for all documents beforehand, if `config.do_new_coordinates` is set.
+        Since the extraction results are not kept, they are not saved to `config.result_file`, but the stage cache
+        still holds the outputs of every document.
+
+        :param dict key_value_retrieval_dict: the domain knowledge
+        :param set exclude: optional paths of pdfs that are skipped, e.g. the finished documents of a resumed run
+
+        :returns: generator of dictionaries with the keys 'FullPath', 'extraction' (pd.Series with the extraction
+            results of the document), 'kvu_text' and 'kvu_table' (pd.DataFrame with the KVU tuples)
+        :rtype: generator
+        """
+        try:
+            yield from self.__iter_documents(key_value_retrieval_dict, exclude)
+        finally:
+            self.metrics.write_report()
+
+    def __iter_documents(self, key_value_retrieval_dict, exclude):
+        # the documents of :meth:`iter_pipeline`, without writing the metrics report, run_pipeline writes it once after
+        # the whole streaming step is measured
+        self.__prepare_run(key_value_retrieval_dict)
+        if exclude:
+            self.data_extractor.paths = [path for path in self.data_extractor.paths if path not in exclude]
+        try:
+            if self.config.do_new_coordinates:
+                self.extract_coordinates()
+            elif self.config.do_table:
+                self.data_extractor.table_coordinates = stu.load_results(self.config.coordinate_file, self.config)
+        except FileNotFoundError as e:
+            cf.log("Error preloading assets: %s", e, level=logging.ERROR)
+            sys.exit(1)
+
+        pool = self.worker_pool
+        coordinates = self.data_extractor.table_coordinates
+        inputs = [(path, pool.ref('tokenizer'), pde.select_coordinates(coordinates, [path]), pool.ref('config'),
+                   pool.ref('keywords'), pool.ref('units'), self.dk_hash)
+                  for path in su.order_by_cost(self.data_extractor.paths, self.config)]
+        try:
+            # a document that hangs or whose worker dies is quarantined
+            results = pool.imap_unordered(process_document, inputs, stage='document',
+                                          deadline=pde.get_task_deadline(self.config),
+                                          on_lost=functools.partial(_quarantine_lost_document, self.config))
+            for document, kvu_text, kvu_table in results:
+                cf.log("Finished document %s", document['FullPath'].iloc[0])
+                yield _to_document_result(document, kvu_text, kvu_table)
+        finally:
+            self.__shutdown_worker_pool()
+
+    def start(self, key_value_retrieval_dict):
+        """
+        Prepares the pipeline to process single files with :meth:`process_file`, e.g. in the service. The domain
+        knowledge is normalized, the tokenizer is loaded and the workers are started once and kept running until
+        :meth:`stop` is called.
+
+        :param dict key_value_retrieval_dict: the domain knowledge
         """
-        This will start the execution of the pipeline. All steps set in `config` will be executed.
+        self.__prepare_run(key_value_retrieval_dict)
+        self.worker_pool.start()
+
+    def process_file(self, full_path):
+        """
+        Runs all steps set in `config` for a single pdf file in one of the workers, see :func:`process_new_document`.
+        The pipeline has to be started with :meth:`start`. This method can be called from several threads at once.
+
+        :param str full_path: path to the pdf file
+
+        :returns: dictionary with the keys 'FullPath', 'extraction' (pd.Series with the extraction results of the
+            document), 'kvu_text' and 'kvu_table' (pd.DataFrame with the KVU tuples)
+        :rtype: dict
         """
+        pool = self.worker_pool
+        document, kvu_text, kvu_table = pool.apply(process_new_document, (
+            full_path, pool.ref('tokenizer'), pool.ref('config'), pool.ref('keywords'), pool.ref('units'),
+            self.dk_hash), deadline=pde.get_task_deadline(self.config),
+            on_lost=functools.partial(_quarantine_lost_document, self.config))
+        return _to_document_result(document, kvu_text, kvu_table)
+
+    def stop(self):
+        """
+        Stops the workers of a pipeline started with :meth:`start` and writes the metrics report.
+        """
+        self.__shutdown_worker_pool()
+        self.metrics.write_report()
+
+    @mc.measured_stage
+    def __run_streaming(self, key_value_retrieval_dict, callback):
+        kvu_text_results = []
+        kvu_table_results = []
+        journal = rj.RunJournal(self.config.journal_file)
+        finished = {}
+        if self.config.resume:
+            finished = journal.load()
+        else:
+            journal.reset()
+        for entry in finished.values():
+            result = rj.RunJournal.to_result(entry)
+            kvu_text_results.append(result['kvu_text'])
+            kvu_table_results.append(result['kvu_table'])
+        for result in self.__iter_documents(key_value_retrieval_dict, set(finished.keys())):
+            journal.append(result)
+            if callback is not None:
+                callback(result)
+            kvu_text_results.append(result['kvu_text'])
+            kvu_table_results.append(result['kvu_table'])
+        self.kvu_text_results = pd.concat(kvu_text_results, ignore_index=True) if kvu_text_results \
+            else cf.kvu_list_to_df([])
+        self.kvu_table_results = pd.concat(kvu_table_results, ignore_index=True) if kvu_table_results \
+            else cf.kvu_list_to_df([])
+        if self.config.save_intermediate_results:
+            if self.config.do_text_info_extraction:
+                stu.save_results(self.kvu_text_results, self.config.text_info_file, self.config)
+            if self.config.do_table_info_extraction:
+                stu.save_results(self.kvu_table_results, self.config.table_info_file, self.config)
+        # the same condition as the merge stage of :meth:`get_stage_graph`
+        if self.config.do_merge or (self.config.do_text_info_extraction and self.config.do_table_info_extraction):
+            try:
+                self.__load_missing_kvu_results()
+            except FileNotFoundError as e:
+                cf.log("Error preloading assets: %s", e, level=logging.ERROR)
+                sys.exit(1)
+            self.merge_info_extraction()
+
+    def __prepare_run(self, key_value_retrieval_dict):
         self.__prepare_directories()
         self.__prep_keys_and_units(key_value_retrieval_dict)
         self.tokenizer = self.__load_tokenizer(self.config.force_vocab_reload)
+        self.stage_cache = sc.get_stage_cache(self.config)
+        self.metrics.start()
+        self.worker_pool = self.__load_worker_pool()
         self.data_extractor = self.__load_pdf_data_extractor()
-        # load all needed data
-        self.__preload_assets()
-
-        if self.config.do_new_coordinates:
-            self.extract_coordinates()
-        if self.config.is_new_data:
-            # run parallelization
-            self.prepare_dataset()
-        else:
-            if self.config.do_text_extraction:
-                self.extract_text()
-            if self.config.do_table:
-                self.extract_tables()
-        if self.config.do_text_class:
-            self.classify_text()
-        if self.config.do_normalization:
-            self.normalize()
-        if self.config.do_text_info_extraction:
-            self.extract_text_information()
-        if self.config.do_table_info_extraction:
-            self.extract_table_information()
-        if self.config.do_merge or (self.config.do_text_info_extraction and self.config.do_table_info_extraction):
-            self.merge_info_extraction()
+
+    def __run_steps(self):
+        graph = self.get_stage_graph()
+        cf.log('Execution plan:\n%s', graph.format_plan())
+        # the stages share the pool, it is started by the first stage that needs the workers
+        on_finished = functools.partial(self.__free_text_columns, graph) if self.config.lean_memory else None
+        graph.run(max_parallel=None if self.config.parallel_stages else 1, on_finished=on_finished)
+
+    def run_pipeline(self, key_value_retrieval_dict, callback=None):
+        """
+        This will start the execution of the pipeline. All steps set in `config` will be executed. The steps run as a
+        graph, steps that do not depend on each other run at the same time, see :meth:`get_stage_graph`. If
+        `config.dry_run` is set, only the execution plan is logged, see :meth:`format_plan`.
+
+        If `config.stream_documents` is set, the documents are processed one by one with :meth:`iter_pipeline`.
+        Then, `callback` is called with the result of every document as soon as it is finished. Every finished
+        document is saved in `config.journal_file`, if `config.resume` is set, these documents are skipped.
+
+        :param dict key_value_retrieval_dict: the domain knowledge
+        :param function callback: optional function that is called with the result of each document in streaming mode
+        """
+        if self.config.dry_run:
+            cf.log('Execution plan:\n%s', self.format_plan())
+            return
+        if self.config.stream_documents:
+            try:
+                self.__run_streaming(key_value_retrieval_dict, callback)
+            finally:
+                self.metrics.write_report()
+            if not self.config.save_intermediate_results:
+                self.__remove_intermediate_directories()
+            return
+
+        self.__prepare_run(key_value_retrieval_dict)
+        try:
+            # load all needed data
+            self.__preload_assets()
+            self.__run_steps()
+        finally:
+            self.__shutdown_worker_pool()
+            self.metrics.write_report()
 
         if not self.config.save_intermediate_results:
             self.__remove_intermediate_directories()
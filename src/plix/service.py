@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+This class runs PLIX as a long-running service with a local HTTP API.
+
+The pipeline is started once: the domain knowledge is normalized, the tokenizer is loaded and the workers import the
+heavy modules and load their assets. Afterwards, every pdf sent to the service only costs the extraction itself.
+The requests are handled by an asyncio front end and put into a bounded queue. If the queue is full, the service
+answers with 503, so clients can back off instead of piling up work. The documents are processed by the worker pool
+of the pipeline, see :meth:`plix.pipeline.Pipeline.process_file`.
+
+The API has the following endpoints:
+
++--------+----------+------------------------------------------------------------------------------------------+
+| method |   path   |                                       description                                        |
++========+==========+==========================================================================================+
+| GET    | /health  | status of the service and number of queued documents                                     |
++--------+----------+------------------------------------------------------------------------------------------+
+| POST   | /extract | extracts the KVU tuples of a pdf, the body is either the pdf itself                      |
+|        |          | (Content-Type: application/pdf) or JSON with the path of a local pdf, e.g.               |
+|        |          | {"path": "/data/ocr/file.pdf"}. Uploads take the query parameters `filename` and `mode`  |
+|        |          | (table extraction mode, one of `config.table_modes`, default 'no_table').                |
+|        |          | The answer is JSON with the keys 'FullPath', 'kvu_text' and 'kvu_table'.                 |
++--------+----------+------------------------------------------------------------------------------------------+
+
+Example::
+
+    plix serve --config config.json --dk motor_dk.json
+    curl --data-binary @file.pdf -H "Content-Type: application/pdf" \
+        "http://127.0.0.1:8765/extract?filename=file.pdf&mode=lattice"
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import signal
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import plix.helpers.common_functions as cf
+
+HTTP_STATUS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable'
+}
+# seconds a client should wait before it retries a rejected request
+RETRY_AFTER = 5
+
+
+class ServiceError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class PlixService:
+    def __init__(self, pipeline):
+        """
+        The service answers requests with the results of `pipeline`.
+
+        :param plix.pipeline.Pipeline pipeline: the pipeline, its config holds the service settings
+        """
+        self.pipeline = pipeline
+        self.config = pipeline.config
+        self.queue = None
+        self.__executor = None
+
+    def run(self, key_value_retrieval_dict):
+        """
+        Starts the pipeline and serves requests until the process is interrupted or terminated.
+
+        :param dict key_value_retrieval_dict: the domain knowledge
+        """
+        self.pipeline.start(key_value_retrieval_dict)
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            cf.log('Service stopped')
+            self.pipeline.stop()
+
+    async def serve(self):
+        """
+        Serves requests until SIGINT or SIGTERM is received. The pipeline has to be started.
+        """
+        workers = self.pipeline.worker_pool.processes
+        self.queue = asyncio.Queue(maxsize=self.config.service_queue_size)
+        # the threads only wait for the worker processes
+        self.__executor = ThreadPoolExecutor(max_workers=workers)
+        consumers = [asyncio.create_task(self.__consume()) for _ in range(workers)]
+        if self.config.service_socket:
+            server = await asyncio.start_unix_server(self.__handle_connection, path=self.config.service_socket)
+            address = self.config.service_socket
+        else:
+            server = await asyncio.start_server(self.__handle_connection, self.config.service_host,
+                                                self.config.service_port)
+            address = 'http://{}:{}'.format(self.config.service_host, self.config.service_port)
+        stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                asyncio.get_running_loop().add_signal_handler(sig, stop.set)
+            except NotImplementedError:
+                # not supported on Windows, there KeyboardInterrupt stops the service
+                pass
+        cf.log('Service listening on %s', address)
+        try:
+            async with server:
+                await stop.wait()
+        finally:
+            for consumer in consumers:
+                consumer.cancel()
+            self.__executor.shutdown(wait=False)
+
+    async def __consume(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            full_path, future = await self.queue.get()
+            try:
+                result = await loop.run_in_executor(self.__executor, self.pipeline.process_file, full_path)
+                if not future.done():
+                    future.set_result(result)
+            except Exception as ex:
+                if not future.done():
+                    future.set_exception(ex)
+            finally:
+                self.queue.task_done()
+
+    async def __handle_connection(self, reader, writer):
+        try:
+            method, path, query, headers, body = await self.__read_request(reader)
+            status, response = await self.__route(method, path, query, headers, body)
+        except ServiceError as ex:
+            status, response = ex.status, {'error': ex.message}
+        except Exception as ex:
+            cf.log('Service error: %s', ex, level=logging.WARNING)
+            status, response = 500, {'error': str(ex)}
+        try:
+            await self.__write_response(writer, status, response)
+        except ConnectionError:
+            cf.log('Service: client disconnected before the response was sent', level=logging.WARNING)
+
+    async def __read_request(self, reader):
+        request_line = (await reader.readline()).decode('latin-1').split()
+        if len(request_line) != 3:
+            raise ServiceError(400, 'Malformed request line')
+        method, target, _ = request_line
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise ServiceError(400, 'Invalid Content-Length')
+        if length > self.config.service_max_upload_mb * 1024 * 1024:
+            raise ServiceError(413, 'The pdf is larger than {} MB'.format(self.config.service_max_upload_mb))
+        body = await reader.readexactly(length) if length else b''
+        url = urlsplit(target)
+        return method.upper(), url.path, parse_qs(url.query), headers, body
+
+    async def __route(self, method, path, query, headers, body):
+        if path == '/health':
+            return 200, {'status': 'ok', 'queued': self.queue.qsize(), 'queue_size': self.queue.maxsize,
+                         'workers': self.pipeline.worker_pool.processes}
+        if path != '/extract':
+            raise ServiceError(404, 'Unknown path ' + path)
+        if method != 'POST':
+            raise ServiceError(405, 'Use POST to send a pdf')
+        full_path = self.__get_document_path(query, headers, body)
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((full_path, future))
+        except asyncio.QueueFull:
+            raise ServiceError(503, 'Too many documents in the queue, retry later')
+        result = await future
+        return 200, {
+            'FullPath': result['FullPath'],
+            'kvu_text': json.loads(result['kvu_text'].to_json(orient='records')),
+            'kvu_table': json.loads(result['kvu_table'].to_json(orient='records'))
+        }
+
+    def __get_document_path(self, query, headers, body):
+        if headers.get('content-type', '').startswith('application/pdf'):
+            return self.__save_upload(query, body)
+        try:
+            full_path = json.loads(body.decode('utf-8'))['path']
+        except (ValueError, KeyError, TypeError):
+            raise ServiceError(400, 'Send a pdf or JSON with the key "path"')
+        if not os.path.isfile(full_path):
+            raise ServiceError(400, 'File not found: ' + str(full_path))
+        return os.path.abspath(full_path)
+
+    def __save_upload(self, query, body):
+        if not body.startswith(b'%PDF'):
+            raise ServiceError(400, 'The body is not a pdf')
+        mode = query.get('mode', ['no_table'])[0]
+        if mode not in self.config.table_modes:
+            raise ServiceError(400, 'Unknown mode {}, use one of {}'.format(mode, self.config.table_modes))
+        doc_hash = hashlib.sha256(body).hexdigest()
+        filename = os.path.basename(query.get('filename', [doc_hash + '.pdf'])[0]) or doc_hash + '.pdf'
+        # the mode is read from the folder name, see :func:`plix.helpers.common_functions.get_mode`
+        folder = os.path.join(self.config.service_upload_folder, doc_hash, mode)
+        full_path = os.path.abspath(os.path.join(folder, filename))
+        if not os.path.exists(full_path):
+            os.makedirs(folder, exist_ok=True)
+            with open(full_path, mode='wb') as fp:
+                fp.write(body)
+        return full_path
+
+    @staticmethod
+    async def __write_response(writer, status, response):
+        body = json.dumps(response).encode('utf-8')
+        head = ['HTTP/1.1 {} {}'.format(status, HTTP_STATUS[status]),
+                'Content-Type: application/json',
+                'Content-Length: ' + str(len(body)),
+                'Connection: close']
+        if status == 503:
+            head.append('Retry-After: ' + str(RETRY_AFTER))
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+        writer.close()
+        await writer.wait_closed()
+
+
+def main(argv=None):
+    """
+    Starts the service from the command line, the same as `plix serve`, see :func:`plix.cli.main`.
+
+    :param list argv: command line arguments without the subcommand, if None `sys.argv` is used
+    """
+    # imported here, the command line interface imports this module
+    import plix.cli
+    plix.cli.main(['serve'] + (sys.argv[1:] if argv is None else list(argv)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+import plix.classes.metrics_collector as mc
+import plix.classes.pdf_data_extractor as pde
+import plix.classes.worker_pool as wp
+from plix.config import Config
+
+
+@pytest.fixture
+def config(tmp_path):
+    return Config(str(tmp_path), document_timeout=0.5, document_retry_config={'do_ocr': False})
+
+
+@pytest.fixture
+def quarantined(monkeypatch):
+    records = []
+    monkeypatch.setattr(mc, 'record_quarantine', lambda *args: records.append(args))
+    return records
+
+
+@pytest.fixture
+def document():
+    return pd.DataFrame([['/data/stream/file.pdf']], columns=['FullPath'])
+
+
+def test_limits_timeout():
+    with pytest.raises(wp.LimitExceeded) as ex:
+        with wp.limits(timeout=0.2):
+            time.sleep(5)
+    assert ex.value.reason == 'timeout'
+
+
+def test_limits_without_limit_exceeded():
+    with wp.limits(timeout=1):
+        value = 1
+    # the alarm is stopped after the block
+    time.sleep(1.2)
+    assert value == 1
+
+
+def test_limits_are_not_enforced_outside_the_main_thread():
+    finished = []
+
+    def run():
+        with wp.limits(timeout=0.1):
+            time.sleep(0.3)
+        finished.append(True)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    assert finished == [True]
+
+
+def test_run_guarded_retries_after_a_timeout(config, quarantined, document):
+    def extract(dataframe, attempt_config):
+        if attempt_config.do_ocr:
+            time.sleep(5)
+        dataframe['Text'] = 'text'
+        return dataframe
+
+    result = pde.run_guarded(extract, document, config)
+    assert result['Text'].tolist() == ['text']
+    assert quarantined == []
+
+
+def test_run_guarded_quarantines_after_the_retry(monkeypatch, config, quarantined, document):
+    def process_texts(dataframe, attempt_config):
+        if attempt_config.do_ocr:
+            time.sleep(5)
+        raise ValueError('broken pdf')
+
+    # the empty columns of a quarantined document depend on the extraction function
+    monkeypatch.setattr(pde, 'process_texts', process_texts)
+    result = pde.run_guarded(pde.process_texts, document, config)
+    assert quarantined == [('/data/stream/file.pdf', 'process_texts', 'error: broken pdf')]
+    assert all(result[column].tolist() == [''] for column in pde.TEXT_COLUMNS)
@@ -0,0 +1,119 @@
+import os
+import signal
+import time
+
+import pandas as pd
+import pytest
+
+import plix.classes.worker_pool as wp
+
+
+def _add_offset(value, offset):
+    return value + offset
+
+
+def _get_pid(value):
+    return value, os.getpid()
+
+
+def _fail(value):
+    if value == 2:
+        raise ValueError('task {} failed'.format(value))
+    return value
+
+
+def _fail_or_sleep(value):
+    if value == 0:
+        raise ValueError('task failed')
+    time.sleep(1)
+    return value
+
+
+def _kill_worker(value):
+    if value == 0:
+        os.kill(os.getpid(), signal.SIGKILL)
+    return value
+
+
+def _hang(value):
+    if value == 0:
+        time.sleep(60)
+    return value
+
+
+def _count_rows(df):
+    return len(df.index), os.getpid()
+
+
+def _on_lost(args, reason):
+    return reason
+
+
+@pytest.fixture(autouse=True)
+def fast_task_checks(monkeypatch):
+    # the parent checks the running tasks more often, so lost tasks are noticed quickly
+    monkeypatch.setattr(wp, 'TASK_CHECK_INTERVAL', 0.1)
+
+
+def test_assets_are_resolved_in_the_workers():
+    with wp.WorkerPool(2, assets={'offset': 10}) as pool:
+        assert pool.starmap(_add_offset, [(i, pool.ref('offset')) for i in range(5)]) == [10, 11, 12, 13, 14]
+
+
+def test_unknown_asset():
+    with pytest.raises(KeyError):
+        wp.WorkerPool(1).ref('offset')
+
+
+def test_workers_are_recycled():
+    with wp.WorkerPool(2, max_tasks_per_child=1) as pool:
+        results = pool.starmap(_get_pid, [(i,) for i in range(6)])
+    assert [value for value, _ in results] == list(range(6))
+    assert len({pid for _, pid in results}) > 2
+
+
+def test_exception_in_task():
+    with wp.WorkerPool(2) as pool:
+        with pytest.raises(ValueError, match='task 2 failed'):
+            pool.starmap(_fail, [(i,) for i in range(6)])
+        # the pool can still be used after the error
+        assert pool.starmap(_fail, [(0,), (1,)]) == [0, 1]
+
+
+def test_running_tasks_are_finished_before_an_error_is_raised():
+    with wp.WorkerPool(2) as pool:
+        start = time.monotonic()
+        with pytest.raises(ValueError):
+            pool.starmap(_fail_or_sleep, [(i,) for i in range(6)])
+        # the task that was running is waited for, the other tasks are not started
+        assert 0.9 < time.monotonic() - start < 2.5
+
+
+@pytest.mark.skipif(not hasattr(signal, 'SIGKILL'), reason='needs SIGKILL')
+def test_killed_worker():
+    with wp.WorkerPool(2) as pool:
+        results = sorted(pool.imap_unordered(_kill_worker, [(i,) for i in range(4)], on_lost=_on_lost), key=str)
+        assert results == [1, 2, 3, 'worker died']
+        with pytest.raises(wp.TaskLost, match='worker died'):
+            list(pool.imap_unordered(_kill_worker, [(0,)]))
+
+
+def test_hung_task_is_given_up_after_its_deadline():
+    start = time.monotonic()
+    with wp.WorkerPool(2) as pool:
+        results = sorted(pool.imap_unordered(_hang, [(i,) for i in range(4)], deadline=1, on_lost=_on_lost), key=str)
+        assert results == [1, 2, 3, 'timeout']
+        assert pool.apply(_hang, (0,), deadline=1, on_lost=_on_lost) == 'timeout'
+    assert time.monotonic() - start < 30
+
+
+def test_small_dataframe_runs_in_process():
+    pool = wp.WorkerPool(2, in_process_max_rows=5)
+    assert pool.map_partitions(_count_rows, pd.DataFrame({'a': range(3)})) == [(3, os.getpid())]
+
+
+def test_large_dataframe_runs_in_the_workers():
+    with wp.WorkerPool(2, in_process_max_rows=5) as pool:
+        results = pool.map_partitions(_count_rows, pd.DataFrame({'a': range(10)}))
+    assert [rows for rows, _ in results] == [5, 5]
+    assert os.getpid() not in [pid for _, pid in results]